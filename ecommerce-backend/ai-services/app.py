@@ -1,12 +1,16 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
+from functools import wraps
+import hmac
 import os
+import json
 from dotenv import load_dotenv
 
 from services.recommendation_service import RecommendationService
 from services.fraud_service import FraudService
 from services.nlp_service import NLPService
 from services.content_generation_service import ContentGenerationService
+from config.database import get_recent_search_queries
 
 load_dotenv()
 
@@ -19,9 +23,43 @@ fraud_service = FraudService()
 nlp_service = NLPService()
 content_service = ContentGenerationService()
 
+def require_service_token(view):
+    """
+    Only let internal services (the Node backend, workers) call a route
+    Callers send the shared AI_SERVICE_TOKEN in the X-Service-Token header;
+    without a configured token the route is refused rather than left open
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        expected = os.getenv('AI_SERVICE_TOKEN')
+        if not expected:
+            return jsonify({'success': False, 'error': 'Service token not configured'}), 503
+
+        token = request.headers.get('X-Service-Token', '')
+        if not hmac.compare_digest(token.encode(), expected.encode()):
+            return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+        return view(*args, **kwargs)
+
+    return wrapper
+
+def init_worker():
+    """
+    Per-process setup for pre-fork servers (see gunicorn.conf.py): services
+    are built once in the master, but SQLite handles and snapshot state must
+    not cross a fork
+    """
+    content_service.cache.reopen()
+    nlp_service.sentiment_cache.reopen()
+    fraud_service.ring_index.after_fork()
+    nlp_service.suggestions.after_fork()
+
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'healthy', 'service': 'AI Services'}), 200
+    return jsonify({
+        'status': 'healthy',
+        'service': 'AI Services',
+        'nlp_models': nlp_service.memory_report()
+    }), 200
 
 # Recommendation endpoints
 @app.route('/api/ai/recommendations/user/', methods=['GET'])
@@ -61,6 +99,25 @@ def check_fraud():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/ai/fraud/check-batch', methods=['POST'])
+def check_fraud_batch():
+    try:
+        data = request.json
+        transactions = data.get('transactions', [])
+        results = fraud_service.check_transactions_batch(transactions)
+        return jsonify({'success': True, 'data': results}), 200
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/ai/fraud/events/order-created', methods=['POST'])
+def fraud_order_created():
+    try:
+        data = request.json
+        fraud_service.record_order_event(data)
+        return jsonify({'success': True}), 200
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 # NLP endpoints
 @app.route('/api/ai/nlp/search', methods=['POST'])
 def nlp_search():
@@ -72,6 +129,45 @@ def nlp_search():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/ai/nlp/search/cache', methods=['GET'])
+def nlp_search_cache_stats():
+    return jsonify({'success': True, 'data': nlp_service.search_cache.stats()}), 200
+
+@app.route('/api/ai/nlp/search/cache/warm', methods=['POST'])
+def warm_nlp_search_cache():
+    try:
+        data = request.json or {}
+        queries = get_recent_search_queries(data.get('limit', 1000), data.get('days', 7))
+        warmed = nlp_service.warm_search_cache(query for query, _ in queries)
+        return jsonify({
+            'success': True,
+            'data': {'warmed': warmed, 'cache': nlp_service.search_cache.stats()}
+        }), 200
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/ai/nlp/suggestions', methods=['GET'])
+def search_suggestions():
+    try:
+        query = request.args.get('q', '')
+        limit = request.args.get('limit', 5, type=int)
+        suggestions = nlp_service.generate_search_suggestions(query, limit)
+        return jsonify({'success': True, 'data': suggestions}), 200
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/ai/nlp/suggestions/record', methods=['POST'])
+@require_service_token
+def record_search_suggestion():
+    try:
+        data = request.json
+        nlp_service.record_search(data.get('query', ''), data.get('weight', 1.0))
+        return jsonify({'success': True}), 200
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/ai/nlp/sentiment', methods=['POST'])
 def analyze_sentiment():
     try:
@@ -82,6 +178,30 @@ def analyze_sentiment():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/ai/nlp/sentiment/batch', methods=['POST'])
+def analyze_sentiment_batch():
+    try:
+        data = request.json
+        if 'reviews' in data:
+            # [{'id', 'text'}, ...] -> per-review sentiment plus a summary
+            result = nlp_service.analyze_review_batch(data['reviews'])
+        else:
+            result = nlp_service.analyze_sentiment_batch(data.get('texts', []))
+        return jsonify({'success': True, 'data': result}), 200
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/ai/nlp/sentiment/stats', methods=['GET'])
+def sentiment_batcher_stats():
+    batcher = nlp_service.sentiment_batcher
+    return jsonify({
+        'success': True,
+        'data': {
+            'batcher': batcher.stats() if batcher else None,
+            'cache': nlp_service.sentiment_cache.stats()
+        }
+    }), 200
+
 # Content generation endpoints
 @app.route('/api/ai/content/generate-description', methods=['POST'])
 def generate_description():
@@ -92,6 +212,28 @@ def generate_description():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/ai/content/generate-description/stream', methods=['POST'])
+def stream_description():
+    """
+    Server-Sent Events: 'token' events carry {'text'} as the description is
+    written, then one 'done' (or 'error') event with the full description
+    and word_count
+    """
+    data = request.json or {}
+    
+    def events():
+        for event, payload in content_service.stream_product_description(data):
+            if event == 'token':
+                payload = {'text': payload}
+            yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+    
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        # Keep proxies (nginx) from buffering the stream until it ends
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/api/ai/content/generate-tags', methods=['POST'])
 def generate_tags():
     try:
@@ -101,6 +243,39 @@ def generate_tags():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/ai/content/generate-tags/batch', methods=['POST'])
+def generate_tags_batch():
+    try:
+        products = (request.json or {}).get('products', [])
+        tags = content_service.generate_product_tags_batch(products)
+        return jsonify({'success': True, 'data': tags}), 200
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/ai/content/generate-seo-titles/batch', methods=['POST'])
+def generate_seo_titles_batch():
+    try:
+        products = (request.json or {}).get('products', [])
+        titles = content_service.generate_seo_titles_batch(products)
+        return jsonify({'success': True, 'data': titles}), 200
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/ai/content/providers', methods=['GET'])
+def content_provider_stats():
+    return jsonify({'success': True, 'data': content_service.router.stats()}), 200
+
+@app.route('/api/ai/content/cache', methods=['GET'])
+def content_cache_stats():
+    single_flight = content_service.single_flight
+    return jsonify({
+        'success': True,
+        'data': {
+            **content_service.cache.stats(),
+            'single_flight': dict(single_flight.stats) if single_flight else None
+        }
+    }), 200
+
 if __name__ == '__main__':
     port = int(os.getenv('AI_SERVICE_PORT', 5001))
     app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
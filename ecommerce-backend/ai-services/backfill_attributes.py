@@ -0,0 +1,106 @@
+"""
+Product attribute backfill
+
+Streams active product descriptions from Postgres, extracts attributes with
+NLPService.extract_product_attributes_bulk (nlp.pipe across processes) and
+writes them back in batches under products.attributes->'extracted'.
+
+Usage: python backfill_attributes.py [all]
+    all: re-extract every product, not only those without extracted attributes
+"""
+import json
+import os
+import resource
+import sys
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from psycopg2.extras import execute_values
+
+from config.database import get_db_connection
+from services.nlp_service import NLPService
+
+# Rows fetched from the server-side cursor and written back per transaction
+CHUNK_SIZE = int(os.getenv('ATTRIBUTE_BACKFILL_CHUNK_SIZE', 2000))
+
+def stream_descriptions(conn, only_missing=True):
+    """Yield (product_id, description) through a server-side cursor"""
+    cursor = conn.cursor(name='attribute_backfill_products')
+    cursor.itersize = CHUNK_SIZE
+
+    cursor.execute(f"""
+        SELECT id, COALESCE(description, '')
+        FROM products
+        WHERE is_active = true
+        {"AND (attributes IS NULL OR NOT attributes ? 'extracted')" if only_missing else ''}
+        ORDER BY id
+    """)
+
+    try:
+        for product_id, description in cursor:
+            yield str(product_id), description
+    finally:
+        cursor.close()
+
+def write_batch(conn, batch):
+    """Merge extracted attributes into products.attributes in one statement"""
+    cursor = conn.cursor()
+    execute_values(cursor, """
+        UPDATE products p
+        SET attributes = COALESCE(p.attributes, '{}'::jsonb) || jsonb_build_object('extracted', v.extracted::jsonb)
+        FROM (VALUES %s) AS v(id, extracted)
+        WHERE p.id = v.id::uuid
+    """, [(product_id, json.dumps(attributes)) for product_id, attributes in batch], page_size=CHUNK_SIZE)
+    conn.commit()
+    cursor.close()
+
+def backfill(only_missing=True):
+    print("=" * 60)
+    print("Product Attribute Backfill")
+    print("=" * 60)
+
+    nlp_service = NLPService(preload=['nlp'])
+    print(f"nlp.pipe batch size {nlp_service.pipe_batch_size}, {nlp_service.pipe_processes} processes")
+
+    read_conn = get_db_connection()
+    write_conn = get_db_connection()
+
+    started = time.perf_counter()
+    last_report = started
+    processed = 0
+    batch = []
+
+    try:
+        results = nlp_service.extract_product_attributes_bulk(
+            stream_descriptions(read_conn, only_missing)
+        )
+        for product_id, attributes in results:
+            batch.append((product_id, attributes))
+            if len(batch) >= CHUNK_SIZE:
+                write_batch(write_conn, batch)
+                processed += len(batch)
+                batch = []
+
+            if time.perf_counter() - last_report > 30:
+                elapsed = time.perf_counter() - started
+                print(f"  {processed} products written, {processed / elapsed:.0f} docs/s")
+                last_report = time.perf_counter()
+
+        if batch:
+            write_batch(write_conn, batch)
+            processed += len(batch)
+    finally:
+        read_conn.close()
+        write_conn.close()
+
+    elapsed = time.perf_counter() - started
+    # ru_maxrss is reported in KB on Linux
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"✓ Backfilled {processed} products in {elapsed:.1f}s "
+          f"({processed / elapsed if elapsed else 0:.0f} docs/s), peak memory {peak_mb:.0f} MB")
+
+if __name__ == '__main__':
+    backfill(only_missing='all' not in sys.argv[1:])
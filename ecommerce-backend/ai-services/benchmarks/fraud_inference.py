@@ -0,0 +1,79 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.fraud_detection_model import FraudDetectionModel
+import numpy as np
+import time
+
+def make_synthetic_transactions(n_samples, seed=42):
+    """Synthetic feature rows shaped like FraudService._build_features output"""
+    rng = np.random.default_rng(seed)
+    amount = rng.lognormal(7, 1.2, n_samples)
+    num_items = rng.integers(1, 8, n_samples)
+    features = np.column_stack([
+        amount,
+        num_items,
+        amount / num_items,
+        rng.integers(0, 2000, n_samples),
+        rng.poisson(4, n_samples),
+        rng.exponential(300, n_samples),
+        rng.integers(0, 24, n_samples),
+        rng.integers(0, 7, n_samples)
+    ])
+    labels = (rng.random(n_samples) < 0.03).astype(int)
+    return features, labels
+
+def time_per_call(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+def check_parity(model, features):
+    """Compare the compiled forests against sklearn on the same rows"""
+    compiled_scores, compiled_proba = model.compiled_forest.predict(features)
+
+    features_scaled = model.scaler.transform(features)
+    sklearn_scores = model.isolation_forest.score_samples(features_scaled)
+    sklearn_proba = model.random_forest.predict_proba(features_scaled)[:, 1]
+
+    score_error = np.abs(compiled_scores - sklearn_scores).max()
+    proba_error = np.abs(compiled_proba - sklearn_proba).max()
+    print(f"Max |score_samples| error:   {score_error:.2e}")
+    print(f"Max |predict_proba| error:   {proba_error:.2e}")
+
+    assert score_error < 1e-9 and proba_error < 1e-9, "compiled forest diverges from sklearn"
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Fraud Inference Benchmark")
+    print("=" * 60)
+
+    features, labels = make_synthetic_transactions(20000)
+
+    model = FraudDetectionModel()
+    model.train_isolation_forest(features)
+    model.train_supervised(features, labels)
+    model.compile()
+
+    check_parity(model, features[:5000])
+
+    row = list(features[0])
+    batch = features[:1000]
+
+    compiled = model.compiled_forest
+    model.compiled_forest = None
+    sklearn_single = time_per_call(lambda: model.predict_fraud_probability(row), 200)
+    sklearn_batch = time_per_call(lambda: model.predict_batch(batch), 5)
+
+    model.compiled_forest = compiled
+    compiled_single = time_per_call(lambda: model.predict_fraud_probability(row), 2000)
+    compiled_batch = time_per_call(lambda: model.predict_batch(batch), 20)
+    explained_single = time_per_call(lambda: model.predict_with_explanation(row), 2000)
+
+    print(f"\nSingle row  sklearn:  {sklearn_single * 1e6:9.1f} µs")
+    print(f"Single row  compiled: {compiled_single * 1e6:9.1f} µs")
+    print(f"Single row  explained:{explained_single * 1e6:9.1f} µs")
+    print(f"1000 rows   sklearn:  {sklearn_batch * 1e3:9.2f} ms")
+    print(f"1000 rows   compiled: {compiled_batch * 1e3:9.2f} ms")
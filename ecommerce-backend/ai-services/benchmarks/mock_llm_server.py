@@ -0,0 +1,179 @@
+"""
+Local stand-in for the OpenAI and Anthropic APIs
+
+Serves POST /v1/chat/completions and POST /v1/messages with canned text
+after a configurable delay, and can fail a fraction of requests with 429 or
+500 to exercise retries. Requests with "stream": true get Server-Sent
+Events in each provider's format: the first token arrives after a fifth of
+the latency and the rest are spread over the remainder. GET /stats returns
+request counts.
+
+Packed prompts (one JSON product per line, asking for a JSON object) get a
+JSON answer keyed by product id; drop_rate leaves that fraction of ids out.
+
+Point the service at it with
+    OPENAI_BASE_URL=http://localhost:8090/v1 ANTHROPIC_BASE_URL=http://localhost:8090
+
+Usage: python benchmarks/mock_llm_server.py [port] [latency_ms] [error_rate]
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import sys
+import threading
+import time
+
+WORDS = (
+    'durable lightweight premium everyday comfortable versatile stylish reliable '
+    'modern classic breathable compact ergonomic elegant practical'
+).split()
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    latency_ms = 200
+    error_rate = 0.0
+    drop_rate = 0.0
+    counts = {'requests': 0, 'errors': 0}
+    counts_lock = threading.Lock()
+
+    def do_GET(self):
+        if self.path == '/stats':
+            with self.counts_lock:
+                self._send_json(200, dict(self.counts))
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+
+        with self.counts_lock:
+            self.counts['requests'] += 1
+
+        latency = self.latency_ms / 1000 * random.uniform(0.5, 1.5)
+        streaming = bool(body.get('stream'))
+        time.sleep(latency / 5 if streaming else latency)
+
+        if random.random() < self.error_rate:
+            with self.counts_lock:
+                self.counts['errors'] += 1
+            status = random.choice([429, 500])
+            self._send_json(status, {'error': {'type': 'mock_error', 'message': f'mock {status}'}})
+            return
+
+        text = self.completion_text(body)
+
+        if streaming:
+            self._stream(body, text, latency * 4 / 5)
+            return
+
+        if self.path.endswith('/chat/completions'):
+            self._send_json(200, {
+                'id': 'mock', 'object': 'chat.completion', 'created': int(time.time()),
+                'model': body.get('model', 'mock'),
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': text}}],
+                'usage': {'prompt_tokens': 0, 'completion_tokens': len(text.split()), 'total_tokens': 0}
+            })
+        elif self.path.endswith('/messages'):
+            self._send_json(200, {
+                'id': 'mock', 'type': 'message', 'role': 'assistant',
+                'model': body.get('model', 'mock'), 'stop_reason': 'end_turn', 'stop_sequence': None,
+                'content': [{'type': 'text', 'text': text}],
+                'usage': {'input_tokens': 0, 'output_tokens': len(text.split())}
+            })
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    @staticmethod
+    def completion_text(body):
+        prompt = body['messages'][-1]['content']
+        rng = random.Random(prompt)
+        if 'Return only a JSON object' in prompt:
+            ids = [json.loads(line)['id'] for line in prompt.splitlines() if line.startswith('{"id"')]
+            answers = {}
+            for product_id in ids:
+                if random.random() < MockLLMHandler.drop_rate:
+                    continue
+                if 'list of tags' in prompt:
+                    answers[product_id] = rng.sample(WORDS, 10)
+                else:
+                    answers[product_id] = ' '.join(rng.sample(WORDS, 6)).title()
+            return json.dumps(answers)
+        if 'comma-separated' in prompt:
+            return ', '.join(rng.sample(WORDS, 10))
+        return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(20, 40)))
+
+    def _stream(self, body, text, duration):
+        words = text.split(' ')
+        delay = duration / max(1, len(words))
+        chat = self.path.endswith('/chat/completions')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+
+        if not chat:
+            self._send_event('message_start', {'type': 'message_start', 'message': {
+                'id': 'mock', 'type': 'message', 'role': 'assistant', 'content': [],
+                'model': body.get('model', 'mock'), 'stop_reason': None, 'stop_sequence': None,
+                'usage': {'input_tokens': 0, 'output_tokens': 0}
+            }})
+            self._send_event('content_block_start', {
+                'type': 'content_block_start', 'index': 0, 'content_block': {'type': 'text', 'text': ''}
+            })
+
+        for i, word in enumerate(words):
+            piece = word if i == 0 else ' ' + word
+            if chat:
+                self._send_event(None, {
+                    'id': 'mock', 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                    'model': body.get('model', 'mock'),
+                    'choices': [{'index': 0, 'delta': {'content': piece}, 'finish_reason': None}]
+                })
+            else:
+                self._send_event('content_block_delta', {
+                    'type': 'content_block_delta', 'index': 0,
+                    'delta': {'type': 'text_delta', 'text': piece}
+                })
+            time.sleep(delay)
+
+        if chat:
+            self.wfile.write(b'data: [DONE]\n\n')
+        else:
+            self._send_event('content_block_stop', {'type': 'content_block_stop', 'index': 0})
+            self._send_event('message_delta', {
+                'type': 'message_delta', 'delta': {'stop_reason': 'end_turn', 'stop_sequence': None},
+                'usage': {'output_tokens': len(words)}
+            })
+            self._send_event('message_stop', {'type': 'message_stop'})
+        self.wfile.flush()
+
+    def _send_event(self, event, payload):
+        prefix = f'event: {event}\n' if event else ''
+        self.wfile.write(f'{prefix}data: {json.dumps(payload)}\n\n'.encode('utf-8'))
+        self.wfile.flush()
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(port=8090, latency_ms=200, error_rate=0.0):
+    MockLLMHandler.latency_ms = latency_ms
+    MockLLMHandler.error_rate = error_rate
+    server = ThreadingHTTPServer(('127.0.0.1', port), MockLLMHandler)
+    print(f"Mock LLM server on http://127.0.0.1:{port} ({latency_ms} ms, {error_rate:.0%} errors)")
+    server.serve_forever()
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    serve(
+        port=int(args[0]) if len(args) > 0 else 8090,
+        latency_ms=float(args[1]) if len(args) > 1 else 200,
+        error_rate=float(args[2]) if len(args) > 2 else 0.0
+    )
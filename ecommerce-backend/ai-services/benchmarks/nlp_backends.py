@@ -0,0 +1,82 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Measure the model, not the sentiment cache
+os.environ['NLP_SENTIMENT_CACHE'] = 'off'
+
+from benchmarks.sentiment_batch import make_reviews
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import numpy as np
+import resource
+import time
+
+BACKENDS = ['pytorch', 'quantized', 'onnx']
+
+def run_backend(backend, texts):
+    """Score texts on one backend; runs in a fresh process so memory is its own"""
+    from services.nlp_service import NLPService
+
+    service = NLPService(preload=['sentiment'], inference_backend=backend)
+    stats = service.load_stats['sentiment']
+
+    service.sentiment_analyzer(texts[0])
+    start = time.perf_counter()
+    for text in texts[:200]:
+        service.sentiment_analyzer(text)
+    single_ms = (time.perf_counter() - start) / min(200, len(texts)) * 1000
+
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    results = service.analyze_sentiment_batch(texts)
+    batch_seconds = time.perf_counter() - start
+    cpu_ms = (time.process_time() - cpu_start) / len(texts) * 1000
+
+    return {
+        'backend': stats.get('backend'),
+        'labels': [result['label'] for result in results],
+        'positive_scores': [
+            result['score'] if result['label'] == 'positive' else 1 - result['score']
+            for result in results
+        ],
+        'single_ms': single_ms,
+        'texts_per_second': len(texts) / batch_seconds,
+        'cpu_ms_per_text': cpu_ms,
+        'load_seconds': stats['load_seconds'],
+        # ru_maxrss is reported in KB on Linux
+        'peak_memory_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("NLP Inference Backend Benchmark")
+    print("=" * 60)
+
+    texts = make_reviews(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
+    context = multiprocessing.get_context('spawn')
+
+    runs = {}
+    for backend in BACKENDS:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            try:
+                runs[backend] = pool.submit(run_backend, backend, texts).result()
+            except Exception as e:
+                print(f"{backend}: failed ({e})")
+
+    if 'pytorch' not in runs:
+        sys.exit("fp32 reference run failed, nothing to compare against")
+
+    reference = runs['pytorch']
+    print(f"\n{'backend':<11}{'loaded as':<11}{'single':>10}{'batched':>14}{'cpu/text':>11}"
+          f"{'peak RSS':>10}{'agree':>9}{'max Δp':>9}")
+    for backend, run in runs.items():
+        agreement = np.mean(np.array(run['labels']) == np.array(reference['labels']))
+        score_error = np.abs(np.array(run['positive_scores']) - np.array(reference['positive_scores'])).max()
+        print(f"{backend:<11}{run['backend']:<11}{run['single_ms']:8.1f}ms"
+              f"{run['texts_per_second']:9.1f} txt/s{run['cpu_ms_per_text']:9.2f}ms"
+              f"{run['peak_memory_mb']:8.0f}MB{agreement:9.2%}{score_error:9.4f}")
+
+    for backend, run in runs.items():
+        agreement = np.mean(np.array(run['labels']) == np.array(reference['labels']))
+        if agreement < 0.99:
+            print(f"\nWARNING: {backend} agrees with fp32 on only {agreement:.2%} of labels")
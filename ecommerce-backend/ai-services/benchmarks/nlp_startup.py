@@ -0,0 +1,34 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.nlp_service import NLPService
+import time
+
+def time_first_call(label, fn):
+    start = time.perf_counter()
+    fn()
+    print(f"{label:<28}{(time.perf_counter() - start) * 1e3:10.1f} ms")
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("NLP Startup Benchmark")
+    print("=" * 60)
+
+    start = time.perf_counter()
+    service = NLPService(preload=[])
+    print(f"{'NLPService()':<28}{(time.perf_counter() - start) * 1e3:10.1f} ms")
+
+    time_first_call('first search suggestions', lambda: service.generate_search_suggestions('shoes'))
+    time_first_call('first attribute extraction', lambda: service.extract_product_attributes(
+        'Lightweight running shoe with breathable mesh, 280 g'
+    ))
+    time_first_call('first sentiment', lambda: service.analyze_sentiment('Great fit, fast delivery'))
+    time_first_call('first search query', lambda: service.process_search_query('red shoes under 2000'))
+    time_first_call('second search query', lambda: service.process_search_query('blue jeans under 1500'))
+
+    report = service.memory_report()
+    print(f"\nLoaded models: {', '.join(report['loaded'])}")
+    for name, stats in report['models'].items():
+        print(f"  {name:<10} {stats['load_seconds']:6.2f}s  +{stats['peak_memory_growth_mb']:.0f} MB peak")
+    print(f"Peak memory: {report['peak_memory_mb']:.0f} MB")
@@ -0,0 +1,86 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Measure the model, not the sentiment cache
+os.environ['NLP_SENTIMENT_CACHE'] = 'off'
+
+from services.nlp_service import NLPService
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import random
+import time
+
+PHRASES = [
+    'Great quality, exactly as described.',
+    'Stopped working after two days, very disappointed.',
+    'Fits well and the fabric feels premium.',
+    'Delivery was late and the box was damaged.',
+    'Decent for the price but the color is duller than in the photos.',
+    'Absolutely love it, bought a second one for my sister.',
+    'The battery barely lasts half a day, would not recommend.',
+    'Comfortable, lightweight and easy to clean.'
+]
+
+def make_reviews(n_reviews, seed=42):
+    """Synthetic reviews of 1-12 phrases, so lengths vary like real ones"""
+    rng = random.Random(seed)
+    return [
+        ' '.join(rng.choice(PHRASES) for _ in range(rng.randint(1, 12)))
+        for _ in range(n_reviews)
+    ]
+
+def pipeline_sentiment(service, text):
+    """One uncoalesced pipeline call, as analyze_sentiment used to do"""
+    result = service.sentiment_analyzer(text)[0]
+    return {'label': result['label'].lower(), 'score': float(result['score']), 'text': text}
+
+def concurrent_requests(fn, texts, n_threads):
+    """Call fn(text) from n_threads at once; returns (texts/s, p50 ms, p99 ms)"""
+    def timed(text):
+        start = time.perf_counter()
+        fn(text)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(n_threads) as pool:
+        latencies = np.array(list(pool.map(timed, texts))) * 1000
+    elapsed = time.perf_counter() - start
+    return len(texts) / elapsed, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Sentiment Batch Benchmark")
+    print("=" * 60)
+
+    n_reviews = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    texts = make_reviews(n_reviews)
+
+    service = NLPService(preload=['sentiment'])
+    pipeline_sentiment(service, texts[0])
+
+    start = time.perf_counter()
+    looped = [pipeline_sentiment(service, text) for text in texts]
+    loop_seconds = time.perf_counter() - start
+
+    timings = {}
+    for batch_size in (8, 32, 64):
+        start = time.perf_counter()
+        batched = service.analyze_sentiment_batch(texts, batch_size=batch_size)
+        timings[batch_size] = time.perf_counter() - start
+
+    mismatches = sum(a['label'] != b['label'] for a, b in zip(looped, batched))
+    max_score_error = max(abs(a['score'] - b['score']) for a, b in zip(looped, batched))
+
+    print(f"\n{n_reviews} reviews")
+    print(f"Per-review loop:       {n_reviews / loop_seconds:8.1f} reviews/s")
+    for batch_size, seconds in timings.items():
+        print(f"Batched (size {batch_size:>3}):   {n_reviews / seconds:8.1f} reviews/s  "
+              f"({loop_seconds / seconds:.1f}x)")
+    print(f"\nLabel mismatches: {mismatches}, max score difference: {max_score_error:.2e}")
+
+    print("\nConcurrent single-text requests (32 threads)")
+    rate, p50, p99 = concurrent_requests(lambda text: pipeline_sentiment(service, text), texts, 32)
+    print(f"Uncoalesced:  {rate:8.1f} texts/s  p50 {p50:7.1f} ms  p99 {p99:7.1f} ms")
+    rate, p50, p99 = concurrent_requests(service.analyze_sentiment, texts, 32)
+    print(f"Coalesced:    {rate:8.1f} texts/s  p50 {p50:7.1f} ms  p99 {p99:7.1f} ms")
+    print(f"Batcher: {service.sentiment_batcher.stats()}")
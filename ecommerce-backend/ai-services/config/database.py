@@ -23,4 +23,31 @@ def get_redis_connection():
         port=int(os.getenv('REDIS_PORT', 6379)),
         db=0,
         decode_responses=True
-    )
\ No newline at end of file
+    )
+
+def get_recent_search_queries(limit=10000, days=30):
+    """
+    Most frequent search queries of the last `days` days, as (query, count)
+    Read from the search log index the Node backend writes to Elasticsearch
+    """
+    import requests
+
+    index = f"{os.getenv('ELASTICSEARCH_INDEX_PREFIX', 'ecommerce_')}search_queries"
+    auth = None
+    if os.getenv('ELASTICSEARCH_USERNAME') and os.getenv('ELASTICSEARCH_PASSWORD'):
+        auth = (os.getenv('ELASTICSEARCH_USERNAME'), os.getenv('ELASTICSEARCH_PASSWORD'))
+
+    response = requests.post(
+        f"{os.getenv('ELASTICSEARCH_NODE', 'http://localhost:9200')}/{index}/_search",
+        json={
+            'size': 0,
+            'query': {'range': {'timestamp': {'gte': f'now-{days}d'}}},
+            'aggs': {'queries': {'terms': {'field': 'query.keyword', 'size': limit}}}
+        },
+        auth=auth,
+        timeout=30
+    )
+    response.raise_for_status()
+
+    buckets = response.json()['aggregations']['queries']['buckets']
+    return [(bucket['key'], bucket['doc_count']) for bucket in buckets]
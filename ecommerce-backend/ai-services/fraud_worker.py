@@ -0,0 +1,197 @@
+"""
+Asynchronous fraud screening worker
+
+Consumes order events from a Redis Stream consumer group, scores them in
+micro-batches through FraudService, writes decisions to a results stream and
+acknowledges them. Run as many copies as needed; Redis spreads the events
+across the consumers of the group.
+
+Producers add one entry per order with a JSON payload, e.g.
+    XADD fraud:orders * payload '{"order_id": "...", "user_id": "...", "amount": 1999}'
+
+Usage: python fraud_worker.py
+"""
+import json
+import os
+import signal
+import socket
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from config.database import get_redis_connection
+from services.fraud_service import FraudService
+
+STREAM = os.getenv('FRAUD_STREAM', 'fraud:orders')
+RESULTS_STREAM = os.getenv('FRAUD_RESULTS_STREAM', 'fraud:results')
+DEAD_LETTER_STREAM = os.getenv('FRAUD_DEAD_LETTER_STREAM', 'fraud:orders:dead')
+GROUP = os.getenv('FRAUD_CONSUMER_GROUP', 'fraud-workers')
+
+BATCH_SIZE = int(os.getenv('FRAUD_WORKER_BATCH_SIZE', 256))
+BLOCK_MS = int(os.getenv('FRAUD_WORKER_BLOCK_MS', 1000))
+# Stop reading new events while this many of ours are still unacknowledged
+MAX_PENDING = int(os.getenv('FRAUD_WORKER_MAX_PENDING', 2000))
+# Events delivered this many times without success go to the dead-letter stream
+MAX_DELIVERIES = int(os.getenv('FRAUD_WORKER_MAX_DELIVERIES', 5))
+# Events unacknowledged for this long are reclaimed from crashed consumers
+RECLAIM_IDLE_MS = int(os.getenv('FRAUD_WORKER_RECLAIM_IDLE_MS', 60000))
+RESULTS_MAXLEN = int(os.getenv('FRAUD_RESULTS_MAXLEN', 1000000))
+
+class FraudStreamWorker:
+    def __init__(self, fraud_service=None, redis_client=None, consumer=None):
+        self.redis = redis_client or get_redis_connection()
+        self.fraud_service = fraud_service or FraudService()
+        self.consumer = consumer or f'{socket.gethostname()}-{os.getpid()}'
+        self.running = False
+
+        self.stats = {'batches': 0, 'scored': 0, 'retried': 0, 'dead_lettered': 0}
+
+    def ensure_group(self):
+        """Create the consumer group (and stream) if they don't exist yet"""
+        try:
+            self.redis.xgroup_create(STREAM, GROUP, id='0', mkstream=True)
+        except Exception as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    def run(self):
+        """Consume until SIGINT/SIGTERM, finishing the batch in progress"""
+        self.ensure_group()
+        self.running = True
+
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        print(f"Fraud worker {self.consumer} consuming {STREAM} as group {GROUP}")
+        last_reclaim = 0.0
+        last_report = time.monotonic()
+
+        while self.running:
+            try:
+                if time.monotonic() - last_reclaim > RECLAIM_IDLE_MS / 1000:
+                    self.reclaim_stale()
+                    last_reclaim = time.monotonic()
+
+                if self._pending_count() >= MAX_PENDING:
+                    # Back-pressure: leave new events in the stream until our
+                    # retries drain, instead of piling up unacknowledged work
+                    time.sleep(BLOCK_MS / 1000)
+                    continue
+
+                entries = self.redis.xreadgroup(
+                    GROUP, self.consumer, {STREAM: '>'}, count=BATCH_SIZE, block=BLOCK_MS
+                )
+                if entries:
+                    self.process(entries[0][1])
+            except Exception as e:
+                # Unacknowledged events stay pending and are retried later
+                print(f"Error in fraud worker loop: {e}")
+                time.sleep(1)
+
+            if time.monotonic() - last_report > 60:
+                self._report()
+                last_report = time.monotonic()
+
+        print(f"Fraud worker {self.consumer} stopped")
+        self._report()
+
+    def process(self, messages):
+        """Score one micro-batch of (message_id, fields) and ack the successes"""
+        ids = []
+        transactions = []
+
+        for message_id, fields in messages:
+            try:
+                transactions.append(json.loads(fields['payload']))
+                ids.append(message_id)
+            except Exception as e:
+                # Malformed events will never succeed, don't retry them
+                self._dead_letter(message_id, fields, f'invalid payload: {e}')
+
+        if not transactions:
+            return
+
+        results = self.fraud_service.check_transactions_batch(transactions, record=True)
+
+        pipe = self.redis.pipeline()
+        acked = []
+        for message_id, result in zip(ids, results):
+            if 'error' in result:
+                # Left pending; redelivered by reclaim_stale until MAX_DELIVERIES
+                self.stats['retried'] += 1
+                continue
+            pipe.xadd(
+                RESULTS_STREAM,
+                {'order_id': str(result.get('order_id')), 'result': json.dumps(result, default=str)},
+                maxlen=RESULTS_MAXLEN,
+                approximate=True
+            )
+            acked.append(message_id)
+
+        if acked:
+            # Results and acks commit together, so a crash can't lose a decision
+            pipe.xack(STREAM, GROUP, *acked)
+            pipe.execute()
+
+        self.stats['batches'] += 1
+        self.stats['scored'] += len(acked)
+
+    def reclaim_stale(self):
+        """Retry events left pending by failures or crashed consumers"""
+        pending = self.redis.xpending_range(
+            STREAM, GROUP, min='-', max='+', count=BATCH_SIZE, idle=RECLAIM_IDLE_MS
+        )
+        if not pending:
+            return
+
+        retry_ids = []
+        for entry in pending:
+            if entry['times_delivered'] >= MAX_DELIVERIES:
+                fields = self.redis.xrange(STREAM, entry['message_id'], entry['message_id'])
+                self._dead_letter(
+                    entry['message_id'],
+                    fields[0][1] if fields else {},
+                    f"failed after {entry['times_delivered']} deliveries"
+                )
+            else:
+                retry_ids.append(entry['message_id'])
+
+        if retry_ids:
+            messages = self.redis.xclaim(STREAM, GROUP, self.consumer, RECLAIM_IDLE_MS, retry_ids)
+            # Entries trimmed from the stream come back without fields
+            messages = [(message_id, fields) for message_id, fields in messages if fields]
+            if messages:
+                self.process(messages)
+
+    def _dead_letter(self, message_id, fields, reason):
+        pipe = self.redis.pipeline()
+        pipe.xadd(DEAD_LETTER_STREAM, {**fields, 'source_id': message_id, 'reason': reason})
+        pipe.xack(STREAM, GROUP, message_id)
+        pipe.execute()
+        self.stats['dead_lettered'] += 1
+        print(f"Dead-lettered fraud event {message_id}: {reason}")
+
+    def _pending_count(self):
+        summary = self.redis.xpending(STREAM, GROUP)
+        for consumer in summary.get('consumers') or []:
+            if consumer['name'] == self.consumer:
+                return int(consumer['pending'])
+        return 0
+
+    def _report(self):
+        lag = None
+        try:
+            for group in self.redis.xinfo_groups(STREAM):
+                if group['name'] == GROUP:
+                    lag = group.get('lag')
+        except Exception:
+            pass
+        print(f"Fraud worker stats: {self.stats}, group lag: {lag}")
+
+    def _stop(self, signum, frame):
+        self.running = False
+
+if __name__ == '__main__':
+    FraudStreamWorker().run()
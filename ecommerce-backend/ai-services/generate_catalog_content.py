@@ -0,0 +1,258 @@
+"""
+Bulk catalog content generation
+
+Fills in missing product descriptions and tags through ContentGenerationService,
+many products at a time. Calls run on a bounded thread pool and every
+provider call goes through the service's per-provider token bucket and
+backoff-with-jitter retries, so concurrency is limited by the provider's
+rate limit rather than by per-call latency.
+
+Finished products are written back in batches and then appended to a
+checkpoint file; a rerun skips every product already in it, so an
+interrupted job resumes where it stopped.
+
+Usage:
+    python generate_catalog_content.py [--limit N]
+        reads active products missing a description or tags from Postgres
+    python generate_catalog_content.py --input products.json --output results.jsonl
+        reads a JSON list of products and writes results as JSON lines
+
+Point OPENAI_BASE_URL / ANTHROPIC_BASE_URL at benchmarks/mock_llm_server.py
+to run the whole job locally.
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from config.database import get_db_connection
+from services.content_generation_service import ContentGenerationService
+
+WORKERS = int(os.getenv('CONTENT_BULK_WORKERS', 32))
+# Products written back (and checkpointed) per transaction
+WRITE_BATCH_SIZE = int(os.getenv('CONTENT_BULK_WRITE_BATCH', 200))
+CHECKPOINT_PATH = os.getenv('CONTENT_BULK_CHECKPOINT', 'models/saved_models/content_bulk_checkpoint.jsonl')
+
+class BulkContentJob:
+    def __init__(self, write_batch, content_service=None, workers=None,
+                 checkpoint_path=None, write_batch_size=None):
+        """
+        write_batch(results) persists a list of {'id', 'description', 'tags', ...};
+        it must be idempotent, since a crash between writing and checkpointing
+        replays the batch on the next run
+        """
+        self.write_batch = write_batch
+        self.content_service = content_service or ContentGenerationService()
+        self.workers = workers or WORKERS
+        self.checkpoint_path = checkpoint_path or CHECKPOINT_PATH
+        self.write_batch_size = write_batch_size or WRITE_BATCH_SIZE
+
+        self.stats = {'generated': 0, 'failed': 0, 'skipped': 0, 'written': 0}
+        self._pending = []
+
+    def load_checkpoint(self):
+        """Ids of products already written by earlier runs"""
+        done = set()
+        if not os.path.exists(self.checkpoint_path):
+            return done
+
+        with open(self.checkpoint_path) as f:
+            for line in f:
+                try:
+                    done.add(json.loads(line)['id'])
+                except (ValueError, KeyError):
+                    # A line cut short by a crash; that batch is regenerated
+                    continue
+        return done
+
+    def run(self, products):
+        """Generate content for an iterable of product dicts (each with an 'id')"""
+        done = self.load_checkpoint()
+        started = time.perf_counter()
+        last_report = started
+
+        # Bounded in-flight work, so a 50k product stream isn't queued up front
+        max_in_flight = self.workers * 2
+        in_flight = set()
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='content-bulk') as executor:
+            for product in products:
+                product_id = str(product['id'])
+                if product_id in done:
+                    self.stats['skipped'] += 1
+                    continue
+
+                if len(in_flight) >= max_in_flight:
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    self._collect(finished)
+
+                in_flight.add(executor.submit(self._generate_one, product))
+
+                if time.perf_counter() - last_report > 30:
+                    self._report(started)
+                    last_report = time.perf_counter()
+
+            finished, _ = wait(in_flight)
+            self._collect(finished)
+
+        self._flush()
+        self._report(started)
+        return self.stats
+
+    def _generate_one(self, product):
+        product_id = str(product['id'])
+        fields = product.get('missing_fields') or ('description', 'tags')
+        try:
+            result = self.content_service.generate_listing_content(product, fields=fields)
+            return {'id': product_id, **result}
+        except Exception as e:
+            print(f"Error generating content for product {product_id}: {e}")
+            return {'id': product_id, 'error': str(e)}
+
+    def _collect(self, futures):
+        for future in futures:
+            result = future.result()
+            if 'error' in result:
+                # Not checkpointed, so the next run tries it again
+                self.stats['failed'] += 1
+                continue
+
+            self.stats['generated'] += 1
+            self._pending.append(result)
+            if len(self._pending) >= self.write_batch_size:
+                self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, []
+        self.write_batch(batch)
+
+        # Checkpoint only after the write succeeded
+        os.makedirs(os.path.dirname(self.checkpoint_path) or '.', exist_ok=True)
+        with open(self.checkpoint_path, 'a') as f:
+            f.write(''.join(json.dumps({'id': result['id']}) + '\n' for result in batch))
+            f.flush()
+            os.fsync(f.fileno())
+        self.stats['written'] += len(batch)
+
+    def _report(self, started):
+        elapsed = time.perf_counter() - started
+        finished = self.stats['generated'] + self.stats['failed']
+        print(f"  {self.stats}, {finished / elapsed if elapsed else 0:.2f} products/s, "
+              f"provider calls: {self.content_service.call_stats}")
+
+def stream_products(conn, limit=None):
+    """Yield active products missing a description or tags, in the generator's input shape"""
+    cursor = conn.cursor(name='content_bulk_products')
+    cursor.itersize = 2000
+
+    cursor.execute(f"""
+        SELECT p.id, p.name, p.description, p.brand, p.attributes, p.tags, c.name
+        FROM products p
+        LEFT JOIN categories c ON c.id = p.category_id
+        WHERE p.is_active = true
+        AND (COALESCE(p.description, '') = '' OR COALESCE(cardinality(p.tags), 0) = 0)
+        ORDER BY p.id
+        {'LIMIT %s' if limit else ''}
+    """, (limit,) if limit else None)
+
+    try:
+        for product_id, name, description, brand, attributes, tags, category in cursor:
+            attributes = attributes or {}
+            missing = []
+            if not description:
+                missing.append('description')
+            if not tags:
+                missing.append('tags')
+
+            yield {
+                'id': str(product_id),
+                'name': name,
+                'description': description or '',
+                'brand': brand or '',
+                'category': category or '',
+                'key_features': attributes.get('features') or [],
+                'specifications': {
+                    key: value for key, value in attributes.items()
+                    if key not in ('features', 'extracted') and not isinstance(value, (dict, list))
+                },
+                'missing_fields': missing
+            }
+    finally:
+        cursor.close()
+
+def make_db_writer(conn):
+    """Batched write-back that only fills fields that are still empty"""
+    from psycopg2.extras import execute_values
+
+    def write_batch(batch):
+        cursor = conn.cursor()
+        execute_values(cursor, """
+            UPDATE products p
+            SET description = COALESCE(NULLIF(p.description, ''), v.description),
+                tags = CASE WHEN COALESCE(cardinality(p.tags), 0) = 0 THEN v.tags ELSE p.tags END
+            FROM (VALUES %s) AS v(id, description, tags)
+            WHERE p.id = v.id::uuid
+        """, [
+            (result['id'], result.get('description'), result.get('tags') or [])
+            for result in batch
+        ], template='(%s, %s, %s::varchar[])', page_size=len(batch))
+        conn.commit()
+        cursor.close()
+
+    return write_batch
+
+def make_file_writer(path):
+    def write_batch(batch):
+        with open(path, 'a') as f:
+            f.write(''.join(json.dumps(result) + '\n' for result in batch))
+
+    return write_batch
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate missing product descriptions and tags')
+    parser.add_argument('--input', help='JSON list of products instead of the database')
+    parser.add_argument('--output', default='content_results.jsonl', help='results file for --input')
+    parser.add_argument('--limit', type=int, help='stop after this many products')
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--checkpoint', default=CHECKPOINT_PATH)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Bulk Catalog Content Generation")
+    print("=" * 60)
+
+    conn = write_conn = None
+    if args.input:
+        with open(args.input) as f:
+            products = json.load(f)[:args.limit]
+        write_batch = make_file_writer(args.output)
+    else:
+        conn = get_db_connection()
+        products = stream_products(conn, args.limit)
+        write_conn = get_db_connection()
+        write_batch = make_db_writer(write_conn)
+
+    job = BulkContentJob(write_batch, workers=args.workers, checkpoint_path=args.checkpoint)
+    print(f"{job.workers} workers, write batch {job.write_batch_size}, checkpoint {job.checkpoint_path}")
+
+    started = time.perf_counter()
+    try:
+        stats = job.run(products)
+    finally:
+        for connection in (conn, write_conn):
+            if connection is not None:
+                connection.close()
+
+    print(f"✓ {stats['written']} products written, {stats['failed']} failed, "
+          f"{stats['skipped']} already done, in {time.perf_counter() - started:.1f}s")
+
+if __name__ == '__main__':
+    main()
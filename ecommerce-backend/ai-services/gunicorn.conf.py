@@ -0,0 +1,102 @@
+"""
+Production serving for the AI services
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The app is imported once in the master (preload_app), which loads the
+recommendation and fraud models and, through NLP_PRELOAD, the spaCy and
+transformer models. Workers are then forked from it and share those pages
+copy-on-write instead of each loading its own copy. gc.freeze() keeps the
+collector from touching (and so copying) the inherited objects.
+
+Each worker serves requests on a few threads (LLM calls and SSE streams
+mostly wait on the network), while numeric libraries are capped to a few
+threads per worker so workers x BLAS threads doesn't oversubscribe the CPU.
+
+SIGTERM stops accepting connections and gives in-flight requests
+graceful_timeout seconds to finish before workers are killed.
+
+Fraud state must be the same in every worker. With more than one worker,
+startup fails unless velocity and user features are on Redis
+(FRAUD_VELOCITY_BACKEND=redis, FRAUD_FEATURE_STORE=redis). The fraud ring
+index has no shared backend, so more than one worker always needs
+AI_SERVICE_ALLOW_LOCAL_STATE=true, accepting that each worker only links
+the orders it serves. A single worker (the default) scales with threads.
+"""
+import gc
+import os
+import sys
+
+# Must be set before numpy / torch are imported, i.e. before the app loads
+THREADS_PER_WORKER = int(os.getenv('AI_SERVICE_BLAS_THREADS', 1))
+for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS',
+            'NUMEXPR_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS'):
+    os.environ.setdefault(var, str(THREADS_PER_WORKER))
+# The Rust tokenizers' thread pool doesn't survive fork
+os.environ.setdefault('TOKENIZERS_PARALLELISM', 'false')
+# Load every NLP model in the master; lazily loaded models would be per worker
+os.environ.setdefault('NLP_PRELOAD', 'nlp,sentiment,zero_shot')
+
+bind = f"0.0.0.0:{os.getenv('AI_SERVICE_PORT', 5001)}"
+# One worker unless per-worker fraud state is accepted (see on_starting)
+workers = int(os.getenv('AI_SERVICE_WORKERS', 1))
+worker_class = 'gthread'
+threads = int(os.getenv('AI_SERVICE_THREADS', 4))
+preload_app = True
+
+timeout = int(os.getenv('AI_SERVICE_TIMEOUT', 120))
+graceful_timeout = int(os.getenv('AI_SERVICE_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+# Recycle workers to bound slow memory growth; new ones fork from the
+# already loaded master, so this is cheap. 0 disables it
+max_requests = int(os.getenv('AI_SERVICE_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+accesslog = '-'
+errorlog = '-'
+
+def on_starting(server):
+    # The app is already loaded (preload_app), so the backends it actually
+    # got, after any fallback from Redis to memory, can be checked here
+    if workers < 2:
+        return
+
+    from app import fraud_service, nlp_service
+
+    local = [name for name, backend in (
+        ('fraud velocity (FRAUD_VELOCITY_BACKEND)', fraud_service.velocity.backend),
+        ('fraud user features (FRAUD_FEATURE_STORE)', fraud_service.feature_store.backend)
+    ) if backend != 'redis']
+    # No shared backend exists for the ring index
+    local.append('fraud ring index')
+
+    message = (f"{', '.join(local)} would be kept per worker: with {workers} workers, a fraud "
+               f"check would only see the orders served by the same worker")
+    if os.getenv('AI_SERVICE_ALLOW_LOCAL_STATE', 'false').lower() != 'true':
+        server.log.error(f"{message}. Run AI_SERVICE_WORKERS=1, or set "
+                         f"AI_SERVICE_ALLOW_LOCAL_STATE=true to accept it")
+        sys.exit(1)
+    server.log.warning(message)
+
+    if nlp_service.search_cache.backend != 'redis':
+        server.log.warning("NLP_SEARCH_CACHE is per worker; set it to redis to share cached searches")
+    server.log.warning("The search suggestion index is per worker: recorded searches only rank "
+                       "in the worker that recorded them")
+
+def when_ready(server):
+    # Everything allocated so far (models, indexes) is shared with the
+    # workers; move it out of the collector's reach so collections in the
+    # workers don't write to those pages
+    gc.collect()
+    gc.freeze()
+    server.log.info(f"Models loaded, forking {workers} workers x {threads} threads "
+                    f"({THREADS_PER_WORKER} BLAS threads each)")
+
+def post_fork(server, worker):
+    torch = sys.modules.get('torch')
+    if torch is not None:
+        torch.set_num_threads(THREADS_PER_WORKER)
+
+    from app import init_worker
+    init_worker()
@@ -0,0 +1,254 @@
+import numpy as np
+
+def _average_path_length(n_samples):
+    """Average path length of an unsuccessful BST search (same as sklearn's IsolationForest)"""
+    n_samples = np.asarray(n_samples, dtype=np.float64)
+    result = np.zeros_like(n_samples)
+    result[n_samples == 2] = 1.0
+    mask = n_samples > 2
+    result[mask] = (
+        2.0 * (np.log(n_samples[mask] - 1.0) + np.euler_gamma)
+        - 2.0 * (n_samples[mask] - 1.0) / n_samples[mask]
+    )
+    return result
+
+class CompiledFraudForest:
+    """
+    Flattened IsolationForest + RandomForestClassifier for fast inference
+
+    Every tree of both forests is stored in one set of contiguous node arrays
+    (feature, threshold, children, value). Leaves point to themselves, so all
+    trees are traversed together for all rows with a fixed number of
+    vectorized steps and no per-call sklearn validation.
+
+    value holds, per node, the expected isolation path length
+    (depth + c(n_samples)) for isolation trees and the fraud class probability
+    for random forest trees. Leaf values give the prediction; the change in
+    value along each edge gives path-based (Saabas-style) feature
+    contributions from the same traversal.
+    """
+
+    def __init__(self, feature, threshold, children, value, roots, n_isolation_trees,
+                 max_depth, mean, scale, path_length_norm, offset):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.value = value
+        self.roots = roots
+        self.n_isolation_trees = n_isolation_trees
+        self.max_depth = max_depth
+        self.mean = mean
+        self.scale = scale
+        self.path_length_norm = path_length_norm
+        self.offset = offset
+
+        # Interleaved copies of the node arrays so the traversal indexes
+        # them directly by child slot without extra arithmetic
+        self._child_slots = (2 * children).ravel()
+        self._slot_feature = np.repeat(feature, 2)
+        self._slot_threshold = np.repeat(threshold, 2)
+
+        # Value change along each edge; leaf self-loops contribute nothing
+        is_leaf = children[:, 0] == np.arange(len(children))
+        self._edge_delta = (value[children] - value[:, None]).ravel()
+        self._edge_delta[np.repeat(is_leaf, 2)] = 0.0
+
+    @classmethod
+    def from_model(cls, isolation_forest, random_forest, scaler):
+        """Flatten fitted sklearn forests (random_forest may be None)"""
+        features, thresholds, children, values, roots, depths = [], [], [], [], [], []
+        n_nodes = 0
+        n_features = isolation_forest.n_features_in_
+
+        def add_tree(tree, node_values, node_depth, feature_map):
+            nonlocal n_nodes
+            is_leaf = tree.children_left == -1
+            ids = np.arange(tree.node_count)
+
+            feature = np.where(is_leaf, 0, tree.feature)
+            if feature_map is not None:
+                feature = np.asarray(feature_map)[feature]
+
+            left = np.where(is_leaf, ids, tree.children_left) + n_nodes
+            right = np.where(is_leaf, ids, tree.children_right) + n_nodes
+
+            features.append(feature)
+            thresholds.append(np.where(is_leaf, 0.0, tree.threshold))
+            children.append(np.column_stack([left, right]))
+            values.append(node_values)
+            roots.append(n_nodes)
+            depths.append(node_depth.max())
+            n_nodes += tree.node_count
+
+        for estimator, feature_map in zip(isolation_forest.estimators_, isolation_forest.estimators_features_):
+            tree = estimator.tree_
+            node_depth = cls._node_depths(tree)
+            path_length = node_depth + _average_path_length(tree.n_node_samples)
+            # Trees only see a feature subset when max_features < n_features
+            subsampled = len(feature_map) != n_features
+            add_tree(tree, path_length, node_depth, feature_map if subsampled else None)
+
+        n_isolation_trees = len(roots)
+
+        if random_forest is not None:
+            fraud_class = list(random_forest.classes_).index(1)
+            for estimator in random_forest.estimators_:
+                tree = estimator.tree_
+                node_value = tree.value[:, 0, :]
+                proba = node_value[:, fraud_class] / node_value.sum(axis=1)
+                add_tree(tree, proba, cls._node_depths(tree), None)
+
+        return cls(
+            feature=np.concatenate(features).astype(np.intp),
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            children=np.concatenate(children).astype(np.intp),
+            value=np.concatenate(values).astype(np.float64),
+            roots=np.asarray(roots, dtype=np.intp),
+            n_isolation_trees=n_isolation_trees,
+            max_depth=int(max(depths)),
+            mean=np.asarray(scaler.mean_, dtype=np.float64),
+            scale=np.asarray(scaler.scale_, dtype=np.float64),
+            path_length_norm=float(_average_path_length([isolation_forest.max_samples_])[0]),
+            offset=float(isolation_forest.offset_)
+        )
+
+    @staticmethod
+    def _node_depths(tree):
+        depth = np.zeros(tree.node_count, dtype=np.int64)
+        # Children always have larger ids than their parent
+        for node in range(tree.node_count):
+            if tree.children_left[node] != -1:
+                depth[tree.children_left[node]] = depth[node] + 1
+                depth[tree.children_right[node]] = depth[node] + 1
+        return depth
+
+    def leaves(self, features_2d, return_edges=False):
+        """
+        Return the leaf node reached in every tree, shape (n_samples, n_trees)
+        With return_edges, also return the edge slots taken at each depth,
+        which contributions() turns into per-feature attributions
+        """
+        X = np.asarray(features_2d, dtype=np.float64)
+        # sklearn trees compare float32 inputs against float64 thresholds
+        X = ((X - self.mean) / self.scale).astype(np.float32)
+        n_samples, n_features = X.shape
+
+        # Slots are 2 * node; slot + 1 selects the right child
+        slots = self._child_slots
+        feature = self._slot_feature
+        threshold = self._slot_threshold
+        values = X.ravel()
+        edges = []
+
+        if n_samples == 1:
+            slot = 2 * self.roots
+            for _ in range(self.max_depth):
+                edge = slot + (values.take(feature.take(slot)) > threshold.take(slot))
+                if return_edges:
+                    edges.append(edge)
+                slot = slots.take(edge)
+        else:
+            offsets = (np.arange(n_samples) * n_features)[:, None]
+            slot = np.tile(2 * self.roots, (n_samples, 1))
+            for _ in range(self.max_depth):
+                go_right = values.take(feature.take(slot) + offsets) > threshold.take(slot)
+                edge = slot + go_right
+                if return_edges:
+                    edges.append(edge)
+                slot = slots.take(edge)
+
+        nodes = (slot // 2).reshape(n_samples, -1)
+        if return_edges:
+            return nodes, np.stack(edges).reshape(self.max_depth, n_samples, -1)
+        return nodes
+
+    def predict(self, features_2d, return_edges=False):
+        """
+        Score rows with both forests
+        Returns: (anomaly_scores, rf_proba) matching IsolationForest.score_samples
+        and RandomForestClassifier.predict_proba[:, 1]; rf_proba is None
+        when no supervised model was compiled. With return_edges, the traversal
+        edges are appended for contributions().
+        """
+        if return_edges:
+            nodes, edges = self.leaves(features_2d, return_edges=True)
+        else:
+            nodes = self.leaves(features_2d)
+        leaf_values = self.value[nodes]
+
+        path_lengths = leaf_values[:, :self.n_isolation_trees].sum(axis=1)
+        anomaly_scores = -(2.0 ** (-path_lengths / (self.n_isolation_trees * self.path_length_norm)))
+
+        rf_proba = None
+        if len(self.roots) > self.n_isolation_trees:
+            rf_proba = leaf_values[:, self.n_isolation_trees:].mean(axis=1)
+
+        if return_edges:
+            return anomaly_scores, rf_proba, edges
+        return anomaly_scores, rf_proba
+
+    def contributions(self, edges):
+        """
+        Decompose fraud probability into per-feature contributions
+        edges: traversal edges from predict(..., return_edges=True)
+        Returns: (baseline, contributions) where baseline + contributions.sum(axis=1)
+        equals the fraud probability of FraudDetectionModel for each row
+        """
+        n_samples = edges.shape[1]
+        n_features = len(self.mean)
+        n_if = self.n_isolation_trees
+        index = self._slot_feature.take(edges) + (np.arange(n_samples) * n_features)[:, None]
+        delta = self._edge_delta.take(edges)
+
+        def accumulate(trees):
+            return np.bincount(
+                index[:, :, trees].ravel(),
+                weights=delta[:, :, trees].ravel(),
+                minlength=n_samples * n_features
+            ).reshape(n_samples, n_features)
+
+        # Isolation trees: split path-length changes, then rescale so the
+        # shares add up to the exact change in the (non-linear) probability
+        path_contributions = accumulate(slice(0, n_if))
+        root_path_length = self.value[self.roots[:n_if]].sum()
+        path_length = root_path_length + path_contributions.sum(axis=1)
+
+        def isolation_probability(total_path_length):
+            score = -(2.0 ** (-total_path_length / (n_if * self.path_length_norm)))
+            return 1 / (1 + np.exp(score))
+
+        baseline = isolation_probability(root_path_length)
+        change = isolation_probability(path_length) - baseline
+        total = path_contributions.sum(axis=1, keepdims=True)
+        share = np.divide(path_contributions, total, out=np.zeros_like(path_contributions), where=total != 0)
+        contributions = share * change[:, None]
+
+        if len(self.roots) > n_if:
+            n_rf = len(self.roots) - n_if
+            rf_contributions = accumulate(slice(n_if, None)) / n_rf
+            rf_baseline = self.value[self.roots[n_if:]].mean()
+            baseline = (baseline + rf_baseline) / 2
+            contributions = (contributions + rf_contributions) / 2
+
+        return float(baseline), contributions
+
+    def save(self, filepath):
+        """Save node arrays as a single .npz file"""
+        np.savez(
+            filepath,
+            feature=self.feature, threshold=self.threshold, children=self.children,
+            value=self.value, roots=self.roots, mean=self.mean, scale=self.scale,
+            meta=np.array([self.n_isolation_trees, self.max_depth, self.path_length_norm, self.offset])
+        )
+
+    @classmethod
+    def load(cls, filepath):
+        """Load node arrays written by save"""
+        data = np.load(filepath)
+        n_isolation_trees, max_depth, path_length_norm, offset = data['meta']
+        return cls(
+            feature=data['feature'], threshold=data['threshold'], children=data['children'],
+            value=data['value'], roots=data['roots'], n_isolation_trees=int(n_isolation_trees),
+            max_depth=int(max_depth), mean=data['mean'], scale=data['scale'],
+            path_length_norm=float(path_length_norm), offset=float(offset)
+        )
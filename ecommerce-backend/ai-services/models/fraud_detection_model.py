@@ -3,58 +3,83 @@ import pandas as pd
 from sklearn.ensemble import IsolationForest, RandomForestClassifier
 from sklearn.preprocessing import StandardScaler
 import pickle
+import time
 import os
 
+from models.compiled_forest import CompiledFraudForest
+
+# Optional sliding-window velocity features (see services/velocity_engine.py),
+# used when the training frame carries them
+VELOCITY_FEATURE_COLUMNS = [
+    'user_count_1h', 'user_count_24h', 'user_amount_24h',
+    'payment_count_24h', 'address_count_24h'
+]
+
+RISK_LEVELS = ['low', 'medium', 'high']
+
 class FraudDetectionModel:
     def __init__(self):
         self.isolation_forest = None
         self.random_forest = None
         self.scaler = StandardScaler()
         self.feature_columns = []
+        self.compiled_forest = None
+        self._feature_importances = None
         
-    def prepare_features(self, transactions_df):
+    def prepare_features(self, transactions_df, dtype=np.float32):
         """
         Extract features from transaction data
         Expected columns: order_id, user_id, amount, num_items, shipping_address, 
                          payment_method, user_age_days, previous_orders, time_since_last_order
+        Optional columns: any of VELOCITY_FEATURE_COLUMNS
+        The input frame is not modified
         """
-        features = []
+        velocity_columns = [
+            column for column in VELOCITY_FEATURE_COLUMNS
+            if column in transactions_df.columns
+        ]
+        
+        self.feature_columns = [
+            'amount', 'num_items', 'avg_item_price', 'user_age_days',
+            'previous_orders', 'time_since_last_order', 'hour', 'day_of_week'
+        ] + velocity_columns
+        
+        feature_matrix = np.empty((len(transactions_df), len(self.feature_columns)), dtype=dtype)
         
         # Transaction amount features
-        features.append(transactions_df['amount'])
-        features.append(transactions_df['num_items'])
-        features.append(transactions_df['amount'] / transactions_df['num_items'])  # avg item price
+        amount = transactions_df['amount'].to_numpy(dtype=np.float64)
+        num_items = transactions_df['num_items'].to_numpy(dtype=np.float64)
+        feature_matrix[:, 0] = amount
+        feature_matrix[:, 1] = num_items
+        feature_matrix[:, 2] = amount / num_items  # avg item price
         
         # User behavior features
-        features.append(transactions_df['user_age_days'])
-        features.append(transactions_df['previous_orders'])
-        features.append(transactions_df['time_since_last_order'])
+        feature_matrix[:, 3] = transactions_df['user_age_days'].to_numpy()
+        feature_matrix[:, 4] = transactions_df['previous_orders'].to_numpy()
+        feature_matrix[:, 5] = transactions_df['time_since_last_order'].to_numpy()
         
         # Time-based features
-        transactions_df['hour'] = pd.to_datetime(transactions_df['timestamp']).dt.hour
-        transactions_df['day_of_week'] = pd.to_datetime(transactions_df['timestamp']).dt.dayofweek
-        features.append(transactions_df['hour'])
-        features.append(transactions_df['day_of_week'])
-        
-        # Combine features
-        feature_matrix = np.column_stack(features)
+        timestamps = pd.to_datetime(transactions_df['timestamp'])
+        feature_matrix[:, 6] = timestamps.dt.hour.to_numpy()
+        feature_matrix[:, 7] = timestamps.dt.dayofweek.to_numpy()
         
-        self.feature_columns = [
-            'amount', 'num_items', 'avg_item_price', 'user_age_days',
-            'previous_orders', 'time_since_last_order', 'hour', 'day_of_week'
-        ]
+        # Velocity features
+        for i, column in enumerate(velocity_columns, start=8):
+            feature_matrix[:, i] = transactions_df[column].to_numpy()
         
         return feature_matrix
     
-    def train_isolation_forest(self, features, contamination=0.01):
+    def train_isolation_forest(self, features, contamination=0.01, n_jobs=None):
         """
         Train Isolation Forest for anomaly detection
         contamination: expected proportion of outliers
+        n_jobs: cores used for fitting (-1 for all)
         """
         self.isolation_forest = IsolationForest(
             contamination=contamination,
             random_state=42,
-            n_estimators=100
+            n_estimators=100,
+            n_jobs=n_jobs
         )
         
         # Normalize features
@@ -62,18 +87,23 @@ class FraudDetectionModel:
         
         # Train
         self.isolation_forest.fit(features_scaled)
+        self.compiled_forest = None
         
         return self.isolation_forest
     
-    def train_supervised(self, features, labels):
+    def train_supervised(self, features, labels, n_jobs=None, max_samples=None):
         """
         Train supervised model (Random Forest) with labeled fraud data
+        n_jobs: cores used for fitting (-1 for all)
+        max_samples: rows (int) or fraction (float) bootstrapped per tree
         """
         self.random_forest = RandomForestClassifier(
             n_estimators=100,
             max_depth=10,
             random_state=42,
-            class_weight='balanced'
+            class_weight='balanced',
+            n_jobs=n_jobs,
+            max_samples=max_samples
         )
         
         # Normalize features
@@ -81,6 +111,8 @@ class FraudDetectionModel:
         
         # Train
         self.random_forest.fit(features_scaled, labels)
+        self.compiled_forest = None
+        self._feature_importances = None
         
         return self.random_forest
     
@@ -89,23 +121,78 @@ class FraudDetectionModel:
         Predict fraud probability for a transaction
         Returns: fraud_score (0-1), is_anomaly (bool), risk_level (low/medium/high)
         """
-        features_scaled = self.scaler.transform([transaction_features])
+        anomaly_scores, fraud_probability = self._score([transaction_features])
+        
+        return self._prediction_dict(anomaly_scores[0], fraud_probability[0])
+    
+    def predict_with_explanation(self, transaction_features, min_risk='low', deadline=None):
+        """
+        Predict and explain a transaction from a single tree traversal
+        Per-transaction path contributions are computed only when the risk level
+        is at least min_risk and the time.perf_counter() deadline, if any, has
+        not passed; otherwise the global importances of explain_prediction are used
+        Returns: (prediction, explanation)
+        """
+        if self.compiled_forest is None:
+            return (
+                self.predict_fraud_probability(transaction_features),
+                self.explain_prediction(transaction_features)
+            )
         
-        # Isolation Forest prediction (-1 for anomaly, 1 for normal)
-        if_prediction = self.isolation_forest.predict(features_scaled)[0]
-        is_anomaly = if_prediction == -1
+        anomaly_scores, fraud_probability, edges = self._score([transaction_features], return_edges=True)
+        prediction = self._prediction_dict(anomaly_scores[0], fraud_probability[0])
         
-        # Anomaly score (lower = more anomalous)
-        anomaly_score = self.isolation_forest.score_samples(features_scaled)[0]
+        below_min_risk = RISK_LEVELS.index(prediction['risk_level']) < RISK_LEVELS.index(min_risk)
+        over_budget = deadline is not None and time.perf_counter() > deadline
+        if below_min_risk or over_budget:
+            return prediction, self.explain_prediction(transaction_features)
         
-        # Convert to probability (0-1 scale)
-        # Anomaly scores are typically negative, normalize to 0-1
-        fraud_probability = 1 / (1 + np.exp(anomaly_score))
+        baseline, contributions = self.compiled_forest.contributions(edges)
         
-        # If supervised model exists, combine predictions
-        if self.random_forest is not None:
-            rf_proba = self.random_forest.predict_proba(features_scaled)[0][1]
-            fraud_probability = (fraud_probability + rf_proba) / 2
+        return prediction, self._local_explanation(baseline, contributions[0])
+    
+    def predict_batch(self, features_2d, explain_min_risk=None):
+        """
+        Predict fraud probability for many transactions at once
+        features_2d: (n_samples, n_features) matrix, one row per transaction
+        explain_min_risk: if set, add per-row path contributions under
+                          'explanations' (None for rows below that risk level)
+        Returns: dict of arrays keyed like predict_fraud_probability
+        """
+        explain = explain_min_risk is not None and self.compiled_forest is not None
+        
+        if explain:
+            anomaly_scores, fraud_probability, edges = self._score(features_2d, return_edges=True)
+        else:
+            anomaly_scores, fraud_probability = self._score(features_2d)
+        
+        # Determine risk level
+        risk_level = np.where(
+            fraud_probability >= 0.7, 'high',
+            np.where(fraud_probability >= 0.4, 'medium', 'low')
+        )
+        
+        result = {
+            'fraud_probability': fraud_probability,
+            'is_anomaly': anomaly_scores < self.isolation_forest.offset_,
+            'risk_level': risk_level,
+            'anomaly_score': anomaly_scores
+        }
+        
+        if explain:
+            baseline, contributions = self.compiled_forest.contributions(edges)
+            min_rank = RISK_LEVELS.index(explain_min_risk)
+            result['explanations'] = [
+                self._local_explanation(baseline, row_contributions)
+                if RISK_LEVELS.index(level) >= min_rank else None
+                for level, row_contributions in zip(risk_level, contributions)
+            ]
+        
+        return result
+    
+    def _prediction_dict(self, anomaly_score, fraud_probability):
+        anomaly_score = float(anomaly_score)
+        fraud_probability = float(fraud_probability)
         
         # Determine risk level
         if fraud_probability >= 0.7:
@@ -116,12 +203,81 @@ class FraudDetectionModel:
             risk_level = 'low'
         
         return {
-            'fraud_probability': float(fraud_probability),
-            'is_anomaly': bool(is_anomaly),
+            'fraud_probability': fraud_probability,
+            'is_anomaly': bool(anomaly_score < self.isolation_forest.offset_),
             'risk_level': risk_level,
-            'anomaly_score': float(anomaly_score)
+            'anomaly_score': anomaly_score
+        }
+    
+    def _local_explanation(self, baseline, contributions):
+        """
+        Top features pushing this transaction towards fraud, and separately
+        the top ones pushing it away
+        """
+        def factors(order, sign):
+            return [
+                {
+                    'feature': self.feature_columns[i] if i < len(self.feature_columns) else f'feature_{i}',
+                    'contribution': float(contributions[i])
+                }
+                for i in order[:5]
+                if sign * contributions[i] > 0
+            ]
+        
+        order = np.argsort(-contributions)
+        
+        return {
+            'method': 'path_contributions',
+            'baseline': baseline,
+            'top_risk_factors': factors(order, 1),
+            'mitigating_factors': factors(order[::-1], -1)
         }
     
+    def _score(self, features_2d, return_edges=False):
+        """
+        Return (anomaly_scores, fraud_probability) arrays for a feature matrix
+        return_edges (compiled forest only) appends the traversal edges
+        """
+        edges = None
+        if self.compiled_forest is not None:
+            # Flattened trees: one traversal for both forests, scaling included
+            if return_edges:
+                anomaly_scores, rf_proba, edges = self.compiled_forest.predict(features_2d, return_edges=True)
+            else:
+                anomaly_scores, rf_proba = self.compiled_forest.predict(features_2d)
+        else:
+            features_scaled = self.scaler.transform(np.asarray(features_2d, dtype=np.float64))
+            
+            # predict() is score_samples() compared against the fitted offset,
+            # so callers derive is_anomaly from these scores instead
+            anomaly_scores = self.isolation_forest.score_samples(features_scaled)
+            
+            rf_proba = None
+            if self.random_forest is not None:
+                rf_proba = self.random_forest.predict_proba(features_scaled)[:, 1]
+        
+        # Convert to probability (0-1 scale)
+        # Anomaly scores are typically negative, normalize to 0-1
+        fraud_probability = 1 / (1 + np.exp(anomaly_scores))
+        
+        # If supervised model exists, combine predictions
+        if rf_proba is not None:
+            fraud_probability = (fraud_probability + rf_proba) / 2
+        
+        if return_edges:
+            return anomaly_scores, fraud_probability, edges
+        return anomaly_scores, fraud_probability
+    
+    def compile(self):
+        """
+        Flatten the trained forests into NumPy node arrays for fast inference
+        Call again after retraining; load_model does this automatically.
+        """
+        self.compiled_forest = CompiledFraudForest.from_model(
+            self.isolation_forest, self.random_forest, self.scaler
+        )
+        return self.compiled_forest
+    
     def explain_prediction(self, transaction_features):
         """
         Provide explanation for fraud prediction
@@ -129,10 +285,11 @@ class FraudDetectionModel:
         if self.random_forest is None:
             return {}
         
-        features_scaled = self.scaler.transform([transaction_features])
-        
-        # Get feature importance
-        feature_importance = self.random_forest.feature_importances_
+        # Get feature importance (sklearn recomputes it over all trees on
+        # every access, so keep it until the forest changes)
+        if self._feature_importances is None:
+            self._feature_importances = self.random_forest.feature_importances_
+        feature_importance = self._feature_importances
         
         # Get top contributing features
         importance_dict = {
@@ -147,6 +304,7 @@ class FraudDetectionModel:
         )[:5]
         
         return {
+            'method': 'global_importance',
             'top_risk_factors': [
                 {'feature': feature, 'importance': float(importance)}
                 for feature, importance in sorted_features
@@ -174,4 +332,7 @@ class FraudDetectionModel:
         self.isolation_forest = model_data['isolation_forest']
         self.random_forest = model_data.get('random_forest')
         self.scaler = model_data['scaler']
-        self.feature_columns = model_data['feature_columns']
\ No newline at end of file
+        self.feature_columns = model_data['feature_columns']
+        self._feature_importances = None
+        
+        self.compile()
\ No newline at end of file
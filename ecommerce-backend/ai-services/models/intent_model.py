@@ -0,0 +1,133 @@
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.utils import murmurhash3_32
+import pickle
+import re
+import os
+
+INTENT_LABELS = ['search', 'compare', 'recommend', 'filter', 'sort']
+
+# Tier 1: unambiguous phrasings, checked in order (first match wins)
+INTENT_RULES = [
+    ('compare', re.compile(
+        r'\b(?:vs\.?|versus|compare[ds]?|comparison|difference between|better than|which is better)\b'
+    )),
+    ('sort', re.compile(
+        r'\b(?:sort(?:ed)? by|order by|cheapest|lowest price|highest price|low to high|high to low|'
+        r'newest|latest|most popular|top rated|highest rated|best selling)\b'
+    )),
+    ('recommend', re.compile(
+        r'\b(?:recommend\w*|suggest\w*|best|gift (?:for|ideas?)|ideas for|should i (?:buy|get)|good for)\b'
+    )),
+    ('filter', re.compile(
+        r'\b(?:under|below|less than|above|over|more than|between|within) (?:rs\.? ?|₹ ?)?\d+'
+    ))
+]
+
+RULE_CONFIDENCE = 0.95
+
+class IntentModel:
+    """
+    Tiered search intent classifier
+
+    Keyword rules answer the unambiguous queries, a hashed n-gram logistic
+    regression (distilled offline from zero-shot labels, see train.py)
+    answers the rest. predict() reports its confidence so callers can fall
+    back to a heavier model when it is low.
+    """
+
+    def __init__(self):
+        # Stateless, so the same vectorizer works for training and serving
+        self.vectorizer = HashingVectorizer(
+            analyzer='char_wb',
+            ngram_range=(2, 4),
+            n_features=2 ** 18,
+            alternate_sign=False
+        )
+        self._analyzer = self.vectorizer.build_analyzer()
+        self._n_features = self.vectorizer.n_features
+        self.classifier = None
+        self.labels = list(INTENT_LABELS)
+        self._coef = None
+        self._intercept = None
+
+    def match_rules(self, query):
+        """Return the intent of the first matching rule, or None"""
+        text = query.lower()
+        for label, pattern in INTENT_RULES:
+            if pattern.search(text):
+                return label
+        return None
+
+    def train(self, queries, labels):
+        """Fit the learned tier on (query, intent) pairs"""
+        X = self.vectorizer.transform([query.lower() for query in queries])
+
+        self.classifier = LogisticRegression(max_iter=1000, C=4.0)
+        self.classifier.fit(X, labels)
+        self._prepare()
+
+        return self.classifier.score(X, labels)
+
+    def predict(self, query):
+        """
+        Return {'intent', 'confidence', 'source'} from the cheapest tier that
+        can answer; source is 'rules', 'model' or 'default'
+        """
+        label = self.match_rules(query)
+        if label is not None:
+            return {'intent': label, 'confidence': RULE_CONFIDENCE, 'source': 'rules'}
+
+        if self._coef is None:
+            return {'intent': 'search', 'confidence': 0.0, 'source': 'default'}
+
+        columns, values = self._hash_features(query.lower())
+        logits = values @ self._coef[columns] + self._intercept
+        logits = np.exp(logits - logits.max())
+        proba = logits / logits.sum()
+
+        best = int(proba.argmax())
+        return {'intent': self.labels[best], 'confidence': float(proba[best]), 'source': 'model'}
+
+    def _hash_features(self, text):
+        """
+        Same columns and l2-normalised counts as vectorizer.transform([text]),
+        without the sparse-matrix and input-validation overhead of one call
+        """
+        counts = {}
+        for ngram in self._analyzer(text):
+            column = abs(murmurhash3_32(ngram, seed=0)) % self._n_features
+            counts[column] = counts.get(column, 0) + 1
+
+        columns = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        values = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+        norm = np.sqrt(values @ values)
+        return columns, values / norm if norm else values
+
+    def _prepare(self):
+        coef = self.classifier.coef_
+        intercept = self.classifier.intercept_
+        self.labels = [str(label) for label in self.classifier.classes_]
+
+        if len(self.labels) == 2:
+            # Binary models keep one row of weights; expand to one per class
+            coef = np.vstack([-coef[0] / 2, coef[0] / 2])
+            intercept = np.array([-intercept[0] / 2, intercept[0] / 2])
+
+        self._coef = np.ascontiguousarray(coef.T)
+        self._intercept = intercept
+
+    def save_model(self, filepath):
+        """Save the trained model"""
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        with open(filepath, 'wb') as f:
+            pickle.dump({'classifier': self.classifier}, f)
+
+    def load_model(self, filepath):
+        """Load a trained model"""
+        with open(filepath, 'rb') as f:
+            model_data = pickle.load(f)
+
+        self.classifier = model_data['classifier']
+        self._prepare()
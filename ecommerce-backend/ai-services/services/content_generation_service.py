@@ -1,15 +1,102 @@
+import sys
 import os
-from openai import OpenAI
-from anthropic import Anthropic
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.llm_cache import LLMResponseCache
+from services.llm_providers import LLMProvider, ProviderRouter
+from config.database import get_redis_connection
+from utils.rate_limiter import TokenBucket
+from utils.single_flight import SingleFlight
+from concurrent.futures import ThreadPoolExecutor
+import json
+import random
+import threading
+import time
+
+SYSTEM_PROMPT = "You are a professional copywriter for an e-commerce platform."
+
+# Upstream statuses worth retrying: timeouts, conflicts, rate limits, server errors
+RETRYABLE_STATUS = {408, 409, 429}
+RETRY_BASE_SECONDS = 1.0
+RETRY_MAX_SECONDS = 60.0
+
+# Rough prompt size estimate; close enough for English product copy
+CHARS_PER_TOKEN = 4
+
+# Packed (multi-product) generation: per task, the instruction, the answer
+# format and the completion tokens budgeted for each product
+PACKED_TASKS = {
+    'tags': {
+        'instruction': 'Generate 10-15 relevant, SEO-friendly tags for each of these products.',
+        'answer': 'its list of tags, e.g. {"1": ["tag", "tag"], "2": ["tag"]}',
+        'output_tokens': 80
+    },
+    'title': {
+        'instruction': ('Create an SEO-optimized product title (50-60 characters) for each of these '
+                        'products. Each title should include brand, product type, and 1-2 key features.'),
+        'answer': 'its title, e.g. {"1": "title", "2": "title"}',
+        'output_tokens': 30
+    }
+}
 
 class ContentGenerationService:
     def __init__(self):
-        # Initialize API clients
-        self.openai_client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-        self.anthropic_client = Anthropic(api_key=os.getenv('ANTHROPIC_API_KEY'))
-        
         # Choose which to use (can be configured)
         self.use_anthropic = os.getenv('USE_ANTHROPIC', 'false').lower() == 'true'
+        self.openai_model = os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo')
+        self.anthropic_model = os.getenv('ANTHROPIC_MODEL', 'claude-3-haiku-20240307')
+        self.temperature = float(os.getenv('CONTENT_TEMPERATURE', 0.7))
+        
+        # Completions keyed on provider, model, prompt and sampling settings
+        self.cache = LLMResponseCache()
+        
+        # Requests per minute allowed per provider, shared by all threads
+        self.rate_limiters = {
+            'openai': TokenBucket(float(os.getenv('CONTENT_OPENAI_RPM', 3000)) / 60),
+            'anthropic': TokenBucket(float(os.getenv('CONTENT_ANTHROPIC_RPM', 1000)) / 60)
+        }
+        self.max_retries = int(os.getenv('CONTENT_MAX_RETRIES', 5))
+        # Seconds allowed per HTTP attempt, and per call including retries
+        self.request_timeout = float(os.getenv('CONTENT_REQUEST_TIMEOUT', 20))
+        self.call_deadline = float(os.getenv('CONTENT_CALL_DEADLINE', 60))
+        self.http_pool_size = int(os.getenv('CONTENT_HTTP_POOL_SIZE', 64))
+        
+        # API clients are created on first use, each over its own keep-alive pool
+        self.providers = {
+            'openai': LLMProvider('openai', self._create_openai_client),
+            'anthropic': LLMProvider('anthropic', self._create_anthropic_client)
+        }
+        self.router = ProviderRouter(
+            self.providers,
+            preferred='anthropic' if self.use_anthropic else 'openai',
+            hedge=os.getenv('CONTENT_HEDGE', 'false').lower() == 'true',
+            hedge_delay_ms=int(os.getenv('CONTENT_HEDGE_DELAY_MS', 2000))
+        )
+        # The other provider serves failovers and hedges when it has credentials
+        secondary = 'openai' if self.use_anthropic else 'anthropic'
+        if (os.getenv('CONTENT_FAILOVER', 'true').lower() == 'true'
+                and os.getenv(f'{secondary.upper()}_API_KEY')):
+            self.router.enabled.append(secondary)
+        self.call_stats = {'calls': 0, 'retries': 0, 'throttled_seconds': 0.0}
+        self._stats_lock = threading.Lock()
+        
+        # Identical prompts in flight at the same time share one upstream call.
+        # 'local' dedupes within this process, 'redis' across workers, 'off' disables
+        self.single_flight = self._create_single_flight(os.getenv('CONTENT_SINGLE_FLIGHT', 'local'))
+        
+        # Packed prompts: products per call are bounded by these token budgets
+        self.pack_input_tokens = int(os.getenv('CONTENT_PACK_INPUT_TOKENS', 6000))
+        self.pack_output_tokens = int(os.getenv('CONTENT_PACK_OUTPUT_TOKENS', 3000))
+        self.pack_max_items = int(os.getenv('CONTENT_PACK_MAX_ITEMS', 40))
+        self.pack_workers = int(os.getenv('CONTENT_PACK_WORKERS', 4))
+    
+    @property
+    def openai_client(self):
+        return self.providers['openai'].client
+    
+    @property
+    def anthropic_client(self):
+        return self.providers['anthropic'].client
     
     def generate_product_description(self, product_data):
         """
@@ -25,10 +112,7 @@ class ContentGenerationService:
         try:
             prompt = self._build_description_prompt(product_data)
             
-            if self.use_anthropic:
-                description = self._generate_with_claude(prompt)
-            else:
-                description = self._generate_with_gpt(prompt)
+            description = self._generate(prompt)
             
             return {
                 'description': description,
@@ -43,33 +127,85 @@ class ContentGenerationService:
                 'error': str(e)
             }
     
-    def generate_product_tags(self, product_data):
-        """Generate SEO-friendly tags for a product"""
+    def stream_product_description(self, product_data):
+        """
+        Generate a product description, yielding it as it is written
+        
+        Yields ('token', text) for each piece of the completion, then
+        ('done', {'description', 'word_count'}) once it finishes. The result is
+        cached under the same key as generate_product_description, so either
+        call reuses the other's completion. On failure yields ('error', ...)
+        with the fallback description instead of 'done'.
+        """
         try:
-            prompt = f"""Generate 10-15 relevant, SEO-friendly tags for this product:
+            prompt = self._build_description_prompt(product_data)
+            _, key = self._cache_key(prompt, 500)
             
-Product Name: {product_data.get('name', '')}
-Category: {product_data.get('category', '')}
-Brand: {product_data.get('brand', '')}
-Description: {product_data.get('description', '')[:200]}
-
-Return only the tags as a comma-separated list, no explanations."""
-
-            if self.use_anthropic:
-                response = self._generate_with_claude(prompt, max_tokens=200)
+            description = self.cache.get(key)
+            if description is not None:
+                yield 'token', description
             else:
-                response = self._generate_with_gpt(prompt, max_tokens=200)
+                # Streams aren't hedged; they go to the currently fastest provider
+                provider = self.router.order()[0]
+                stream_fn = self._stream_with_claude if provider == 'anthropic' else self._stream_with_gpt
+                # Retries only cover opening the stream, before any text was sent
+                stream = self._call_provider(provider, stream_fn, prompt, 500, track_latency=False)
+                
+                parts = []
+                for text in stream:
+                    parts.append(text)
+                    yield 'token', text
+                
+                description = ''.join(parts).strip()
+                self.cache.put(key, description)
+            
+            yield 'done', {
+                'description': description,
+                'word_count': len(description.split())
+            }
             
-            # Parse tags
-            tags = [tag.strip() for tag in response.split(',')]
-            tags = [tag for tag in tags if tag]  # Remove empty
+        except Exception as e:
+            print(f"Error streaming description: {e}")
+            yield 'error', {
+                'description': self._generate_fallback_description(product_data),
+                'word_count': 0,
+                'error': str(e)
+            }
+    
+    def generate_product_tags(self, product_data):
+        """Generate SEO-friendly tags for a product"""
+        try:
+            response = self._generate(self._build_tags_prompt(product_data), max_tokens=200)
             
-            return {'tags': tags[:15]}
+            return {'tags': self._parse_tags(response)}
             
         except Exception as e:
             print(f"Error generating tags: {e}")
             return {'tags': [], 'error': str(e)}
     
+    def generate_listing_content(self, product_data, fields=('description', 'tags')):
+        """
+        Generate the requested listing fields for one product
+        Unlike the single-field generators this raises on failure instead of
+        returning fallback content, so bulk jobs can retry or skip the product
+        """
+        product_data = dict(product_data)
+        result = {}
+        
+        if 'description' in fields:
+            description = self._generate(self._build_description_prompt(product_data)).strip()
+            result['description'] = description
+            result['word_count'] = len(description.split())
+            # Tags are generated from the new description
+            product_data['description'] = description
+        
+        if 'tags' in fields:
+            result['tags'] = self._parse_tags(
+                self._generate(self._build_tags_prompt(product_data), max_tokens=200)
+            )
+        
+        return result
+    
     def generate_seo_title(self, product_data):
         """Generate SEO-optimized product title"""
         try:
@@ -83,10 +219,7 @@ Key Features: {', '.join(product_data.get('key_features', [])[:3])}
 Title should include brand, product type, and 1-2 key features.
 Return only the title, no explanations."""
 
-            if self.use_anthropic:
-                title = self._generate_with_claude(prompt, max_tokens=100)
-            else:
-                title = self._generate_with_gpt(prompt, max_tokens=100)
+            title = self._generate(prompt, max_tokens=100)
             
             return {'title': title.strip()}
             
@@ -94,6 +227,20 @@ Return only the title, no explanations."""
             print(f"Error generating SEO title: {e}")
             return {'title': product_data.get('name', ''), 'error': str(e)}
     
+    def generate_product_tags_batch(self, products):
+        """
+        Generate tags for many products, several per LLM call
+        Returns one {'tags': [...]} per product, in order
+        """
+        return self._generate_packed(products, 'tags')
+    
+    def generate_seo_titles_batch(self, products):
+        """
+        Generate SEO titles for many products, several per LLM call
+        Returns one {'title': ...} per product, in order
+        """
+        return self._generate_packed(products, 'title')
+    
     def generate_marketing_copy(self, product_data, style='professional'):
         """
         Generate marketing copy for product
@@ -118,10 +265,7 @@ Key Features: {', '.join(product_data.get('key_features', []))}
 Write 2-3 sentences that would make customers want to buy this product.
 Focus on benefits, not just features."""
 
-            if self.use_anthropic:
-                copy = self._generate_with_claude(prompt, max_tokens=200)
-            else:
-                copy = self._generate_with_gpt(prompt, max_tokens=200)
+            copy = self._generate(prompt, max_tokens=200)
             
             return {'marketing_copy': copy.strip()}
             
@@ -142,10 +286,7 @@ The description should be 100-150 words, SEO-friendly, and highlight:
 
 Write in a professional yet engaging tone."""
 
-            if self.use_anthropic:
-                description = self._generate_with_claude(prompt)
-            else:
-                description = self._generate_with_gpt(prompt)
+            description = self._generate(prompt)
             
             return {'description': description.strip()}
             
@@ -188,32 +329,323 @@ Write only the description, no headings or labels."""
 
         return prompt
     
-    def _generate_with_gpt(self, prompt, max_tokens=500):
+    def _build_tags_prompt(self, product_data):
+        """Build prompt for tag generation"""
+        return f"""Generate 10-15 relevant, SEO-friendly tags for this product:
+            
+Product Name: {product_data.get('name', '')}
+Category: {product_data.get('category', '')}
+Brand: {product_data.get('brand', '')}
+Description: {(product_data.get('description') or '')[:200]}
+
+Return only the tags as a comma-separated list, no explanations."""
+    
+    @staticmethod
+    def _parse_tags(response):
+        tags = [tag.strip() for tag in response.split(',')]
+        tags = [tag for tag in tags if tag]  # Remove empty
+        return tags[:15]
+    
+    def _generate_packed(self, products, task):
+        """
+        Pack products into as few prompts as the token budgets allow, ask for
+        a JSON object keyed by each product's position in the prompt, and
+        validate every answer. Products whose answer is missing or malformed
+        (or whose whole packed call failed) are retried one at a time.
+        """
+        products = list(products)
+        items = [self._packed_item(product, task) for product in products]
+        chunks = self._pack_chunks(items, task)
+        
+        results = [None] * len(products)
+        
+        def run_chunk(indices):
+            answers = self._generate_packed_chunk([items[i] for i in indices], task)
+            for label, i in enumerate(indices, start=1):
+                results[i] = self._validate_packed(answers.get(str(label)), task)
+        
+        single = self.generate_product_tags if task == 'tags' else self.generate_seo_title
+        
+        def retry_single(i):
+            results[i] = single(products[i])
+        
+        with ThreadPoolExecutor(max_workers=max(1, self.pack_workers)) as executor:
+            list(executor.map(run_chunk, chunks))
+            list(executor.map(retry_single, [i for i, result in enumerate(results) if result is None]))
+        
+        return results
+    
+    def _packed_item(self, product_data, task):
+        """The fields of a product that go into a packed prompt"""
+        item = {
+            'name': product_data.get('name', ''),
+            'category': product_data.get('category', ''),
+            'brand': product_data.get('brand', '')
+        }
+        if task == 'tags':
+            item['description'] = (product_data.get('description') or '')[:200]
+        else:
+            item['key_features'] = list(product_data.get('key_features', []))[:3]
+        return item
+    
+    def _pack_chunks(self, items, task):
+        """Split item indices into chunks that fit the input and output token budgets"""
+        output_tokens = PACKED_TASKS[task]['output_tokens']
+        chunks = []
+        current, input_tokens = [], 0
+        
+        for i, item in enumerate(items):
+            item_tokens = len(json.dumps(item)) // CHARS_PER_TOKEN + 4
+            full = (
+                len(current) >= self.pack_max_items
+                or input_tokens + item_tokens > self.pack_input_tokens
+                or (len(current) + 1) * output_tokens > self.pack_output_tokens
+            )
+            if current and full:
+                chunks.append(current)
+                current, input_tokens = [], 0
+            current.append(i)
+            input_tokens += item_tokens
+        
+        if current:
+            chunks.append(current)
+        return chunks
+    
+    def _generate_packed_chunk(self, items, task):
+        """Run one packed prompt; returns the parsed JSON object, or {} on failure"""
+        spec = PACKED_TASKS[task]
+        lines = '\n'.join(
+            json.dumps({'id': str(label), **item}) for label, item in enumerate(items, start=1)
+        )
+        prompt = f"""{spec['instruction']}
+
+Products (one JSON object per line):
+{lines}
+
+Return only a JSON object mapping each product id to {spec['answer']}. No explanations."""
+        
+        try:
+            response = self._generate(prompt, max_tokens=len(items) * spec['output_tokens'] + 50)
+            # Tolerate code fences or stray text around the object
+            start, end = response.find('{'), response.rfind('}')
+            answers = json.loads(response[start:end + 1]) if start != -1 else {}
+            return answers if isinstance(answers, dict) else {}
+        except Exception as e:
+            print(f"Error generating packed {task}: {e}")
+            return {}
+    
+    def _validate_packed(self, answer, task):
+        """Result dict for a valid packed answer, None if it needs a single-item retry"""
+        if task == 'tags':
+            if not isinstance(answer, list):
+                return None
+            tags = [tag.strip() for tag in answer if isinstance(tag, str) and tag.strip()]
+            return {'tags': tags[:15]} if tags else None
+        
+        if not isinstance(answer, str) or not answer.strip() or len(answer) > 200:
+            return None
+        return {'title': answer.strip()}
+    
+    def _cache_key(self, prompt, max_tokens):
+        """
+        Preferred provider and the cache key of its completion for this prompt
+        Failed-over and hedged answers are cached under the same key
+        """
+        if self.use_anthropic:
+            provider, model, system = 'anthropic', self.anthropic_model, None
+        else:
+            provider, model, system = 'openai', self.openai_model, SYSTEM_PROMPT
+        
+        return provider, self.cache.make_key(provider, model, prompt, max_tokens, self.temperature, system)
+    
+    def _generate(self, prompt, max_tokens=500):
+        """Generate with the configured provider, reusing cached completions"""
+        provider, key = self._cache_key(prompt, max_tokens)
+        content = self.cache.get(key)
+        if content is not None:
+            return content
+        
+        if self.single_flight is None:
+            return self._generate_uncached(provider, key, prompt, max_tokens)
+        # The cache key is the prompt fingerprint: same provider, model,
+        # prompt and sampling settings
+        return self.single_flight.do(key, self._generate_uncached, provider, key, prompt, max_tokens)
+    
+    def _generate_uncached(self, provider, key, prompt, max_tokens):
+        # A flight for this key may have finished between our cache miss and now
+        content = self.cache.get(key)
+        if content is not None:
+            return content
+        
+        def run(provider):
+            generate_fn = self._generate_with_claude if provider == 'anthropic' else self._generate_with_gpt
+            return self._call_provider(provider, generate_fn, prompt, max_tokens)
+        
+        content = self.router.call(run)
+        
+        self.cache.put(key, content)
+        return content
+    
+    def _create_single_flight(self, mode):
+        if mode == 'off':
+            return None
+        
+        redis_client = None
+        if mode == 'redis':
+            try:
+                redis_client = get_redis_connection()
+                redis_client.ping()
+            except Exception as e:
+                print(f"Error connecting single-flight to Redis, deduplicating in-process only: {e}")
+                redis_client = None
+        
+        return SingleFlight(
+            redis_client=redis_client,
+            lock_ttl_ms=int(os.getenv('CONTENT_SINGLE_FLIGHT_LOCK_MS', 60000))
+        )
+    
+    def _call_provider(self, provider, generate, prompt, max_tokens, track_latency=True):
+        """
+        Call a provider within its rate limit and the call deadline, retrying
+        rate-limit, timeout and server errors with exponential backoff and
+        full jitter. Each attempt's latency feeds the provider's routing stats.
+        """
+        latency = self.providers[provider].latency
+        deadline = time.monotonic() + self.call_deadline
+        attempt = 0
+        while True:
+            throttled = self.rate_limiters[provider].acquire()
+            with self._stats_lock:
+                self.call_stats['calls'] += 1
+                self.call_stats['throttled_seconds'] += throttled
+            
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"{provider} call exceeded its {self.call_deadline:.0f}s deadline")
+            
+            started = time.monotonic()
+            try:
+                result = generate(prompt, max_tokens, timeout=min(self.request_timeout, remaining))
+                if track_latency:
+                    latency.record(time.monotonic() - started)
+                return result
+            except Exception as e:
+                latency.record(time.monotonic() - started, ok=False)
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    raise
+                
+                delay = random.uniform(0, min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** attempt))
+                # Never retry sooner than the provider asked us to
+                delay = max(delay, _retry_after_seconds(e))
+                if time.monotonic() + delay >= deadline:
+                    raise
+                attempt += 1
+                with self._stats_lock:
+                    self.call_stats['retries'] += 1
+                time.sleep(delay)
+    
+    def _generate_with_gpt(self, prompt, max_tokens=500, timeout=None):
         """Generate content using OpenAI GPT"""
         response = self.openai_client.chat.completions.create(
-            model="gpt-3.5-turbo",
+            model=self.openai_model,
             messages=[
-                {"role": "system", "content": "You are a professional copywriter for an e-commerce platform."},
+                {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ],
             max_tokens=max_tokens,
-            temperature=0.7
+            temperature=self.temperature,
+            timeout=timeout or self.request_timeout
         )
         
         return response.choices[0].message.content.strip()
     
-    def _generate_with_claude(self, prompt, max_tokens=500):
+    def _generate_with_claude(self, prompt, max_tokens=500, timeout=None):
         """Generate content using Anthropic Claude"""
         response = self.anthropic_client.messages.create(
-            model="claude-3-haiku-20240307",
+            model=self.anthropic_model,
             max_tokens=max_tokens,
+            temperature=self.temperature,
             messages=[
                 {"role": "user", "content": prompt}
-            ]
+            ],
+            timeout=timeout or self.request_timeout
         )
         
         return response.content[0].text.strip()
     
+    def _stream_with_gpt(self, prompt, max_tokens=500, timeout=None):
+        """
+        Open an OpenAI GPT stream and return an iterator of text deltas
+        Connection and status errors are raised here, before iteration starts
+        """
+        stream = self.openai_client.chat.completions.create(
+            model=self.openai_model,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=max_tokens,
+            temperature=self.temperature,
+            stream=True,
+            timeout=timeout or self.request_timeout
+        )
+        
+        return (
+            chunk.choices[0].delta.content for chunk in stream
+            if chunk.choices and chunk.choices[0].delta.content
+        )
+    
+    def _stream_with_claude(self, prompt, max_tokens=500, timeout=None):
+        """Open an Anthropic Claude stream and return an iterator of text deltas"""
+        stream = self.anthropic_client.messages.create(
+            model=self.anthropic_model,
+            max_tokens=max_tokens,
+            temperature=self.temperature,
+            messages=[
+                {"role": "user", "content": prompt}
+            ],
+            stream=True,
+            timeout=timeout or self.request_timeout
+        )
+        
+        return (
+            event.delta.text for event in stream
+            if event.type == 'content_block_delta' and getattr(event.delta, 'text', None)
+        )
+    
+    def _create_openai_client(self):
+        from openai import OpenAI
+        # SDK retries are off; _call_provider retries with rate limiting instead
+        return OpenAI(
+            api_key=os.getenv('OPENAI_API_KEY'),
+            base_url=os.getenv('OPENAI_BASE_URL'),
+            max_retries=0,
+            timeout=self.request_timeout,
+            http_client=self._create_http_client()
+        )
+    
+    def _create_anthropic_client(self):
+        from anthropic import Anthropic
+        return Anthropic(
+            api_key=os.getenv('ANTHROPIC_API_KEY'),
+            base_url=os.getenv('ANTHROPIC_BASE_URL'),
+            max_retries=0,
+            timeout=self.request_timeout,
+            http_client=self._create_http_client()
+        )
+    
+    def _create_http_client(self):
+        """Keep-alive connection pool sized for the threads sharing a client"""
+        import httpx
+        return httpx.Client(
+            timeout=self.request_timeout,
+            limits=httpx.Limits(
+                max_connections=self.http_pool_size,
+                max_keepalive_connections=self.http_pool_size,
+                keepalive_expiry=60
+            )
+        )
+    
     def _generate_fallback_description(self, product_data):
         """Generate basic description if AI fails"""
         name = product_data.get('name', 'this product')
@@ -229,4 +661,19 @@ Write only the description, no headings or labels."""
         if product_data.get('key_features'):
             description += "Key features include: " + ", ".join(product_data['key_features'][:3]) + "."
         
-        return description
\ No newline at end of file
+        return description
+
+def _is_retryable(error):
+    status = getattr(error, 'status_code', None)
+    if status is not None:
+        return status in RETRYABLE_STATUS or status >= 500
+    # Connection resets and client-side timeouts carry no status
+    name = type(error).__name__
+    return 'Connection' in name or 'Timeout' in name
+
+def _retry_after_seconds(error):
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        return min(RETRY_MAX_SECONDS, float(headers.get('retry-after', 0)))
+    except (TypeError, ValueError):
+        return 0.0
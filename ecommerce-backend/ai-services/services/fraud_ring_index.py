@@ -0,0 +1,242 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.helpers import (
+    hash_address, new_build_id, payment_fingerprint, read_snapshot, read_snapshot_build,
+    try_lock_file, write_snapshot
+)
+from collections import OrderedDict
+import threading
+import time
+
+# Accounts younger than this when first seen count as new
+NEW_ACCOUNT_DAYS = 7
+
+def link_keys(shipping_address, payment_method):
+    """Identifiers that link accounts into one ring"""
+    address = hash_address(shipping_address)
+    payment = payment_fingerprint(payment_method)
+    return [
+        f'address:{address}' if address else None,
+        f'payment:{payment}' if payment else None
+    ]
+
+class FraudRingIndex:
+    """
+    Incremental disjoint-set index of users linked by shared identifiers
+
+    Users that ship to the same address hash or pay with the same payment
+    fingerprint end up in one component. Union by size with path halving
+    keeps union and find near O(1), and every root carries aggregates for
+    its component (size, new-account count, total amount, order count).
+    The most recent order ids are remembered so an order added twice is
+    only counted once.
+    """
+
+    def __init__(self, snapshot_path=None, snapshot_interval=None, max_recorded_orders=200000):
+        self.snapshot_path = snapshot_path or os.getenv(
+            'FRAUD_RING_SNAPSHOT', 'models/saved_models/fraud_rings.pkl'
+        )
+        self.snapshot_interval = snapshot_interval or int(os.getenv('FRAUD_RING_SNAPSHOT_INTERVAL', 300))
+        self.max_recorded_orders = max_recorded_orders
+
+        self._lock = threading.Lock()
+        self._reset()
+
+        # Which offline build the in-memory index descends from (None: empty)
+        self.build_id = None
+        self._last_snapshot = time.monotonic()
+        self._snapshot_running = False
+        self._writer_lock = None
+
+    def _reset(self):
+        self.user_nodes = {}
+        self.key_owners = {}
+        self.parent = []
+        self.size = []
+        self.new_accounts = []
+        self.total_amount = []
+        self.order_count = []
+        self.recorded_orders = OrderedDict()
+
+    def add_transaction(self, user_id, keys, amount, user_age_days, order_id=None):
+        """
+        Add a transaction and return the features of the user's component
+        keys: linking identifiers, e.g. from link_keys() (None values are ignored)
+        order_id: if this order was already added, nothing changes
+        """
+        with self._lock:
+            if order_id is not None:
+                if order_id in self.recorded_orders:
+                    node = self.user_nodes.get(user_id)
+                    return self._features(self._find(node) if node is not None else None)
+                self.recorded_orders[order_id] = None
+                if len(self.recorded_orders) > self.max_recorded_orders:
+                    self.recorded_orders.popitem(last=False)
+
+            node = self._user_node(user_id, user_age_days)
+
+            for key in keys:
+                if not key:
+                    continue
+                owner = self.key_owners.get(key)
+                if owner is None:
+                    self.key_owners[key] = node
+                else:
+                    self._union(node, owner)
+
+            root = self._find(node)
+            self.total_amount[root] += float(amount)
+            self.order_count[root] += 1
+
+            features = self._features(root)
+
+        self._maybe_snapshot()
+        return features
+
+    def cluster_features(self, user_id):
+        """Return the features of the user's component without changing it"""
+        with self._lock:
+            node = self.user_nodes.get(user_id)
+            if node is None:
+                return self._features(None)
+            return self._features(self._find(node))
+
+    def _user_node(self, user_id, user_age_days):
+        node = self.user_nodes.get(user_id)
+        if node is None:
+            node = len(self.parent)
+            self.user_nodes[user_id] = node
+            self.parent.append(node)
+            self.size.append(1)
+            self.new_accounts.append(1 if user_age_days < NEW_ACCOUNT_DAYS else 0)
+            self.total_amount.append(0.0)
+            self.order_count.append(0)
+        return node
+
+    def _find(self, node):
+        parent = self.parent
+        while parent[node] != node:
+            # Path halving
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    def _union(self, a, b):
+        a = self._find(a)
+        b = self._find(b)
+        if a == b:
+            return a
+
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+        self.new_accounts[a] += self.new_accounts[b]
+        self.total_amount[a] += self.total_amount[b]
+        self.order_count[a] += self.order_count[b]
+        return a
+
+    def _features(self, root):
+        if root is None:
+            return {
+                'cluster_size': 1,
+                'cluster_new_accounts': 0,
+                'cluster_total_amount': 0.0,
+                'cluster_order_count': 0
+            }
+        return {
+            'cluster_size': self.size[root],
+            'cluster_new_accounts': self.new_accounts[root],
+            'cluster_total_amount': round(self.total_amount[root], 2),
+            'cluster_order_count': self.order_count[root]
+        }
+
+    def save_snapshot(self, filepath=None, rebuilt=False, replace_other_builds=True):
+        """
+        Write the index to disk (atomically replaces the previous snapshot)
+        rebuilt: the index was built from scratch (train.py); it gets a new
+        build id, which running servers pick up instead of overwriting
+        replace_other_builds: False skips the write if the file holds a
+        different build; returns whether it was written
+        """
+        filepath = filepath or self.snapshot_path
+        if rebuilt:
+            self.build_id = new_build_id()
+
+        # Copy under the lock, pickle outside it so checks aren't blocked
+        with self._lock:
+            state = {
+                'user_nodes': dict(self.user_nodes),
+                'key_owners': dict(self.key_owners),
+                'parent': list(self.parent),
+                'size': list(self.size),
+                'new_accounts': list(self.new_accounts),
+                'total_amount': list(self.total_amount),
+                'order_count': list(self.order_count),
+                'recorded_orders': OrderedDict(self.recorded_orders)
+            }
+
+        return write_snapshot(filepath, self.build_id, state, replace_other_builds)
+
+    def load_snapshot(self, filepath=None):
+        """Load an index written by save_snapshot"""
+        filepath = filepath or self.snapshot_path
+
+        build_id, data = read_snapshot(filepath)
+
+        with self._lock:
+            self.build_id = build_id
+            self.user_nodes = data['user_nodes']
+            self.key_owners = data['key_owners']
+            self.parent = data['parent']
+            self.size = data['size']
+            self.new_accounts = data['new_accounts']
+            self.total_amount = data['total_amount']
+            self.order_count = data['order_count']
+            # Snapshots from before order ids were tracked don't have them
+            self.recorded_orders = data.get('recorded_orders', OrderedDict())
+
+    def after_fork(self):
+        """Reset snapshot state inherited from the parent of a forked worker"""
+        # The parent's snapshot thread (if any) didn't survive the fork
+        self._snapshot_running = False
+        self._last_snapshot = time.monotonic()
+        self._writer_lock = None
+
+    def _maybe_snapshot(self):
+        """
+        Save a snapshot in the background once the interval has passed
+        Of the processes sharing the snapshot file (pre-forked workers, the
+        stream worker), only the one holding its lock file writes; another
+        takes over when that process exits. A snapshot from a newer offline
+        build is loaded instead of being overwritten.
+        """
+        if self._snapshot_running or time.monotonic() - self._last_snapshot < self.snapshot_interval:
+            return
+
+        self._last_snapshot = time.monotonic()
+        if self._writer_lock is None:
+            self._writer_lock = try_lock_file(f'{self.snapshot_path}.lock')
+
+        self._snapshot_running = True
+
+        def run():
+            try:
+                if self._writer_lock is not None:
+                    current = self.save_snapshot(replace_other_builds=False)
+                else:
+                    current = read_snapshot_build(self.snapshot_path) == self.build_id
+                if not current:
+                    self.load_snapshot()
+                    print(f"Loaded rebuilt fraud ring snapshot {self.build_id}")
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"Error syncing fraud ring snapshot: {e}")
+            finally:
+                self._snapshot_running = False
+
+        threading.Thread(target=run, daemon=True).start()
@@ -2,14 +2,31 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from models.fraud_detection_model import FraudDetectionModel
+from models.fraud_detection_model import FraudDetectionModel, VELOCITY_FEATURE_COLUMNS
+from services.user_feature_store import UserFeatureStore
+from services.velocity_engine import VelocityEngine
+from services.fraud_ring_index import FraudRingIndex, link_keys
+from utils.helpers import hash_address, payment_fingerprint, to_utc, utc_now
 from config.database import get_db_connection
 from datetime import datetime
+from zoneinfo import ZoneInfo
 import numpy as np
+import time
 
 class FraudService:
     def __init__(self):
         self.model = FraudDetectionModel()
+        self.feature_store = UserFeatureStore()
+        self.velocity = VelocityEngine()
+        self.ring_index = FraudRingIndex()
+        
+        # Per-transaction explanations: skipped below this risk level or
+        # once the check has used up its latency budget
+        self.explain_min_risk = os.getenv('FRAUD_EXPLAIN_MIN_RISK', 'low')
+        self.explain_budget_ms = float(os.getenv('FRAUD_EXPLAIN_BUDGET_MS', 5))
+        # Time rules read the clock of the storefront's customers; the model
+        # features stay in UTC, as in training
+        self.business_timezone = ZoneInfo(os.getenv('FRAUD_BUSINESS_TIMEZONE', 'Asia/Kolkata'))
         self.load_model()
     
     def load_model(self):
@@ -19,6 +36,14 @@ class FraudService:
             print("Fraud detection model loaded successfully")
         except Exception as e:
             print(f"Error loading fraud model: {e}")
+        
+        try:
+            self.ring_index.load_snapshot()
+            print("Fraud ring index loaded successfully")
+        except FileNotFoundError:
+            print("No fraud ring snapshot found, starting empty index")
+        except Exception as e:
+            print(f"Error loading fraud ring index: {e}")
     
     def check_transaction(self, transaction_data):
         """
@@ -30,24 +55,37 @@ class FraudService:
         - num_items
         - shipping_address
         - payment_method
+        - order_id (optional; an order is only counted into velocity and
+          the ring index once, however often it is checked)
         """
+        started = time.perf_counter()
+        
         try:
+            # Velocity before this transaction, as the model was trained on
+            velocity = self.velocity.peek(self._velocity_keys(transaction_data))
+            
             # Extract features
-            features = self._extract_features(transaction_data)
+            features = self._extract_features(transaction_data, velocity)
             
-            # Get prediction
-            prediction = self.model.predict_fraud_probability(features)
+            # Get prediction and explanation from the same traversal
+            prediction, explanation = self.model.predict_with_explanation(
+                features,
+                min_risk=self.explain_min_risk,
+                deadline=started + self.explain_budget_ms / 1000
+            )
             
-            # Get explanation
-            explanation = self.model.explain_prediction(features)
+            # Only a scored transaction is counted, once per order_id
+            velocity, cluster = self._record(transaction_data, features)
             
             # Additional rule-based checks
-            rule_checks = self._apply_rule_based_checks(transaction_data, features)
+            rule_checks = self._apply_rule_based_checks(transaction_data, features, velocity, cluster)
             
             # Combine results
             result = {
                 **prediction,
                 'explanation': explanation,
+                'velocity': velocity,
+                'cluster': cluster,
                 'rule_violations': rule_checks,
                 'recommendation': self._get_recommendation(prediction, rule_checks)
             }
@@ -63,49 +101,237 @@ class FraudService:
                 'recommendation': 'manual_review'
             }
     
-    def _extract_features(self, transaction_data):
+    def check_transactions_batch(self, transactions, record=False):
+        """
+        Check many transactions for fraud in one pass
+        
+        Each transaction has the same fields as check_transaction, plus an
+        optional order_id that is echoed back. User history is fetched for
+        all users at once and all rows are scored as a single matrix.
+        
+        record: count the transactions into the velocity windows and the
+        fraud ring index once they are scored, as check_transaction does.
+        Transactions with an order_id that was already recorded are not
+        counted again. Leave off for retroactive sweeps over orders that
+        were already seen.
+        """
+        if not transactions:
+            return []
+        
+        try:
+            user_ids = list({t['user_id'] for t in transactions})
+            history = self._fetch_user_history(user_ids)
+            
+            velocities = self._batch_velocities(transactions) if record else [
+                self.velocity.peek(self._velocity_keys(t)) for t in transactions
+            ]
+            
+            feature_rows = [
+                self._build_features(t, history[t['user_id']], velocity)
+                for t, velocity in zip(transactions, velocities)
+            ]
+            
+            predictions = self.model.predict_batch(feature_rows, explain_min_risk=self.explain_min_risk)
+            
+            if record:
+                velocities, clusters = zip(*[
+                    self._record(t, features) for t, features in zip(transactions, feature_rows)
+                ])
+            else:
+                clusters = [self.ring_index.cluster_features(t['user_id']) for t in transactions]
+            
+            # Rows without a local explanation share the global importances
+            global_explanation = self.model.explain_prediction(feature_rows[0])
+            local_explanations = predictions.get('explanations') or [None] * len(feature_rows)
+            
+            results = []
+            for i, (transaction_data, features, velocity, cluster) in enumerate(zip(transactions, feature_rows, velocities, clusters)):
+                prediction = {
+                    'fraud_probability': float(predictions['fraud_probability'][i]),
+                    'is_anomaly': bool(predictions['is_anomaly'][i]),
+                    'risk_level': str(predictions['risk_level'][i]),
+                    'anomaly_score': float(predictions['anomaly_score'][i])
+                }
+                rule_checks = self._apply_rule_based_checks(transaction_data, features, velocity, cluster)
+                
+                results.append({
+                    'order_id': transaction_data.get('order_id'),
+                    **prediction,
+                    'explanation': local_explanations[i] or global_explanation,
+                    'velocity': velocity,
+                    'cluster': cluster,
+                    'rule_violations': rule_checks,
+                    'recommendation': self._get_recommendation(prediction, rule_checks)
+                })
+            
+            return results
+            
+        except Exception as e:
+            print(f"Error in check_transactions_batch: {e}")
+            return [
+                {
+                    'order_id': t.get('order_id'),
+                    'error': str(e),
+                    'fraud_probability': 0.5,
+                    'risk_level': 'unknown',
+                    'recommendation': 'manual_review'
+                }
+                for t in transactions
+            ]
+    
+    def record_order_event(self, event):
+        """
+        Apply an order-created event to the user feature store
+        
+        Expected fields:
+        - user_id
+        - created_at (ISO timestamp, optional; naive values are taken as UTC)
+        """
+        self.feature_store.record_order(event['user_id'], to_utc(event.get('created_at')))
+    
+    def _extract_features(self, transaction_data, velocity=None):
         """Extract features from transaction data"""
+        user_id = transaction_data['user_id']
+        user_features = self._fetch_user_history([user_id])[user_id]
+        
+        return self._build_features(transaction_data, user_features, velocity)
+    
+    def _batch_velocities(self, transactions):
+        """
+        Velocity before each transaction of a batch that is about to be recorded
+        Earlier transactions of the same batch count as already seen, as they
+        would if the batch had arrived one transaction at a time, unless
+        their order was recorded before (e.g. through /fraud/check).
+        """
+        # Orders the engine already counted are in the peeked windows already
+        seen_orders = self.velocity.recorded(t.get('order_id') for t in transactions)
+        earlier = {}
+        velocities = []
+        
+        for t in transactions:
+            keys = {dim: key for dim, key in self._velocity_keys(t).items() if key}
+            velocity = self.velocity.peek(keys)
+            
+            for dim, key in keys.items():
+                count, amount = earlier.get((dim, key), (0, 0.0))
+                for column in list(velocity):
+                    if column.startswith(f'{dim}_count_'):
+                        velocity[column] += count
+                    elif column.startswith(f'{dim}_amount_'):
+                        velocity[column] = round(velocity[column] + amount, 2)
+            velocities.append(velocity)
+            
+            order_id = t.get('order_id')
+            if order_id is not None:
+                if order_id in seen_orders:
+                    continue
+                seen_orders.add(order_id)
+            for dim, key in keys.items():
+                count, amount = earlier.get((dim, key), (0, 0.0))
+                earlier[(dim, key)] = (count + 1, amount + float(t['amount']))
+        
+        return velocities
+    
+    def _record(self, transaction_data, features):
+        """
+        Count a scored transaction into the velocity windows and the ring index
+        Returns the velocity snapshot and ring cluster including it
+        """
+        order_id = transaction_data.get('order_id')
+        velocity = self.velocity.record(
+            self._velocity_keys(transaction_data),
+            transaction_data['amount'],
+            order_id=order_id
+        )
+        
+        # Link the user to accounts sharing its address or payment method
+        cluster = self.ring_index.add_transaction(
+            transaction_data['user_id'],
+            link_keys(transaction_data.get('shipping_address'), transaction_data.get('payment_method')),
+            transaction_data['amount'],
+            features[3],
+            order_id=order_id
+        )
+        
+        return velocity, cluster
+    
+    def _velocity_keys(self, transaction_data):
+        """Velocity dimensions for a transaction"""
+        return {
+            'user': transaction_data['user_id'],
+            'payment': payment_fingerprint(transaction_data.get('payment_method')),
+            'address': hash_address(transaction_data.get('shipping_address'))
+        }
+    
+    def _fetch_user_history(self, user_ids):
+        """
+        Get order count, last order time and registration date for users
+        Served from the feature store; misses are loaded from the database
+        with one query per table and written back to the store.
+        """
+        history = self.feature_store.get_many(user_ids)
+        misses = [user_id for user_id in user_ids if user_id not in history]
+        
+        if not misses:
+            return history
+        
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        user_id = transaction_data['user_id']
-        
-        # Get user history
         cursor.execute("""
             SELECT 
+                user_id,
                 COUNT(*) as total_orders,
-                COALESCE(MAX(created_at), NOW()) as last_order_date,
-                created_at as registration_date
+                MAX(created_at) as last_order_date
             FROM orders
-            WHERE user_id = %s
-        """, (user_id,))
+            WHERE user_id = ANY(%s)
+            GROUP BY user_id
+        """, (misses,))
         
-        user_history = cursor.fetchone()
+        order_rows = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
         
         cursor.execute("""
-            SELECT created_at FROM users WHERE id = %s
-        """, (user_id,))
+            SELECT id, created_at FROM users WHERE id = ANY(%s)
+        """, (misses,))
         
-        user_registration = cursor.fetchone()
+        registration_rows = {row[0]: row[1] for row in cursor.fetchall()}
         
         cursor.close()
         conn.close()
         
+        for user_id in misses:
+            order_count, last_order_time = order_rows.get(user_id, (0, None))
+            # timestamptz columns come back aware; the store keeps naive UTC
+            last_order_time = to_utc(last_order_time)
+            registration_date = to_utc(registration_rows.get(user_id))
+            
+            self.feature_store.put(user_id, order_count, last_order_time, registration_date)
+            history[user_id] = {
+                'order_count': order_count,
+                'last_order_time': last_order_time,
+                'registration_date': registration_date
+            }
+        
+        return history
+    
+    def _build_features(self, transaction_data, user_features, velocity=None):
+        """Build the model feature vector from a transaction and cached user features"""
         # Calculate features
         amount = float(transaction_data['amount'])
         num_items = int(transaction_data.get('num_items', 1))
         
-        user_age_days = 0
-        previous_orders = 0
-        time_since_last_order = 999999
+        # Naive UTC like the stored timestamps; hour and weekday are UTC as in training
+        now = utc_now()
         
-        if user_registration:
-            user_age_days = (datetime.now() - user_registration[0]).days
+        user_age_days = 0
+        if user_features['registration_date']:
+            user_age_days = (now - user_features['registration_date']).days
         
-        if user_history:
-            previous_orders = user_history[0] or 0
-            if user_history[1]:
-                time_since_last_order = (datetime.now() - user_history[1]).total_seconds() / 3600
+        previous_orders = user_features['order_count'] or 0
+        # Users without orders count as "just ordered", as the original
+        # COALESCE(MAX(created_at), NOW()) lookup did
+        last_order_time = user_features['last_order_time'] or now
+        time_since_last_order = (now - last_order_time).total_seconds() / 3600
         
         features = [
             amount,
@@ -114,13 +340,18 @@ class FraudService:
             user_age_days,
             previous_orders,
             time_since_last_order,
-            datetime.now().hour,
-            datetime.now().weekday()
+            now.hour,
+            now.weekday()
         ]
         
+        # Velocity features, when the loaded model was trained with them
+        for column in self.model.feature_columns:
+            if column in VELOCITY_FEATURE_COLUMNS:
+                features.append(velocity.get(column, 0) if velocity else 0)
+        
         return features
     
-    def _apply_rule_based_checks(self, transaction_data, features):
+    def _apply_rule_based_checks(self, transaction_data, features, velocity=None, cluster=None):
         """Apply rule-based fraud checks"""
         violations = []
         
@@ -128,7 +359,7 @@ class FraudService:
         num_items = features[1]
         user_age_days = features[3]
         previous_orders = features[4]
-        hour = features[6]
+        hour = datetime.now(self.business_timezone).hour
         
         # High value transaction
         if amount > 50000:
@@ -146,8 +377,8 @@ class FraudService:
                 'message': 'New account with high-value transaction'
             })
         
-        # Unusual time
-        if hour < 5 or hour > 23:
+        # Unusual time (local 23:00-05:00)
+        if hour < 5 or hour >= 23:
             violations.append({
                 'rule': 'unusual_time',
                 'severity': 'low',
@@ -162,8 +393,57 @@ class FraudService:
                 'message': 'First transaction with high value'
             })
         
-        # Velocity check (would need more data)
-        # Multiple transactions in short time
+        # Velocity checks
+        if velocity:
+            if velocity['user_count_1m'] >= 3:
+                violations.append({
+                    'rule': 'velocity_user_burst',
+                    'severity': 'high',
+                    'message': f"{velocity['user_count_1m']} transactions from this user in the last minute"
+                })
+            elif velocity['user_count_1h'] >= 10:
+                violations.append({
+                    'rule': 'velocity_user_hourly',
+                    'severity': 'medium',
+                    'message': f"{velocity['user_count_1h']} transactions from this user in the last hour"
+                })
+            
+            if velocity['user_amount_24h'] > 100000:
+                violations.append({
+                    'rule': 'velocity_user_amount',
+                    'severity': 'high',
+                    'message': f"User spent ₹{velocity['user_amount_24h']} in the last 24 hours"
+                })
+            
+            if velocity['payment_count_1h'] >= 10:
+                violations.append({
+                    'rule': 'velocity_payment_method',
+                    'severity': 'medium',
+                    'message': f"Payment method used {velocity['payment_count_1h']} times in the last hour"
+                })
+            
+            if velocity['address_count_24h'] >= 20:
+                violations.append({
+                    'rule': 'velocity_shipping_address',
+                    'severity': 'medium',
+                    'message': f"{velocity['address_count_24h']} orders to this address in the last 24 hours"
+                })
+        
+        # Linked-account ring checks
+        if cluster:
+            if cluster['cluster_size'] >= 5 and cluster['cluster_new_accounts'] >= 3:
+                violations.append({
+                    'rule': 'linked_new_accounts',
+                    'severity': 'high',
+                    'message': f"Linked to {cluster['cluster_size']} accounts sharing addresses or payment methods, "
+                               f"{cluster['cluster_new_accounts']} of them new"
+                })
+            elif cluster['cluster_size'] >= 10:
+                violations.append({
+                    'rule': 'large_linked_account_cluster',
+                    'severity': 'medium',
+                    'message': f"Linked to {cluster['cluster_size']} accounts sharing addresses or payment methods"
+                })
         
         return violations
     
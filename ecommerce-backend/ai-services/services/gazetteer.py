@@ -0,0 +1,178 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.database import get_db_connection
+import re
+import threading
+import time
+
+DEFAULT_VOCABULARY = {
+    'colors': [
+        'red', 'blue', 'green', 'black', 'white', 'yellow', 'orange',
+        'purple', 'pink', 'brown', 'gray', 'grey', 'silver', 'gold'
+    ],
+    'sizes': ['small', 'medium', 'large', 'xl', 'xxl', 'xs', 's', 'm', 'l'],
+    'materials': [
+        'cotton', 'leather', 'wool', 'silk', 'denim', 'linen', 'polyester',
+        'nylon', 'steel', 'wood', 'wooden', 'plastic', 'glass', 'gold', 'silver'
+    ],
+    'brands': [],
+    'categories': []
+}
+
+# Token boundaries: "men's" and "t-shirt" stay one token, so the size "s"
+# or the color "red" never match inside another word
+TOKEN_PATTERN = re.compile(r"[^\W_]+(?:['\-][^\W_]+)*")
+
+# Every price phrasing in one pass; the named group that matched says which filter it is
+PRICE_PATTERN = re.compile(
+    r'\b(?:between\s+(?:rs\.?\s*|₹\s*)?(?P<between_min>\d+)\s+and\s+(?:rs\.?\s*|₹\s*)?(?P<between_max>\d+)'
+    r'|(?:under|below|less than)\s+(?:rs\.?\s*|₹\s*)?(?P<max>\d+)'
+    r'|(?:above|more than|over)\s+(?:rs\.?\s*|₹\s*)?(?P<min>\d+)'
+    r'|(?P<range_min>\d+)\s+to\s+(?P<range_max>\d+))\b'
+)
+
+class Gazetteer:
+    """
+    Compiled vocabulary matcher for search queries
+
+    Phrases from every vocabulary (colors, sizes, materials, brands,
+    categories) go into one token trie, so a single left-to-right scan finds
+    the longest phrase at each token boundary. Brands and categories, plus
+    colors, materials and sizes found in product attributes, are reloaded
+    from the database in the background every `refresh_seconds`.
+    """
+
+    def __init__(self, refresh_seconds=None, on_change=None):
+        self.refresh_seconds = refresh_seconds or int(os.getenv('NLP_VOCAB_REFRESH_SECONDS', 600))
+        # Called after a refresh that changed the vocabulary
+        self.on_change = on_change
+
+        self.vocabulary = {kind: set(words) for kind, words in DEFAULT_VOCABULARY.items()}
+        self._compiled = self._compile(self.vocabulary)
+
+        self._last_refresh = None
+        self._refresh_running = False
+        self._refresh_lock = threading.Lock()
+
+    def extract(self, text):
+        """
+        Scan lowercased text once
+        Returns ({kind: [phrase, ...]}, [(start, end, kinds), ...]) where the
+        spans are character offsets of every match
+        """
+        self.maybe_refresh()
+
+        trie, max_phrase = self._compiled
+        tokens = [(m.start(), m.end(), m.group()) for m in TOKEN_PATTERN.finditer(text)]
+        entities = {kind: [] for kind in DEFAULT_VOCABULARY}
+        spans = []
+
+        i = 0
+        while i < len(tokens):
+            node = trie
+            match = None
+            for j in range(i, min(i + max_phrase, len(tokens))):
+                node = node.get(tokens[j][2])
+                if node is None:
+                    break
+                if None in node:
+                    match = (j, node[None])
+            if match is None:
+                i += 1
+                continue
+
+            j, (phrase, kinds) = match
+            for kind in kinds:
+                if phrase not in entities[kind]:
+                    entities[kind].append(phrase)
+            spans.append((tokens[i][0], tokens[j][1], kinds))
+            i = j + 1
+
+        return entities, spans
+
+    def maybe_refresh(self):
+        """Reload the vocabulary in the background once the interval has passed"""
+        if self._refresh_running:
+            return
+        if self._last_refresh is not None and time.monotonic() - self._last_refresh < self.refresh_seconds:
+            return
+
+        with self._refresh_lock:
+            if self._refresh_running:
+                return
+            self._refresh_running = True
+            self._last_refresh = time.monotonic()
+
+        def run():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Error refreshing search vocabulary: {e}")
+            finally:
+                self._refresh_running = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def refresh(self):
+        """Load the vocabulary from the products and categories tables"""
+        vocabulary = {kind: set(words) for kind, words in DEFAULT_VOCABULARY.items()}
+
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+
+            cursor.execute("""
+                SELECT DISTINCT lower(brand) FROM products
+                WHERE is_active = true AND brand IS NOT NULL AND brand <> ''
+            """)
+            vocabulary['brands'].update(row[0] for row in cursor.fetchall())
+
+            cursor.execute("""
+                SELECT lower(name) FROM categories WHERE is_active = true
+            """)
+            vocabulary['categories'].update(row[0] for row in cursor.fetchall())
+
+            for kind, attribute in (('colors', 'color'), ('materials', 'material'), ('sizes', 'size')):
+                cursor.execute("""
+                    SELECT DISTINCT lower(attributes->>%s) FROM products
+                    WHERE is_active = true AND attributes->>%s IS NOT NULL
+                """, (attribute, attribute))
+                vocabulary[kind].update(row[0] for row in cursor.fetchall())
+
+            cursor.close()
+        finally:
+            conn.close()
+
+        vocabulary = {
+            kind: {' '.join(word.split()) for word in words if word and word.strip()}
+            for kind, words in vocabulary.items()
+        }
+        if vocabulary == self.vocabulary:
+            return
+
+        # Swap in the new trie with one assignment; scans in flight keep the old one
+        self._compiled = self._compile(vocabulary)
+        self.vocabulary = vocabulary
+        print(f"Search vocabulary refreshed: {', '.join(f'{len(v)} {k}' for k, v in vocabulary.items())}")
+
+        if self.on_change:
+            self.on_change()
+
+    def _compile(self, vocabulary):
+        phrases = {}
+        for kind, words in vocabulary.items():
+            for word in words:
+                key = tuple(TOKEN_PATTERN.findall(word.lower()))
+                if key:
+                    phrases.setdefault(key, (' '.join(key), []))[1].append(kind)
+
+        trie = {}
+        for key, (phrase, kinds) in phrases.items():
+            node = trie
+            for token in key:
+                node = node.setdefault(token, {})
+            node[None] = (phrase, tuple(kinds))
+
+        return trie, max((len(key) for key in phrases), default=1)
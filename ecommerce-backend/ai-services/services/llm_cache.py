@@ -0,0 +1,186 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.database import get_redis_connection
+from collections import OrderedDict
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+class LLMResponseCache:
+    """
+    Cache of LLM completions keyed on everything that shapes the output
+
+    The key hashes (provider, model, system prompt, prompt, max_tokens,
+    temperature), so identical product payloads reuse the earlier answer
+    while any change to the request misses.
+
+    backend: 'memory' (per-process LRU), 'disk' (SQLite file shared by the
+    workers on a host) or 'redis' (shared by every worker; size is bounded
+    by the Redis maxmemory policy)
+    """
+
+    KEY_PREFIX = 'content:llm:'
+    # Disk eviction runs once per this many writes
+    EVICT_EVERY = 100
+
+    def __init__(self, backend=None, ttl_seconds=None, max_entries=None, db_path=None):
+        self.backend = backend or os.getenv('CONTENT_CACHE', 'memory')
+        self.ttl_seconds = ttl_seconds or int(os.getenv('CONTENT_CACHE_TTL', 7 * 86400))
+        self.max_entries = max_entries or int(os.getenv('CONTENT_CACHE_SIZE', 50000))
+        self.db_path = db_path or os.getenv('CONTENT_CACHE_DB', 'models/saved_models/content_cache.db')
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = None
+        self._db = None
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+
+        if self.backend == 'redis':
+            try:
+                self._redis = get_redis_connection()
+                self._redis.ping()
+            except Exception as e:
+                print(f"Error connecting content cache to Redis, using memory: {e}")
+                self.backend = 'memory'
+                self._redis = None
+        elif self.backend == 'disk':
+            self._open_db()
+
+    def reopen(self):
+        """
+        Open a fresh database connection; call in each worker after a fork,
+        since a SQLite connection must not be used by two processes
+        """
+        if self._db is not None:
+            self._lock = threading.Lock()
+            self._open_db()
+    
+    @staticmethod
+    def make_key(provider, model, prompt, max_tokens, temperature, system=None):
+        payload = json.dumps([provider, model, system, prompt, max_tokens, temperature])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return the cached completion, or None on a miss"""
+        if self._redis is not None:
+            value = self._redis_get(key)
+        elif self._db is not None:
+            value = self._disk_get(key)
+        else:
+            value = None
+            with self._lock:
+                item = self._entries.get(key)
+                if item is not None:
+                    expires_at, value = item
+                    if expires_at < time.time():
+                        del self._entries[key]
+                        value = None
+                    else:
+                        self._entries.move_to_end(key)
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Store a completion"""
+        if self._redis is not None:
+            try:
+                self._redis.set(self.KEY_PREFIX + key, value, ex=self.ttl_seconds)
+            except Exception as e:
+                print(f"Error writing content cache to Redis: {e}")
+            return
+
+        if self._db is not None:
+            self._disk_put(key, value)
+            return
+
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': self.backend,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+    def _open_db(self):
+        try:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY, value TEXT, expires_at REAL, last_used REAL
+                )
+            """)
+            self._db.execute('CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)')
+            self._db.commit()
+        except Exception as e:
+            print(f"Error opening content cache database, using memory: {e}")
+            self.backend = 'memory'
+            self._db = None
+    
+    def _redis_get(self, key):
+        try:
+            return self._redis.get(self.KEY_PREFIX + key)
+        except Exception as e:
+            print(f"Error reading content cache from Redis: {e}")
+            return None
+
+    def _disk_get(self, key):
+        now = time.time()
+        try:
+            with self._lock:
+                row = self._db.execute(
+                    'SELECT value, expires_at FROM responses WHERE key = ?', (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                if row[1] < now:
+                    self._db.execute('DELETE FROM responses WHERE key = ?', (key,))
+                    self._db.commit()
+                    return None
+                self._db.execute('UPDATE responses SET last_used = ? WHERE key = ?', (now, key))
+                self._db.commit()
+                return row[0]
+        except Exception as e:
+            print(f"Error reading content cache: {e}")
+            return None
+
+    def _disk_put(self, key, value):
+        now = time.time()
+        try:
+            with self._lock:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO responses (key, value, expires_at, last_used) VALUES (?, ?, ?, ?)',
+                    (key, value, now + self.ttl_seconds, now)
+                )
+                self._writes += 1
+                if self._writes % self.EVICT_EVERY == 0:
+                    # Expired rows first, then least recently used beyond the size bound
+                    self._db.execute('DELETE FROM responses WHERE expires_at < ?', (now,))
+                    self._db.execute("""
+                        DELETE FROM responses WHERE key IN (
+                            SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                        )
+                    """, (self.max_entries,))
+                self._db.commit()
+        except Exception as e:
+            print(f"Error writing content cache: {e}")
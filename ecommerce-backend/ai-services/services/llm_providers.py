@@ -0,0 +1,220 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import os
+import threading
+import time
+
+class LatencyTracker:
+    """
+    Latency percentiles and error rate over a provider's recent calls
+
+    Only calls from the last `max_age` seconds count, so a provider that was
+    demoted for errors or latency drops its old record once it goes quiet,
+    and is tried again instead of being stuck at the back for good.
+    """
+
+    # Percentiles are only trusted once this many calls have been seen
+    MIN_SAMPLES = 20
+
+    def __init__(self, window=500, max_age=None):
+        self.max_age = max_age or float(os.getenv('CONTENT_PROVIDER_STATS_MAX_AGE', 120))
+        # (monotonic time, value) pairs, oldest first
+        self._latencies = deque(maxlen=window)
+        self._outcomes = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+
+    def record(self, seconds, ok=True):
+        now = time.monotonic()
+        with self._lock:
+            self.calls += 1
+            self._outcomes.append((now, ok))
+            if ok:
+                self._latencies.append((now, seconds))
+            else:
+                self.errors += 1
+
+    def percentile(self, q):
+        """Latency (seconds) at quantile q of recent successful calls, None if too few"""
+        with self._lock:
+            self._expire()
+            if len(self._latencies) < self.MIN_SAMPLES:
+                return None
+            latencies = sorted(seconds for _, seconds in self._latencies)
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    def error_rate(self):
+        with self._lock:
+            self._expire()
+            if not self._outcomes:
+                return 0.0
+            return 1 - sum(ok for _, ok in self._outcomes) / len(self._outcomes)
+
+    def _expire(self):
+        """Drop calls older than max_age (caller holds the lock)"""
+        horizon = time.monotonic() - self.max_age
+        for samples in (self._latencies, self._outcomes):
+            while samples and samples[0][0] < horizon:
+                samples.popleft()
+
+    def stats(self):
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'recent_error_rate': round(self.error_rate(), 4),
+            'p50_ms': round(p50 * 1000, 1) if p50 is not None else None,
+            'p95_ms': round(p95 * 1000, 1) if p95 is not None else None
+        }
+
+class LLMProvider:
+    """
+    One LLM API: its SDK client and its latency statistics
+
+    The client is built by `create_client` on first use, so a provider that
+    is never called never imports its SDK or opens connections, and a
+    process that forks before the first call doesn't share sockets.
+    """
+
+    def __init__(self, name, create_client):
+        self.name = name
+        self.create_client = create_client
+        self.latency = LatencyTracker()
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self.create_client()
+        return self._client
+
+    def stats(self):
+        return {'client_created': self._client is not None, **self.latency.stats()}
+
+class ProviderRouter:
+    """
+    Chooses which provider serves a call, and hedges slow ones
+
+    Providers are ranked by their recent p95 latency, with the preferred
+    provider first until all have enough samples; another provider must be
+    `switch_margin` faster to take its place. A provider whose recent
+    error rate exceeds `max_error_rate` drops to the back. If the first
+    choice fails, the call fails over to the next.
+
+    With hedging on, when the first choice hasn't answered by its own p95
+    (or `hedge_delay_ms` before it has enough samples), the same call is
+    started on the second and whichever succeeds first wins. The slower
+    call still runs to completion in the background and feeds the stats.
+
+    Stats age out (see LatencyTracker), so a demoted provider is retried
+    once its failures are older than the tracker's max_age.
+    """
+
+    def __init__(self, providers, preferred, hedge=False, hedge_delay_ms=2000,
+                 max_error_rate=0.5, switch_margin=0.2, max_workers=32):
+        self.providers = providers
+        self.preferred = preferred
+        self.hedge = hedge
+        self.hedge_delay_ms = hedge_delay_ms
+        self.max_error_rate = max_error_rate
+        self.switch_margin = switch_margin
+        self.max_workers = max_workers
+
+        self.enabled = [preferred]
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.routing_stats = {'hedged': 0, 'hedge_wins': 0, 'failovers': 0}
+
+    def order(self):
+        """Enabled providers, best first"""
+        def rank(name):
+            tracker = self.providers[name].latency
+            p95 = tracker.percentile(0.95)
+            unhealthy = tracker.error_rate() > self.max_error_rate
+            # Without enough samples everywhere, keep the configured preference
+            if any(self.providers[other].latency.percentile(0.95) is None for other in self.enabled):
+                p95 = 0.0
+            elif name != self.preferred:
+                p95 *= 1 + self.switch_margin
+            return (unhealthy, p95, name != self.preferred)
+
+        return sorted(self.enabled, key=rank)
+
+    def call(self, run):
+        """Return run(provider_name) from the best provider, failing over or hedging as configured"""
+        order = self.order()
+        if len(order) < 2:
+            return run(order[0])
+
+        if not self.hedge:
+            try:
+                return run(order[0])
+            except Exception as e:
+                print(f"Error from {order[0]}, failing over to {order[1]}: {e}")
+                self._count('failovers')
+                return run(order[1])
+
+        return self._hedged(run, order[0], order[1])
+
+    def stats(self):
+        with self._stats_lock:
+            routing = dict(self.routing_stats)
+        return {
+            'preferred': self.preferred,
+            'order': self.order(),
+            'hedge': self.hedge,
+            **routing,
+            'providers': {name: self.providers[name].stats() for name in self.enabled}
+        }
+
+    def _hedged(self, run, primary, secondary):
+        executor = self._get_executor()
+        futures = {executor.submit(run, primary): primary}
+
+        p95 = self.providers[primary].latency.percentile(0.95)
+        delay = p95 if p95 is not None else self.hedge_delay_ms / 1000
+        done, _ = wait(futures, timeout=delay)
+
+        if not done:
+            self._count('hedged')
+            futures[executor.submit(run, secondary)] = secondary
+
+        pending = set(futures)
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if futures[future] != primary:
+                        self._count('hedge_wins')
+                    return future.result()
+                error = future.exception()
+
+            if not pending and len(futures) == 1:
+                # Primary failed before the hedge delay: fail over instead
+                print(f"Error from {primary}, failing over to {secondary}: {error}")
+                self._count('failovers')
+                future = executor.submit(run, secondary)
+                futures[future] = secondary
+                pending = {future}
+
+        raise error
+
+    def _get_executor(self):
+        # Created on first hedge, so it isn't inherited across a fork
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix='llm-hedge'
+                    )
+        return self._executor
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.routing_stats[key] += 1
@@ -1,27 +1,274 @@
-import spacy
-from transformers import pipeline
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.intent_model import IntentModel, INTENT_LABELS
+from services.query_cache import SearchQueryCache
+from services.gazetteer import Gazetteer, PRICE_PATTERN
+from services.suggestion_index import SuggestionIndex
+from services.sentiment_cache import SentimentCache
+from utils.micro_batcher import MicroBatcher
 import re
+import resource
+import threading
+import time
+
+# Only the components a method actually uses are loaded. Search parsing needs
+# nothing beyond the tokenizer (stop words and punctuation are lexical), and
+# attribute extraction needs POS tags, so the parser, NER and lemmatizer are
+# never loaded.
+SPACY_EXCLUDE = ['parser', 'ner', 'lemmatizer']
+
+MEASUREMENT_PATTERN = re.compile(r'(\d+\.?\d*)\s*(cm|mm|m|inch|inches|kg|g|ml|l)\b')
 
 class NLPService:
-    def __init__(self):
-        # Load spaCy model
-        self.nlp = spacy.load('en_core_web_sm')
-        
-        # Load sentiment analysis pipeline
-        self.sentiment_analyzer = pipeline(
-            'sentiment-analysis',
-            model='distilbert-base-uncased-finetuned-sst-2-english'
+    def __init__(self, preload=None, inference_backend=None):
+        self.spacy_model = os.getenv('NLP_SPACY_MODEL', 'en_core_web_sm')
+        self.sentiment_model = os.getenv(
+            'NLP_SENTIMENT_MODEL', 'distilbert-base-uncased-finetuned-sst-2-english'
         )
+        self.zero_shot_model = os.getenv('NLP_ZERO_SHOT_MODEL', 'facebook/bart-large-mnli')
+        
+        # Transformer backend: 'pytorch' (fp32), 'quantized' (dynamic int8
+        # Linear layers) or 'onnx' (ONNX Runtime, needs optimum[onnxruntime])
+        self.inference_backend = inference_backend or os.getenv('NLP_INFERENCE_BACKEND', 'pytorch')
+        self.onnx_dir = os.getenv('NLP_ONNX_DIR', 'models/saved_models/onnx')
+        
+        # Batched sentiment: texts per forward pass and token limit per text
+        self.sentiment_batch_size = int(os.getenv('NLP_SENTIMENT_BATCH_SIZE', 32))
+        self.sentiment_max_length = int(os.getenv('NLP_SENTIMENT_MAX_LENGTH', 512))
+        
+        # Scores by text hash; bump NLP_SENTIMENT_MODEL_VERSION when the
+        # weights behind a model name change
+        self.sentiment_cache = SentimentCache(':'.join([
+            self.sentiment_model,
+            self.inference_backend,
+            str(self.sentiment_max_length),
+            os.getenv('NLP_SENTIMENT_MODEL_VERSION', '1')
+        ]))
+        
+        # Bulk attribute extraction: docs per nlp.pipe batch and worker processes
+        self.pipe_batch_size = int(os.getenv('NLP_PIPE_BATCH_SIZE', 256))
+        self.pipe_processes = int(os.getenv('NLP_PIPE_PROCESSES', os.cpu_count() or 1))
+        
+        # Concurrent analyze_sentiment calls share one forward pass, flushed at
+        # max_batch texts or max_wait_ms after the first one arrives
+        self.sentiment_batcher = None
+        if os.getenv('NLP_SENTIMENT_COALESCE', 'true').lower() == 'true':
+            self.sentiment_batcher = MicroBatcher(
+                self.analyze_sentiment_batch,
+                max_batch=int(os.getenv('NLP_SENTIMENT_MAX_BATCH', 32)),
+                max_wait_ms=float(os.getenv('NLP_SENTIMENT_MAX_WAIT_MS', 5)),
+                name='sentiment-batcher'
+            )
+
+        # Models load on first use; one lock per model so a slow load
+        # doesn't block requests that need a different one
+        self._models = {}
+        self._locks = {name: threading.Lock() for name in ('nlp', 'sentiment', 'zero_shot')}
+        self.load_stats = {}
+
+        # Intent tiers: rules, then the distilled classifier, then zero-shot
+        # only when the classifier is less confident than this
+        self.intent_model = IntentModel()
+        self.intent_min_confidence = float(os.getenv('NLP_INTENT_MIN_CONFIDENCE', 0.6))
+        self.intent_zero_shot = os.getenv('NLP_INTENT_ZERO_SHOT', 'true').lower() == 'true'
+        self.load_intent_model()
+
+        # Parsed search queries, keyed on the normalized query
+        self.search_cache = SearchQueryCache()
         
-        # Load zero-shot classification for intent detection
-        self.classifier = pipeline('zero-shot-classification')
+        # Colors, sizes, materials, brands and categories; cached parses are
+        # dropped when the vocabulary loaded from the database changes
+        self.gazetteer = Gazetteer(on_change=self.search_cache.clear)
+        
+        # Autocomplete index built by train.py
+        self.suggestions = SuggestionIndex()
+        self.load_suggestions()
+
+        # Comma-separated list of models to load at startup, e.g. "nlp,sentiment"
+        if preload is None:
+            preload = [name for name in os.getenv('NLP_PRELOAD', '').split(',') if name.strip()]
+        for name in preload:
+            self._get(name.strip())
+
+    @property
+    def nlp(self):
+        return self._get('nlp')
+
+    @property
+    def sentiment_analyzer(self):
+        return self._get('sentiment')
+
+    @property
+    def classifier(self):
+        return self._get('zero_shot')
+
+    def _get(self, name):
+        model = self._models.get(name)
+        if model is not None:
+            return model
+
+        with self._locks[name]:
+            # Another thread may have finished loading while we waited
+            model = self._models.get(name)
+            if model is None:
+                model = self._load(name)
+                self._models[name] = model
+        return model
+
+    def _load(self, name):
+        started = time.perf_counter()
+        rss_before = _peak_rss_mb()
+
+        if name == 'nlp':
+            import spacy
+            model = spacy.load(self.spacy_model, exclude=SPACY_EXCLUDE)
+        elif name == 'sentiment':
+            model = self._load_transformer('sentiment-analysis', self.sentiment_model)
+        else:
+            model = self._load_transformer('zero-shot-classification', self.zero_shot_model)
+
+        self.load_stats[name] = {
+            'load_seconds': round(time.perf_counter() - started, 2),
+            'peak_memory_growth_mb': round(_peak_rss_mb() - rss_before, 1)
+        }
+        if name != 'nlp':
+            self.load_stats[name]['backend'] = model.inference_backend
+        print(f"Loaded NLP model '{name}' in {self.load_stats[name]['load_seconds']}s")
+        return model
+
+    def _load_transformer(self, task, model_name):
+        """
+        Build a pipeline on the configured backend
+        The pipeline interface is the same on every backend, so callers
+        (including analyze_sentiment_batch, which calls pipeline.model
+        directly) don't change. Falls back to fp32 PyTorch if the backend
+        can't be set up.
+        """
+        from transformers import pipeline
+
+        if self.inference_backend == 'onnx':
+            try:
+                from optimum.onnxruntime import ORTModelForSequenceClassification
+                from transformers import AutoTokenizer
+
+                # Export once, then load the saved graph on later starts
+                export_dir = os.path.join(self.onnx_dir, model_name.replace('/', '--'))
+                exported = os.path.exists(os.path.join(export_dir, 'model.onnx'))
+                model = ORTModelForSequenceClassification.from_pretrained(
+                    export_dir if exported else model_name,
+                    export=not exported
+                )
+                tokenizer = AutoTokenizer.from_pretrained(export_dir if exported else model_name)
+                if not exported:
+                    model.save_pretrained(export_dir)
+                    tokenizer.save_pretrained(export_dir)
+
+                analyzer = pipeline(task, model=model, tokenizer=tokenizer)
+                analyzer.inference_backend = 'onnx'
+                return analyzer
+            except Exception as e:
+                print(f"Error loading ONNX model {model_name}, using PyTorch: {e}")
+
+        analyzer = pipeline(task, model=model_name)
+        analyzer.inference_backend = 'pytorch'
+
+        if self.inference_backend == 'quantized':
+            try:
+                import torch
+                analyzer.model = torch.quantization.quantize_dynamic(
+                    analyzer.model, {torch.nn.Linear}, dtype=torch.qint8
+                )
+                analyzer.inference_backend = 'quantized'
+            except Exception as e:
+                print(f"Error quantizing {model_name}, using fp32: {e}")
+
+        return analyzer
+
+    def load_intent_model(self):
+        """Load the distilled intent classifier trained by train.py"""
+        try:
+            self.intent_model.load_model(
+                os.getenv('NLP_INTENT_MODEL_PATH', 'models/saved_models/intent_model.pkl')
+            )
+            print("Intent model loaded successfully")
+        except FileNotFoundError:
+            print("No intent model found, using rules and zero-shot only")
+        except Exception as e:
+            print(f"Error loading intent model: {e}")
+
+    def load_suggestions(self):
+        """Load the autocomplete index snapshot"""
+        try:
+            self.suggestions.load_snapshot()
+            print("Suggestion index loaded successfully")
+        except FileNotFoundError:
+            print("No suggestion index found, starting empty")
+        except Exception as e:
+            print(f"Error loading suggestion index: {e}")
+
+    def detect_intent(self, query):
+        """
+        Classify search intent with the cheapest tier that is confident enough
+        Returns {'intent', 'confidence', 'source'}
+        """
+        prediction = self.intent_model.predict(query)
+        if prediction['confidence'] >= self.intent_min_confidence or not self.intent_zero_shot:
+            return prediction
+
+        try:
+            zero_shot = self.classifier(query, INTENT_LABELS)
+            return {
+                'intent': zero_shot['labels'][0],
+                'confidence': float(zero_shot['scores'][0]),
+                'source': 'zero_shot'
+            }
+        except Exception as e:
+            print(f"Error in zero-shot intent detection: {e}")
+            return prediction
+
+    def memory_report(self):
+        """Which models are loaded, what they cost to load, and current peak memory"""
+        return {
+            'loaded': sorted(self._models),
+            'models': dict(self.load_stats),
+            'peak_memory_mb': round(_peak_rss_mb(), 1)
+        }
     
     def process_search_query(self, query):
         """
         Process natural language search query
         Extract intent, entities, filters
         """
-        doc = self.nlp(query.lower())
+        normalized = self.search_cache.normalize(query)
+        
+        result = self.search_cache.get(normalized)
+        if result is None:
+            result = self._parse_search_query(normalized)
+            self.search_cache.put(normalized, result)
+        
+        result['original_query'] = query
+        return result
+    
+    def warm_search_cache(self, queries):
+        """Parse and cache queries that aren't cached yet; returns how many were added"""
+        warmed = 0
+        for query in queries:
+            normalized = self.search_cache.normalize(query)
+            if not normalized or self.search_cache.contains(normalized):
+                continue
+            try:
+                self.search_cache.put(normalized, self._parse_search_query(normalized))
+                warmed += 1
+            except Exception as e:
+                print(f"Error warming search cache for '{normalized}': {e}")
+        return warmed
+    
+    def _parse_search_query(self, query):
+        """Parse a normalized query (see SearchQueryCache.normalize)"""
+        # Tokenizer only: keywords need stop-word and punctuation flags, no tagging
+        doc = self.nlp.tokenizer(query.lower())
         
         result = {
             'original_query': query,
@@ -32,55 +279,28 @@ class NLPService:
             'keywords': []
         }
         
-        # Extract entities
-        entities = {
-            'colors': [],
-            'brands': [],
-            'sizes': [],
-            'materials': []
-        }
-        
-        # Color detection
-        colors = ['red', 'blue', 'green', 'black', 'white', 'yellow', 'orange', 
-                 'purple', 'pink', 'brown', 'gray', 'grey', 'silver', 'gold']
-        for color in colors:
-            if color in query.lower():
-                entities['colors'].append(color)
-        
-        # Size detection
-        sizes = ['small', 'medium', 'large', 'xl', 'xxl', 'xs', 's', 'm', 'l']
-        for size in sizes:
-            if re.search(r'\b' + size + r'\b', query.lower()):
-                entities['sizes'].append(size)
+        # Extract entities in one scan over the query
+        entities, spans = self.gazetteer.extract(query)
         
         # Price extraction
-        price_patterns = [
-            (r'under (\d+)', 'max_price'),
-            (r'below (\d+)', 'max_price'),
-            (r'less than (\d+)', 'max_price'),
-            (r'above (\d+)', 'min_price'),
-            (r'more than (\d+)', 'min_price'),
-            (r'over (\d+)', 'min_price'),
-            (r'between (\d+) and (\d+)', 'price_range'),
-            (r'(\d+) to (\d+)', 'price_range')
-        ]
-        
-        for pattern, filter_type in price_patterns:
-            match = re.search(pattern, query.lower())
-            if match:
-                if filter_type == 'price_range':
-                    result['filters']['min_price'] = int(match.group(1))
-                    result['filters']['max_price'] = int(match.group(2))
-                elif filter_type == 'max_price':
-                    result['filters']['max_price'] = int(match.group(1))
-                elif filter_type == 'min_price':
-                    result['filters']['min_price'] = int(match.group(1))
-                break
+        price_spans = []
+        for match in PRICE_PATTERN.finditer(query):
+            price_spans.append(match.span())
+            if match.group('between_min'):
+                result['filters']['min_price'] = int(match.group('between_min'))
+                result['filters']['max_price'] = int(match.group('between_max'))
+            elif match.group('range_min'):
+                result['filters']['min_price'] = int(match.group('range_min'))
+                result['filters']['max_price'] = int(match.group('range_max'))
+            elif match.group('max'):
+                result['filters']['max_price'] = int(match.group('max'))
+            else:
+                result['filters']['min_price'] = int(match.group('min'))
         
         # Detect intent
-        candidate_labels = ['search', 'compare', 'recommend', 'filter', 'sort']
-        intent_result = self.classifier(query, candidate_labels)
-        result['intent'] = intent_result['labels'][0]
+        intent = self.detect_intent(query)
+        result['intent'] = intent['intent']
+        result['intent_confidence'] = intent['confidence']
         
         # Extract keywords (remove stop words and entities)
         keywords = []
@@ -91,14 +311,14 @@ class NLPService:
         result['keywords'] = keywords
         result['entities'] = entities
         
-        # Create cleaned query (remove price mentions, etc.)
-        cleaned = query.lower()
-        for pattern, _ in price_patterns:
-            cleaned = re.sub(pattern, '', cleaned)
-        for color in entities['colors']:
-            cleaned = cleaned.replace(color, '')
-        for size in entities['sizes']:
-            cleaned = re.sub(r'\b' + size + r'\b', '', cleaned)
+        # Create cleaned query (remove price mentions, colors and sizes)
+        removed = price_spans + [
+            (start, end) for start, end, kinds in spans
+            if 'colors' in kinds or 'sizes' in kinds
+        ]
+        cleaned = query
+        for start, end in sorted(removed, reverse=True):
+            cleaned = cleaned[:start] + ' ' + cleaned[end:]
         
         result['cleaned_query'] = ' '.join(cleaned.split())
         
@@ -109,25 +329,91 @@ class NLPService:
         Analyze sentiment of text (e.g., product reviews)
         Returns: positive, negative, neutral with scores
         """
-        result = self.sentiment_analyzer(text)[0]
+        cached = self.sentiment_cache.get_many([text])[0]
+        if cached is not None:
+            return {**cached, 'text': text}
         
-        return {
+        if self.sentiment_batcher is not None:
+            return self.sentiment_batcher.submit(text).result()
+        
+        result = self.sentiment_analyzer(text)[0]
+        sentiment = {
             'label': result['label'].lower(),
             'score': float(result['score']),
             'text': text
         }
+        self.sentiment_cache.put_many([text], [sentiment])
+        
+        return sentiment
+    
+    def analyze_sentiment_batch(self, texts, batch_size=None):
+        """
+        Analyze sentiment of many texts, running the model only on cache misses
+        Results come back in input order, same format as analyze_sentiment
+        """
+        results = self.sentiment_cache.get_many(texts)
+        
+        # Each distinct uncached text is scored once
+        misses = list(dict.fromkeys(text for text, result in zip(texts, results) if result is None))
+        if misses:
+            scored = self._score_sentiment_batch(misses, batch_size)
+            self.sentiment_cache.put_many(misses, scored)
+            scored = dict(zip(misses, scored))
+        
+        return [
+            {**(result if result is not None else scored[text]), 'text': text}
+            for text, result in zip(texts, results)
+        ]
+    
+    def _score_sentiment_batch(self, texts, batch_size=None):
+        """
+        Batched forward passes over texts
+        Texts are sorted by length so each batch pads only to its own longest text
+        """
+        import torch
+        
+        analyzer = self.sentiment_analyzer
+        tokenizer = analyzer.tokenizer
+        model = analyzer.model
+        id2label = model.config.id2label
+        batch_size = batch_size or self.sentiment_batch_size
+        
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        results = [None] * len(texts)
+        
+        with torch.inference_mode():
+            for start in range(0, len(order), batch_size):
+                indices = order[start:start + batch_size]
+                encoded = tokenizer(
+                    [texts[i] for i in indices],
+                    padding=True,
+                    truncation=True,
+                    max_length=self.sentiment_max_length,
+                    return_tensors='pt'
+                )
+                probabilities = model(**encoded).logits.softmax(dim=-1)
+                scores, labels = probabilities.max(dim=-1)
+                
+                for i, label, score in zip(indices, labels.tolist(), scores.tolist()):
+                    results[i] = {
+                        'label': id2label[label].lower(),
+                        'score': float(score)
+                    }
+        
+        return results
     
     def analyze_review_batch(self, reviews):
         """Analyze sentiment for multiple reviews"""
-        sentiments = []
+        batch = self.analyze_sentiment_batch([review['text'] for review in reviews])
         
-        for review in reviews:
-            sentiment = self.analyze_sentiment(review['text'])
-            sentiments.append({
+        sentiments = [
+            {
                 'review_id': review['id'],
                 'sentiment': sentiment['label'],
                 'score': sentiment['score']
-            })
+            }
+            for review, sentiment in zip(reviews, batch)
+        ]
         
         # Calculate overall sentiment
         positive_count = sum(1 for s in sentiments if s['sentiment'] == 'positive')
@@ -150,8 +436,25 @@ class NLPService:
         """
         Extract structured attributes from product description
         """
-        doc = self.nlp(description)
-        
+        return self._attributes_from_doc(self.nlp(description))
+    
+    def extract_product_attributes_bulk(self, items, batch_size=None, n_process=None):
+        """
+        Extract attributes for many descriptions with nlp.pipe
+        items: iterable of (key, description); yields (key, attributes) in
+        input order. Descriptions are streamed, so items can be a generator
+        over the whole catalog.
+        """
+        docs = self.nlp.pipe(
+            ((description or '', key) for key, description in items),
+            as_tuples=True,
+            batch_size=batch_size or self.pipe_batch_size,
+            n_process=n_process or self.pipe_processes
+        )
+        for doc, key in docs:
+            yield key, self._attributes_from_doc(doc)
+    
+    def _attributes_from_doc(self, doc):
         attributes = {
             'materials': [],
             'colors': [],
@@ -165,32 +468,22 @@ class NLPService:
                 attributes['features'].append(token.text)
         
         # Extract measurements
-        measurement_pattern = r'(\d+\.?\d*)\s*(cm|mm|m|inch|inches|kg|g|ml|l)'
-        matches = re.findall(measurement_pattern, description.lower())
+        matches = MEASUREMENT_PATTERN.findall(doc.text.lower())
         attributes['dimensions'] = [f"{value} {unit}" for value, unit in matches]
         
         return attributes
     
-    def generate_search_suggestions(self, partial_query):
+    def generate_search_suggestions(self, partial_query, limit=5):
         """
         Generate search suggestions based on partial query
+        Completions of the prefix, ranked by catalog and search popularity
         """
-        # This would typically use a trained model or database lookup
-        # For now, simple keyword expansion
-        
-        doc = self.nlp(partial_query.lower())
-        suggestions = []
-        
-        # Add common completions
-        if len(partial_query) >= 2:
-            # In production, this would query a suggestions database
-            # or use a trained model
-            suggestions = [
-                partial_query + " for men",
-                partial_query + " for women",
-                partial_query + " online",
-                "best " + partial_query,
-                partial_query + " with free shipping"
-            ]
-        
-        return suggestions[:5]
\ No newline at end of file
+        return self.suggestions.suggest(partial_query, limit)
+    
+    def record_search(self, query, weight=1.0):
+        """Count a performed search towards its suggestion ranking"""
+        self.suggestions.record(query, weight)
+
+def _peak_rss_mb():
+    # ru_maxrss is reported in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
@@ -0,0 +1,138 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.database import get_redis_connection
+from collections import OrderedDict
+import hashlib
+import json
+import threading
+import time
+
+class SearchQueryCache:
+    """
+    Cache of parsed search queries keyed on their normalized form
+
+    "Black  Shoes under 2000" and "black shoes under 2000" share an entry.
+    Values are stored as JSON so every hit returns a fresh copy.
+
+    backend: 'memory' (per-process LRU) or 'redis' (shared between workers)
+    """
+
+    KEY_PREFIX = 'nlp:search:'
+
+    def __init__(self, backend=None, ttl_seconds=None, max_entries=None):
+        self.backend = backend or os.getenv('NLP_SEARCH_CACHE', 'memory')
+        self.ttl_seconds = ttl_seconds or int(os.getenv('NLP_SEARCH_CACHE_TTL', 3600))
+        self.max_entries = max_entries or int(os.getenv('NLP_SEARCH_CACHE_SIZE', 50000))
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = None
+        self.hits = 0
+        self.misses = 0
+
+        if self.backend == 'redis':
+            try:
+                self._redis = get_redis_connection()
+                self._redis.ping()
+            except Exception as e:
+                print(f"Error connecting search cache to Redis, using memory: {e}")
+                self.backend = 'memory'
+                self._redis = None
+
+    @staticmethod
+    def normalize(query):
+        """Case-folded, whitespace-collapsed form of a query"""
+        return ' '.join(str(query).casefold().split())
+
+    def get(self, normalized_query):
+        """Return the cached result for a normalized query, or None on a miss"""
+        if self._redis is not None:
+            value = self._redis_get(normalized_query)
+        else:
+            value = None
+            now = time.monotonic()
+            with self._lock:
+                item = self._entries.get(normalized_query)
+                if item is not None:
+                    expires_at, value = item
+                    if expires_at < now:
+                        del self._entries[normalized_query]
+                        value = None
+                    else:
+                        self._entries.move_to_end(normalized_query)
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return json.loads(value) if value is not None else None
+
+    def put(self, normalized_query, result):
+        """Store the parsed result for a normalized query"""
+        value = json.dumps(result)
+
+        if self._redis is not None:
+            try:
+                self._redis.set(self._key(normalized_query), value, ex=self.ttl_seconds)
+            except Exception as e:
+                print(f"Error writing search cache to Redis: {e}")
+            return
+
+        with self._lock:
+            self._entries[normalized_query] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(normalized_query)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def contains(self, normalized_query):
+        """Whether a query is cached, without counting a hit or miss"""
+        if self._redis is not None:
+            try:
+                return bool(self._redis.exists(self._key(normalized_query)))
+            except Exception:
+                return False
+
+        with self._lock:
+            item = self._entries.get(normalized_query)
+            return item is not None and item[0] >= time.monotonic()
+
+    def clear(self):
+        """Drop every cached query, e.g. after the parsing vocabulary changes"""
+        if self._redis is not None:
+            try:
+                keys = list(self._redis.scan_iter(match=self.KEY_PREFIX + '*', count=1000))
+                for start in range(0, len(keys), 1000):
+                    self._redis.delete(*keys[start:start + 1000])
+            except Exception as e:
+                print(f"Error clearing search cache in Redis: {e}")
+            return
+
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Hit/miss counters of this process"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': self.backend,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'size': len(self._entries) if self._redis is None else None
+            }
+
+    def _key(self, normalized_query):
+        # Hashed so arbitrary user input never ends up in key names
+        return self.KEY_PREFIX + hashlib.sha1(normalized_query.encode('utf-8')).hexdigest()
+
+    def _redis_get(self, normalized_query):
+        try:
+            return self._redis.get(self._key(normalized_query))
+        except Exception as e:
+            print(f"Error reading search cache from Redis: {e}")
+            return None
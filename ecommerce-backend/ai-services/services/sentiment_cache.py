@@ -0,0 +1,190 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.database import get_redis_connection
+from collections import OrderedDict
+import hashlib
+import json
+import sqlite3
+import threading
+
+class SentimentCache:
+    """
+    Sentiment results keyed by a hash of the model version and the text
+
+    Review texts don't change once posted, so a score is valid for as long
+    as the model that produced it. Keys include the model version, so an
+    upgrade (or a different inference backend) never serves stale scores.
+    A per-process LRU sits in front of the persistent store.
+
+    backend: 'memory' (LRU only), 'redis' (shared between workers),
+    'sqlite' (a local file that survives restarts) or 'off'
+    """
+
+    KEY_PREFIX = 'nlp:sentiment:'
+    SQLITE_CHUNK = 500
+
+    def __init__(self, model_version, backend=None, max_entries=None, sqlite_path=None):
+        self.model_version = model_version
+        self.backend = backend or os.getenv('NLP_SENTIMENT_CACHE', 'memory')
+        self.max_entries = max_entries or int(os.getenv('NLP_SENTIMENT_CACHE_SIZE', 100000))
+        # Redis only; bounds memory for reviews that are never read again
+        self.ttl_seconds = int(os.getenv('NLP_SENTIMENT_CACHE_TTL', 30 * 86400))
+        self.sqlite_path = sqlite_path or os.getenv(
+            'NLP_SENTIMENT_CACHE_DB', 'models/saved_models/sentiment_cache.db'
+        )
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = None
+        self._sqlite = None
+        self.hits = 0
+        self.misses = 0
+
+        if self.backend == 'redis':
+            try:
+                self._redis = get_redis_connection()
+                self._redis.ping()
+            except Exception as e:
+                print(f"Error connecting sentiment cache to Redis, using memory: {e}")
+                self.backend = 'memory'
+                self._redis = None
+        elif self.backend == 'sqlite':
+            self._open_sqlite()
+
+    def reopen(self):
+        """
+        Open a fresh SQLite connection; call in each worker after a fork,
+        since a SQLite connection must not be used by two processes
+        """
+        if self._sqlite is not None:
+            self._lock = threading.Lock()
+            self._open_sqlite()
+
+    def key(self, text):
+        normalized = ' '.join(str(text).split())
+        return hashlib.sha1(f'{self.model_version}\0{normalized}'.encode('utf-8')).hexdigest()
+
+    def get_many(self, texts):
+        """Return a list aligned with texts: {'label', 'score'} or None on a miss"""
+        if self.backend == 'off':
+            return [None] * len(texts)
+
+        keys = [self.key(text) for text in texts]
+        results = [None] * len(keys)
+        missing = []
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                value = self._entries.get(key)
+                if value is not None:
+                    self._entries.move_to_end(key)
+                    results[i] = dict(value)
+                else:
+                    missing.append(i)
+
+        if missing and self.backend != 'memory':
+            stored = self._store_get([keys[i] for i in missing])
+            found = {}
+            for i in missing:
+                value = stored.get(keys[i])
+                if value is not None:
+                    results[i] = dict(value)
+                    found[keys[i]] = value
+            self._remember(found)
+
+        with self._lock:
+            hits = sum(1 for result in results if result is not None)
+            self.hits += hits
+            self.misses += len(results) - hits
+
+        return results
+
+    def put_many(self, texts, results):
+        """Store {'label', 'score'} for each text"""
+        if self.backend == 'off':
+            return
+
+        values = {
+            self.key(text): {'label': result['label'], 'score': result['score']}
+            for text, result in zip(texts, results)
+        }
+        if not values:
+            return
+
+        self._remember(values)
+        if self.backend != 'memory':
+            self._store_put(values)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': self.backend,
+                'model_version': self.model_version,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'local_size': len(self._entries)
+            }
+
+    def _open_sqlite(self):
+        try:
+            os.makedirs(os.path.dirname(self.sqlite_path), exist_ok=True)
+            self._sqlite = sqlite3.connect(self.sqlite_path, check_same_thread=False)
+            self._sqlite.execute('PRAGMA journal_mode=WAL')
+            self._sqlite.execute(
+                'CREATE TABLE IF NOT EXISTS sentiment (key TEXT PRIMARY KEY, label TEXT, score REAL)'
+            )
+            self._sqlite.commit()
+        except Exception as e:
+            print(f"Error opening sentiment cache database, using memory: {e}")
+            self.backend = 'memory'
+            self._sqlite = None
+
+    def _remember(self, values):
+        with self._lock:
+            for key, value in values.items():
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _store_get(self, keys):
+        try:
+            if self._redis is not None:
+                rows = self._redis.mget([self.KEY_PREFIX + key for key in keys])
+                return {key: json.loads(row) for key, row in zip(keys, rows) if row}
+
+            found = {}
+            with self._lock:
+                for start in range(0, len(keys), self.SQLITE_CHUNK):
+                    chunk = keys[start:start + self.SQLITE_CHUNK]
+                    rows = self._sqlite.execute(
+                        f"SELECT key, label, score FROM sentiment WHERE key IN ({','.join('?' * len(chunk))})",
+                        chunk
+                    ).fetchall()
+                    found.update({key: {'label': label, 'score': score} for key, label, score in rows})
+            return found
+        except Exception as e:
+            print(f"Error reading sentiment cache: {e}")
+            return {}
+
+    def _store_put(self, values):
+        try:
+            if self._redis is not None:
+                pipe = self._redis.pipeline(transaction=False)
+                for key, value in values.items():
+                    pipe.set(self.KEY_PREFIX + key, json.dumps(value), ex=self.ttl_seconds or None)
+                pipe.execute()
+                return
+
+            with self._lock:
+                self._sqlite.executemany(
+                    'INSERT OR REPLACE INTO sentiment (key, label, score) VALUES (?, ?, ?)',
+                    [(key, value['label'], value['score']) for key, value in values.items()]
+                )
+                self._sqlite.commit()
+        except Exception as e:
+            print(f"Error writing sentiment cache: {e}")
@@ -0,0 +1,209 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.helpers import new_build_id, read_snapshot, read_snapshot_build, try_lock_file, write_snapshot
+import bisect
+import math
+import threading
+import time
+
+class SuggestionIndex:
+    """
+    Prefix index for search autocomplete
+
+    Phrases (product names, categories, brands, logged queries) are kept in
+    a sorted array with a popularity weight each. Every prefix up to
+    `prefix_len` characters has its top-k completions precomputed, so the
+    short prefixes typeahead sends most are a single dict lookup. Longer
+    prefixes bisect the sorted array and rank the few phrases in range.
+    """
+
+    def __init__(self, top_k=10, prefix_len=None, snapshot_path=None, snapshot_interval=None,
+                 max_record_weight=None):
+        self.top_k = top_k
+        self.prefix_len = prefix_len or int(os.getenv('SUGGEST_PREFIX_LEN', 8))
+        # Cap on one record() call, so a single request can't pin a phrase to the top
+        self.max_record_weight = max_record_weight or float(os.getenv('SUGGEST_MAX_RECORD_WEIGHT', 10))
+        self.snapshot_path = snapshot_path or os.getenv(
+            'SUGGEST_SNAPSHOT', 'models/saved_models/suggestions.pkl'
+        )
+        self.snapshot_interval = snapshot_interval or int(os.getenv('SUGGEST_SNAPSHOT_INTERVAL', 300))
+
+        self.phrases = []
+        self.weights = {}
+        self.top = {}
+
+        self._lock = threading.Lock()
+        # Which offline build the in-memory index descends from (None: empty)
+        self.build_id = None
+        # Set by record(), so lookups alone don't rewrite the snapshot
+        self._changed = False
+        self._last_snapshot = time.monotonic()
+        self._snapshot_running = False
+        self._writer_lock = None
+
+    @staticmethod
+    def normalize(text):
+        return ' '.join(str(text).casefold().split())
+
+    def build(self, weighted_phrases):
+        """Rebuild from (phrase, weight) pairs; weights of repeated phrases add up"""
+        weights = {}
+        for phrase, weight in weighted_phrases:
+            phrase = self.normalize(phrase)
+            if phrase:
+                weights[phrase] = weights.get(phrase, 0.0) + float(weight)
+
+        top = {}
+        # Heaviest first, so each prefix list fills in rank order
+        for phrase in sorted(weights, key=lambda p: (-weights[p], p)):
+            for end in range(1, min(len(phrase), self.prefix_len) + 1):
+                completions = top.setdefault(phrase[:end], [])
+                if len(completions) < self.top_k:
+                    completions.append(phrase)
+
+        with self._lock:
+            self.phrases = sorted(weights)
+            self.weights = weights
+            self.top = top
+
+    def suggest(self, prefix, limit=5):
+        """Return up to `limit` completions of a prefix, most popular first"""
+        self._maybe_snapshot()
+
+        prefix = self.normalize(prefix)
+        if not prefix:
+            return []
+        limit = max(1, min(limit, self.top_k))
+
+        if len(prefix) <= self.prefix_len:
+            return self.top.get(prefix, [])[:limit]
+
+        phrases = self.phrases
+        start = bisect.bisect_left(phrases, prefix)
+        end = bisect.bisect_left(phrases, prefix[:-1] + chr(ord(prefix[-1]) + 1), start)
+        return sorted(phrases[start:end], key=lambda p: (-self.weights.get(p, 0.0), p))[:limit]
+
+    def record(self, phrase, weight=1.0):
+        """
+        Add weight to a phrase (e.g. a logged query), inserting it if new
+        Weights only grow here, so a phrase can only move up in the lists of
+        its prefixes and the other entries stay valid; a weight that is not a
+        positive finite number raises ValueError, and large ones are capped
+        at max_record_weight
+        """
+        weight = float(weight)
+        if not math.isfinite(weight) or weight <= 0:
+            raise ValueError(f'weight must be a positive number, got {weight}')
+        weight = min(weight, self.max_record_weight)
+
+        phrase = self.normalize(phrase)
+        if not phrase:
+            return
+
+        with self._lock:
+            if phrase not in self.weights:
+                bisect.insort(self.phrases, phrase)
+            new_weight = self.weights.get(phrase, 0.0) + weight
+            self.weights[phrase] = new_weight
+
+            for end in range(1, min(len(phrase), self.prefix_len) + 1):
+                prefix = phrase[:end]
+                completions = self.top.get(prefix, [])
+                if phrase not in completions:
+                    if len(completions) >= self.top_k and self.weights[completions[-1]] >= new_weight:
+                        continue
+                    completions = completions + [phrase]
+                else:
+                    completions = list(completions)
+                completions.sort(key=lambda p: (-self.weights[p], p))
+                # Readers see either the old or the new list, never a partial sort
+                self.top[prefix] = completions[:self.top_k]
+            self._changed = True
+
+        self._maybe_snapshot()
+
+    def save_snapshot(self, filepath=None, rebuilt=False, replace_other_builds=True):
+        """
+        Write the index to disk (atomically replaces the previous snapshot)
+        rebuilt: the index was built from scratch (train.py); it gets a new
+        build id, which running servers pick up instead of overwriting
+        replace_other_builds: False skips the write if the file holds a
+        different build; returns whether it was written
+        """
+        filepath = filepath or self.snapshot_path
+        if rebuilt:
+            self.build_id = new_build_id()
+
+        # Copy under the lock, pickle outside it so lookups aren't blocked;
+        # prefix lists are replaced, never changed in place, so sharing them is safe
+        with self._lock:
+            state = {
+                'top_k': self.top_k,
+                'prefix_len': self.prefix_len,
+                'phrases': list(self.phrases),
+                'weights': dict(self.weights),
+                'top': dict(self.top)
+            }
+
+        return write_snapshot(filepath, self.build_id, state, replace_other_builds)
+
+    def load_snapshot(self, filepath=None):
+        """Load an index written by save_snapshot"""
+        filepath = filepath or self.snapshot_path
+
+        build_id, data = read_snapshot(filepath)
+
+        with self._lock:
+            self.build_id = build_id
+            self.top_k = data['top_k']
+            self.prefix_len = data['prefix_len']
+            self.phrases = data['phrases']
+            self.weights = data['weights']
+            self.top = data['top']
+
+    def after_fork(self):
+        """Reset snapshot state inherited from the parent of a forked worker"""
+        # The parent's snapshot thread (if any) didn't survive the fork
+        self._snapshot_running = False
+        self._last_snapshot = time.monotonic()
+        self._writer_lock = None
+
+    def _maybe_snapshot(self):
+        """
+        Save a snapshot in the background once the interval has passed
+        Of the processes sharing the snapshot file (pre-forked workers), only
+        the one holding its lock file writes; another takes over when that
+        process exits. A snapshot from a newer offline build is loaded
+        instead of being overwritten.
+        """
+        if self._snapshot_running or time.monotonic() - self._last_snapshot < self.snapshot_interval:
+            return
+
+        self._last_snapshot = time.monotonic()
+        if self._writer_lock is None:
+            self._writer_lock = try_lock_file(f'{self.snapshot_path}.lock')
+
+        self._snapshot_running = True
+
+        def run():
+            try:
+                if self._writer_lock is not None and self._changed:
+                    self._changed = False
+                    current = self.save_snapshot(replace_other_builds=False)
+                else:
+                    current = read_snapshot_build(self.snapshot_path) == self.build_id
+                if not current:
+                    self.load_snapshot()
+                    print(f"Loaded rebuilt suggestion index snapshot {self.build_id}")
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"Error syncing suggestion index snapshot: {e}")
+                # Try the write again next interval
+                self._changed = True
+            finally:
+                self._snapshot_running = False
+
+        threading.Thread(target=run, daemon=True).start()
@@ -0,0 +1,184 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.database import get_redis_connection
+from utils.helpers import to_utc, utc_now
+from collections import OrderedDict
+import threading
+import time
+
+class UserFeatureStore:
+    """
+    Cache of per-user risk features used by fraud checks
+
+    Each entry holds order_count, last_order_time and registration_date.
+    Entries are loaded from Postgres on a miss, kept for a TTL, and updated
+    incrementally from order-created events so that hot users never hit SQL.
+    Timestamps are stored as naive UTC datetimes.
+
+    backend: 'memory' (per-process) or 'redis' (shared between workers)
+    """
+
+    KEY_PREFIX = 'fraud:user_features:'
+
+    def __init__(self, backend=None, ttl_seconds=None, max_entries=100000):
+        self.backend = backend or os.getenv('FRAUD_FEATURE_STORE', 'memory')
+        self.ttl_seconds = ttl_seconds or int(os.getenv('FRAUD_FEATURE_TTL', 3600))
+        self.max_entries = max_entries
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = None
+
+        if self.backend == 'redis':
+            try:
+                self._redis = get_redis_connection()
+                self._redis.ping()
+            except Exception as e:
+                print(f"Error connecting feature store to Redis, using memory: {e}")
+                self.backend = 'memory'
+                self._redis = None
+
+    def get(self, user_id):
+        """Return cached features for a user, or None on a miss"""
+        return self.get_many([user_id]).get(user_id)
+
+    def get_many(self, user_ids):
+        """Return {user_id: features} for the users that are cached"""
+        if self._redis is not None:
+            return self._redis_get_many(user_ids)
+
+        found = {}
+        now = time.monotonic()
+        with self._lock:
+            for user_id in user_ids:
+                item = self._entries.get(user_id)
+                if item is None:
+                    continue
+                expires_at, features = item
+                if expires_at < now:
+                    del self._entries[user_id]
+                    continue
+                self._entries.move_to_end(user_id)
+                found[user_id] = dict(features)
+        return found
+
+    def put(self, user_id, order_count, last_order_time, registration_date):
+        """Store the full feature set for a user (e.g. after a SQL lookup)"""
+        features = {
+            'order_count': int(order_count or 0),
+            'last_order_time': to_utc(last_order_time),
+            'registration_date': to_utc(registration_date)
+        }
+
+        if self._redis is not None:
+            self._redis_put(user_id, features)
+            return
+
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl_seconds, features)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record_order(self, user_id, created_at=None):
+        """
+        Apply an order-created event to a cached user
+
+        Only users already in the store are updated; a miss is left alone so
+        the next lookup reloads exact values from the database.
+        last_order_time only moves forward, so late events don't rewind it.
+        """
+        created_at = to_utc(created_at) or utc_now()
+
+        if self._redis is not None:
+            self._redis_record_order(user_id, created_at)
+            return
+
+        with self._lock:
+            item = self._entries.get(user_id)
+            if item is None:
+                return
+            expires_at, features = item
+            features['order_count'] += 1
+            last_order_time = features['last_order_time']
+            if last_order_time is None or created_at > last_order_time:
+                features['last_order_time'] = created_at
+
+    def invalidate(self, user_id):
+        """Drop a user so the next lookup goes back to the database"""
+        if self._redis is not None:
+            try:
+                self._redis.delete(self.KEY_PREFIX + str(user_id))
+            except Exception as e:
+                print(f"Error invalidating user features: {e}")
+            return
+
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def _redis_get_many(self, user_ids):
+        try:
+            pipe = self._redis.pipeline(transaction=False)
+            for user_id in user_ids:
+                pipe.hgetall(self.KEY_PREFIX + str(user_id))
+            rows = pipe.execute()
+        except Exception as e:
+            print(f"Error reading user features from Redis: {e}")
+            return {}
+
+        return {
+            user_id: self._decode(row)
+            for user_id, row in zip(user_ids, rows)
+            if row
+        }
+
+    def _redis_put(self, user_id, features):
+        key = self.KEY_PREFIX + str(user_id)
+        try:
+            pipe = self._redis.pipeline()
+            pipe.delete(key)
+            pipe.hset(key, mapping=self._encode(features))
+            pipe.expire(key, self.ttl_seconds)
+            pipe.execute()
+        except Exception as e:
+            print(f"Error writing user features to Redis: {e}")
+
+    def _redis_record_order(self, user_id, created_at):
+        key = self.KEY_PREFIX + str(user_id)
+        created_at = created_at.isoformat(timespec='microseconds')
+
+        def update(pipe):
+            # WATCH makes the exists check and the update one transaction: if
+            # the key expires or is rewritten in between, EXEC fails and we retry
+            if not pipe.exists(key):
+                return
+            last_order_time = pipe.hget(key, 'last_order_time')
+            ttl_ms = pipe.pttl(key)
+
+            pipe.multi()
+            pipe.hincrby(key, 'order_count', 1)
+            # Out-of-order events must not move the last order back in time
+            if not last_order_time or created_at > last_order_time:
+                pipe.hset(key, 'last_order_time', created_at)
+            pipe.pexpire(key, ttl_ms if ttl_ms > 0 else self.ttl_seconds * 1000)
+
+        try:
+            self._redis.transaction(update, key)
+        except Exception as e:
+            print(f"Error updating user features in Redis: {e}")
+
+    def _encode(self, features):
+        return {
+            'order_count': features['order_count'],
+            'last_order_time': features['last_order_time'].isoformat(timespec='microseconds') if features['last_order_time'] else '',
+            'registration_date': features['registration_date'].isoformat(timespec='microseconds') if features['registration_date'] else ''
+        }
+
+    def _decode(self, row):
+        return {
+            'order_count': int(row.get('order_count', 0)),
+            'last_order_time': to_utc(row.get('last_order_time')),
+            'registration_date': to_utc(row.get('registration_date'))
+        }
@@ -0,0 +1,276 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.database import get_redis_connection
+from collections import OrderedDict
+import threading
+import time
+
+# window name -> (bucket size in seconds, number of buckets)
+WINDOWS = {
+    '1m': (1, 60),
+    '1h': (60, 60),
+    '24h': (900, 96)
+}
+
+DIMENSIONS = ['user', 'payment', 'address']
+
+# Longest window; recorded orders are remembered this long, idle keys dropped after it
+HORIZON_SECONDS = max(bucket_seconds * num_buckets for bucket_seconds, num_buckets in WINDOWS.values())
+
+class _RingWindow:
+    """
+    Bucketed ring of counts and amount sums for one key and one window
+
+    Running totals are kept alongside the buckets, so a query is O(1) and an
+    update only clears the buckets that expired since the last touch.
+    """
+
+    __slots__ = ('bucket_seconds', 'num_buckets', 'counts', 'sums', 'head', 'total_count', 'total_sum')
+
+    def __init__(self, bucket_seconds, num_buckets):
+        self.bucket_seconds = bucket_seconds
+        self.num_buckets = num_buckets
+        self.counts = [0] * num_buckets
+        self.sums = [0.0] * num_buckets
+        self.head = None
+        self.total_count = 0
+        self.total_sum = 0.0
+
+    def advance(self, now):
+        bucket = int(now // self.bucket_seconds)
+
+        if self.head is None or bucket - self.head >= self.num_buckets:
+            self.counts = [0] * self.num_buckets
+            self.sums = [0.0] * self.num_buckets
+            self.total_count = 0
+            self.total_sum = 0.0
+        elif bucket > self.head:
+            for b in range(self.head + 1, bucket + 1):
+                idx = b % self.num_buckets
+                self.total_count -= self.counts[idx]
+                self.total_sum -= self.sums[idx]
+                self.counts[idx] = 0
+                self.sums[idx] = 0.0
+
+        if self.head is None or bucket > self.head:
+            self.head = bucket
+
+    def add(self, now, amount):
+        self.advance(now)
+        idx = self.head % self.num_buckets
+        self.counts[idx] += 1
+        self.sums[idx] += amount
+        self.total_count += 1
+        self.total_sum += amount
+
+class VelocityEngine:
+    """
+    Sliding-window transaction velocity per user, payment method and address
+
+    Tracks transaction count and amount sum for every window in WINDOWS.
+    backend: 'memory' (per-process ring counters) or 'redis' (bucket hashes
+    shared between workers, one pipelined round trip per check)
+
+    Transactions recorded with an order_id are counted at most once, so a
+    redelivered event or an order checked twice doesn't inflate the windows.
+    """
+
+    KEY_PREFIX = 'fraud:velocity:'
+
+    def __init__(self, backend=None, sweep_every=10000, max_recorded_orders=200000):
+        self.backend = backend or os.getenv('FRAUD_VELOCITY_BACKEND', 'memory')
+        self.sweep_every = sweep_every
+        self.max_recorded_orders = max_recorded_orders
+
+        self._rings = {}
+        self._recorded_orders = OrderedDict()
+        self._lock = threading.Lock()
+        self._updates = 0
+        self._redis = None
+
+        if self.backend == 'redis':
+            try:
+                self._redis = get_redis_connection()
+                self._redis.ping()
+            except Exception as e:
+                print(f"Error connecting velocity engine to Redis, using memory: {e}")
+                self.backend = 'memory'
+                self._redis = None
+
+    def record(self, keys, amount, now=None, order_id=None):
+        """
+        Count a transaction and return the velocity snapshot including it
+        keys: {dimension: key}, e.g. {'user': user_id, 'address': address_hash}
+        order_id: if this order was already recorded, nothing is counted and
+        the current snapshot is returned
+        """
+        now = now or time.time()
+        keys = {dim: key for dim, key in keys.items() if key}
+
+        if self._redis is not None:
+            if order_id is not None and not self._redis_mark_order(order_id):
+                return self._redis_update(keys, 0.0, now, record=False)
+            return self._redis_update(keys, float(amount), now, record=True)
+
+        with self._lock:
+            if order_id is not None and not self._mark_order(order_id, now):
+                return self._snapshot(keys, now)
+
+            for dim, key in keys.items():
+                for ring in self._get_rings(dim, key):
+                    ring.add(now, float(amount))
+
+            self._updates += 1
+            if self._updates % self.sweep_every == 0:
+                self._sweep(now)
+
+            return self._snapshot(keys, now)
+
+    def peek(self, keys, now=None):
+        """Return the velocity snapshot for keys without counting anything"""
+        now = now or time.time()
+        keys = {dim: key for dim, key in keys.items() if key}
+
+        if self._redis is not None:
+            return self._redis_update(keys, 0.0, now, record=False)
+
+        with self._lock:
+            return self._snapshot(keys, now)
+
+    def recorded(self, order_ids, now=None):
+        """The subset of order_ids that are already counted in the windows"""
+        order_ids = [order_id for order_id in order_ids if order_id is not None]
+        if not order_ids:
+            return set()
+
+        if self._redis is not None:
+            try:
+                markers = self._redis.mget([f'{self.KEY_PREFIX}order:{order_id}' for order_id in order_ids])
+            except Exception as e:
+                print(f"Error reading recorded orders from Redis: {e}")
+                return set()
+            return {order_id for order_id, marker in zip(order_ids, markers) if marker is not None}
+
+        horizon = (now or time.time()) - HORIZON_SECONDS
+        with self._lock:
+            return {
+                order_id for order_id in order_ids
+                if self._recorded_orders.get(order_id, horizon) > horizon
+            }
+
+    def _mark_order(self, order_id, now):
+        """Remember order_id; False if it was already recorded (caller holds the lock)"""
+        recorded = self._recorded_orders
+        while recorded and (
+            len(recorded) >= self.max_recorded_orders
+            or next(iter(recorded.values())) < now - HORIZON_SECONDS
+        ):
+            recorded.popitem(last=False)
+
+        if order_id in recorded:
+            return False
+        recorded[order_id] = now
+        return True
+
+    def _redis_mark_order(self, order_id):
+        """SET NX marker shared by all workers; False if the order was already recorded"""
+        try:
+            return bool(self._redis.set(
+                f'{self.KEY_PREFIX}order:{order_id}', 1, nx=True, ex=HORIZON_SECONDS
+            ))
+        except Exception as e:
+            # Better to risk a double count than to drop the transaction
+            print(f"Error marking recorded order in Redis: {e}")
+            return True
+
+    def _get_rings(self, dim, key):
+        rings = self._rings.get((dim, key))
+        if rings is None:
+            rings = [
+                _RingWindow(bucket_seconds, num_buckets)
+                for bucket_seconds, num_buckets in WINDOWS.values()
+            ]
+            self._rings[(dim, key)] = rings
+        return rings
+
+    def _snapshot(self, keys, now):
+        snapshot = self._empty_snapshot()
+
+        for dim, key in keys.items():
+            rings = self._rings.get((dim, key))
+            if rings is None:
+                continue
+            for window, ring in zip(WINDOWS, rings):
+                ring.advance(now)
+                snapshot[f'{dim}_count_{window}'] = ring.total_count
+                snapshot[f'{dim}_amount_{window}'] = round(ring.total_sum, 2)
+
+        return snapshot
+
+    def _sweep(self, now):
+        """Drop keys that have been idle for longer than the largest window"""
+        idle = [
+            key for key, rings in self._rings.items()
+            if (now - rings[-1].head * rings[-1].bucket_seconds) > HORIZON_SECONDS
+        ]
+        for key in idle:
+            del self._rings[key]
+
+    def _empty_snapshot(self):
+        snapshot = {}
+        for dim in DIMENSIONS:
+            for window in WINDOWS:
+                snapshot[f'{dim}_count_{window}'] = 0
+                snapshot[f'{dim}_amount_{window}'] = 0.0
+        return snapshot
+
+    def _redis_update(self, keys, amount, now, record):
+        snapshot = self._empty_snapshot()
+        plan = []
+
+        try:
+            pipe = self._redis.pipeline(transaction=False)
+            for dim, key in keys.items():
+                for window, (bucket_seconds, num_buckets) in WINDOWS.items():
+                    redis_key = f'{self.KEY_PREFIX}{dim}:{key}:{window}'
+                    bucket = int(now // bucket_seconds)
+                    if record:
+                        pipe.hincrby(redis_key, f'c:{bucket}', 1)
+                        pipe.hincrbyfloat(redis_key, f'a:{bucket}', amount)
+                        pipe.expire(redis_key, bucket_seconds * (num_buckets + 1))
+                    pipe.hgetall(redis_key)
+                    plan.append((dim, window, redis_key, bucket, num_buckets))
+            results = pipe.execute()
+        except Exception as e:
+            print(f"Error reading velocity from Redis: {e}")
+            return snapshot
+
+        # Each window contributes 4 replies when recording, 1 when peeking
+        step = 4 if record else 1
+        stale = []
+        for (dim, window, redis_key, bucket, num_buckets), i in zip(plan, range(step - 1, len(results), step)):
+            count = 0
+            total = 0.0
+            for field, value in results[i].items():
+                kind, field_bucket = field.split(':')
+                if bucket - int(field_bucket) >= num_buckets:
+                    stale.append((redis_key, field))
+                elif kind == 'c':
+                    count += int(value)
+                else:
+                    total += float(value)
+            snapshot[f'{dim}_count_{window}'] = count
+            snapshot[f'{dim}_amount_{window}'] = round(total, 2)
+
+        if stale:
+            try:
+                pipe = self._redis.pipeline(transaction=False)
+                for redis_key, field in stale:
+                    pipe.hdel(redis_key, field)
+                pipe.execute()
+            except Exception as e:
+                print(f"Error pruning velocity buckets: {e}")
+
+        return snapshot
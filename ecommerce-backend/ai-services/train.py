@@ -3,9 +3,29 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from models.recommendation_model import CollaborativeFilteringModel, ContentBasedModel
-from config.database import get_db_connection
+from models.fraud_detection_model import FraudDetectionModel
+from models.intent_model import IntentModel, INTENT_LABELS
+from services.fraud_ring_index import FraudRingIndex, link_keys
+from services.suggestion_index import SuggestionIndex
+from config.database import get_db_connection, get_recent_search_queries
+from utils.helpers import hash_address, payment_fingerprint
 import pandas as pd
 import numpy as np
+from datetime import datetime, timedelta, timezone
+import json
+import resource
+import time
+
+FRAUD_CHUNK_SIZE = int(os.getenv('FRAUD_TRAINING_CHUNK_SIZE', 100000))
+FRAUD_HISTORY_DAYS = int(os.getenv('FRAUD_TRAINING_DAYS', 365))
+# Rows bootstrapped per random forest tree, caps fit time on large histories
+FRAUD_RF_MAX_SAMPLES = int(os.getenv('FRAUD_RF_MAX_SAMPLES', 1000000))
+# Distinct logged search queries labelled by the zero-shot teacher
+INTENT_TRAINING_QUERIES = int(os.getenv('INTENT_TRAINING_QUERIES', 20000))
+# Autocomplete popularity: one logged search counts as much as one sale,
+# a product view as a hundredth of one
+SUGGEST_QUERY_WEIGHT = 1.0
+SUGGEST_VIEW_WEIGHT = 0.01
 
 def fetch_interaction_data():
     """Fetch user interaction data from database"""
@@ -109,6 +129,361 @@ def train_content_based():
     
     return cb_model
 
+def _history_start(days):
+    """Start of the fraud training window"""
+    return datetime.now(timezone.utc) - timedelta(days=days)
+
+def load_prior_order_history(since):
+    """
+    Per-user order count and last order time (epoch seconds) from orders
+    before `since`, so history features of the training window count a
+    user's whole history, as serving does
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT user_id, COUNT(*), EXTRACT(EPOCH FROM MAX(created_at))
+        FROM orders
+        WHERE created_at < %s
+        GROUP BY user_id
+    """, (since,))
+    rows = cursor.fetchall()
+    cursor.close()
+    conn.close()
+    
+    prior = pd.DataFrame(rows, columns=['user_id', 'order_count', 'last_order_seconds'])
+    return prior.set_index('user_id')
+
+def stream_order_history(chunk_size=FRAUD_CHUNK_SIZE, days=FRAUD_HISTORY_DAYS, since=None):
+    """
+    Stream historical orders in created_at order, one DataFrame per chunk
+    Covers the last `days` days, or everything from `since` when given.
+    Uses a server-side cursor so the full history never sits in memory.
+    Orders cancelled with a reason mentioning fraud are labelled as fraud.
+    shipping_address comes back as canonical JSONB text, so identical
+    addresses compare equal and can be hashed once per distinct value.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor(name='fraud_training_orders')
+    cursor.itersize = chunk_size
+    
+    cursor.execute("""
+        SELECT 
+            o.id as order_id,
+            o.user_id,
+            o.final_amount as amount,
+            COALESCE(i.num_items, 1) as num_items,
+            o.payment_method,
+            o.shipping_address::text as shipping_address,
+            o.created_at as timestamp,
+            u.created_at as registration_date,
+            COALESCE(o.cancel_reason ILIKE '%%fraud%%', false) as is_fraud
+        FROM orders o
+        JOIN users u ON u.id = o.user_id
+        LEFT JOIN (
+            SELECT order_id, SUM(quantity) as num_items
+            FROM order_items
+            GROUP BY order_id
+        ) i ON i.order_id = o.id
+        WHERE o.created_at >= %s
+        ORDER BY o.created_at
+    """, (since or _history_start(days),))
+    
+    columns = [
+        'order_id', 'user_id', 'amount', 'num_items', 'payment_method',
+        'shipping_address', 'timestamp', 'registration_date', 'is_fraud'
+    ]
+    
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield pd.DataFrame(rows, columns=columns)
+    finally:
+        cursor.close()
+        conn.close()
+
+def _window_stats(keys, seconds, amounts, window_seconds):
+    """
+    Count and amount sum of strictly earlier rows with the same key inside
+    (t - window, t], for every row; vectorized with one sort + searchsorted
+    The row itself is not counted, matching VelocityEngine.peek at serving
+    time, which scores a transaction before recording it.
+    """
+    codes = pd.factorize(keys)[0].astype(np.int64)
+    composite = (codes << 32) + seconds
+    order = np.argsort(composite, kind='stable')
+    sorted_keys = composite[order]
+    
+    positions = np.arange(len(order))
+    left = np.searchsorted(sorted_keys, sorted_keys - window_seconds, side='right')
+    
+    cumulative = np.concatenate([[0.0], np.cumsum(amounts[order])])
+    
+    counts = np.empty(len(order), dtype=np.int32)
+    sums = np.empty(len(order), dtype=np.float64)
+    counts[order] = positions - left
+    sums[order] = cumulative[positions] - cumulative[left]
+    
+    # Rows without a key (e.g. no address) get no velocity
+    counts[codes < 0] = 0
+    sums[codes < 0] = 0.0
+    
+    return counts, sums
+
+def _hash_column(values, hash_fn, parse=None):
+    """
+    hash_fn over a column, called once per distinct value
+    parse: applied to each distinct value first (e.g. json.loads)
+    """
+    codes, uniques = pd.factorize(values)
+    hashed = np.array(
+        [hash_fn(parse(value) if parse else value) for value in uniques] + [None],
+        dtype=object
+    )
+    # Missing values have code -1, which picks the trailing None
+    return hashed[codes]
+
+class _FraudFeatureBuilder:
+    """
+    Builds fraud training features chunk by chunk
+    Carries per-user order counts and last order times across chunks, and a
+    24 h tail of rows so velocity windows span chunk boundaries.
+    prior: load_prior_order_history() output, to continue from orders
+    before the training window
+    """
+    
+    def __init__(self, prior=None):
+        self.user_order_counts = pd.Series(dtype=np.int64)
+        self.user_last_order = pd.Series(dtype=np.float64)
+        if prior is not None and len(prior):
+            self.user_order_counts = prior['order_count'].astype(np.int64)
+            self.user_last_order = prior['last_order_seconds'].astype(np.float64)
+        self.tail = None
+    
+    def build(self, chunk):
+        timestamps = pd.to_datetime(chunk['timestamp'], utc=True)
+        registration = pd.to_datetime(chunk['registration_date'], utc=True)
+        
+        frame = pd.DataFrame({
+            'user_id': chunk['user_id'],
+            'amount': chunk['amount'].astype(np.float64),
+            'num_items': chunk['num_items'].astype(np.float64).clip(lower=1),
+            'timestamp': timestamps,
+            'seconds': (timestamps - pd.Timestamp(0, tz='UTC')).dt.total_seconds(),
+            'user_age_days': (timestamps - registration).dt.days.clip(lower=0)
+        })
+        
+        # History features, continuing the counts from earlier chunks
+        by_user = frame.groupby('user_id', sort=False)
+        user_ids = frame['user_id'].to_numpy()
+        prior_orders = self.user_order_counts.reindex(user_ids, fill_value=0).to_numpy()
+        frame['previous_orders'] = by_user.cumcount().to_numpy() + prior_orders
+        
+        prior_last_order = pd.Series(self.user_last_order.reindex(user_ids).to_numpy(), index=frame.index)
+        previous_seconds = by_user['seconds'].shift(1).fillna(prior_last_order)
+        # No earlier order matches the serving path's COALESCE(..., NOW())
+        frame['time_since_last_order'] = ((frame['seconds'] - previous_seconds) / 3600).fillna(0)
+        
+        self.user_order_counts = self.user_order_counts.add(frame['user_id'].value_counts(), fill_value=0)
+        self.user_last_order = by_user['seconds'].max().combine_first(self.user_last_order)
+        
+        # Velocity features over this chunk plus the previous 24 h
+        frame['payment_key'] = _hash_column(chunk['payment_method'], payment_fingerprint)
+        frame['address_key'] = _hash_column(chunk['shipping_address'], hash_address, parse=json.loads)
+        
+        velocity_columns = ['seconds', 'user_id', 'payment_key', 'address_key', 'amount']
+        window = frame[velocity_columns] if self.tail is None else pd.concat([self.tail, frame[velocity_columns]], ignore_index=True)
+        offset = len(window) - len(frame)
+        
+        seconds = window['seconds'].to_numpy().astype(np.int64)
+        amounts = window['amount'].to_numpy()
+        
+        user_count_1h, _ = _window_stats(window['user_id'], seconds, amounts, 3600)
+        user_count_24h, user_amount_24h = _window_stats(window['user_id'], seconds, amounts, 86400)
+        payment_count_24h, _ = _window_stats(window['payment_key'], seconds, amounts, 86400)
+        address_count_24h, _ = _window_stats(window['address_key'], seconds, amounts, 86400)
+        
+        frame['user_count_1h'] = user_count_1h[offset:]
+        frame['user_count_24h'] = user_count_24h[offset:]
+        frame['user_amount_24h'] = user_amount_24h[offset:]
+        frame['payment_count_24h'] = payment_count_24h[offset:]
+        frame['address_count_24h'] = address_count_24h[offset:]
+        
+        self.tail = window[window['seconds'] > frame['seconds'].max() - 86400].reset_index(drop=True)
+        
+        return frame
+
+def _report(stage, started):
+    """Print wall time and peak resident memory so far"""
+    # ru_maxrss is reported in KB on Linux
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"  {stage}: {time.perf_counter() - started:.1f}s elapsed, peak memory {peak_mb:.0f} MB")
+
+def train_fraud_model():
+    """Train fraud detection model from streamed order history"""
+    print("\nTraining Fraud Detection Model...")
+    started = time.perf_counter()
+    
+    model = FraudDetectionModel()
+    since = _history_start(FRAUD_HISTORY_DAYS)
+    prior = load_prior_order_history(since)
+    print(f"✓ Loaded order history before the window for {len(prior)} users")
+    builder = _FraudFeatureBuilder(prior)
+    feature_chunks = []
+    label_chunks = []
+    n_orders = 0
+    
+    for chunk in stream_order_history(since=since):
+        frame = builder.build(chunk)
+        feature_chunks.append(model.prepare_features(frame))
+        label_chunks.append(chunk['is_fraud'].to_numpy(dtype=np.int8))
+        n_orders += len(chunk)
+        print(f"  Processed {n_orders} orders", end='\r')
+    print()
+    
+    if not feature_chunks:
+        print("✗ No orders found, skipping fraud model")
+        return None
+    
+    features = np.concatenate(feature_chunks)
+    labels = np.concatenate(label_chunks)
+    del feature_chunks, label_chunks
+    
+    print(f"Loaded {len(features)} orders ({int(labels.sum())} labelled fraud), "
+          f"{features.nbytes / 1024 ** 2:.0f} MB feature matrix")
+    _report('features', started)
+    
+    model.train_isolation_forest(features, n_jobs=-1)
+    print("✓ Isolation Forest trained")
+    _report('isolation forest', started)
+    
+    if 0 < labels.sum() < len(labels):
+        model.train_supervised(
+            features, labels,
+            n_jobs=-1,
+            max_samples=min(FRAUD_RF_MAX_SAMPLES, len(features))
+        )
+        print("✓ Random Forest trained")
+        _report('random forest', started)
+    else:
+        print("✗ Need both fraud and legitimate labels, skipping Random Forest")
+    
+    model.compile()
+    model.save_model('models/saved_models/fraud_model.pkl')
+    print("✓ Model saved")
+    _report('total', started)
+    
+    return model
+
+def build_fraud_ring_index():
+    """Rebuild the linked-account index from order history and snapshot it"""
+    print("\nBuilding Fraud Ring Index...")
+    started = time.perf_counter()
+    
+    # Only the final snapshot matters, skip the periodic background ones
+    index = FraudRingIndex(snapshot_interval=float('inf'))
+    
+    for chunk in stream_order_history():
+        timestamps = pd.to_datetime(chunk['timestamp'], utc=True)
+        registration = pd.to_datetime(chunk['registration_date'], utc=True)
+        account_age_days = (timestamps - registration).dt.days.to_numpy()
+        
+        for user_id, address, payment_method, amount, age in zip(
+            chunk['user_id'], chunk['shipping_address'], chunk['payment_method'],
+            chunk['amount'], account_age_days
+        ):
+            address = json.loads(address) if address else None
+            index.add_transaction(user_id, link_keys(address, payment_method), amount, age)
+    
+    # A new build id makes running servers load this instead of overwriting it
+    index.save_snapshot(rebuilt=True)
+    print(f"✓ Indexed {len(index.user_nodes)} users, {len(index.key_owners)} shared identifiers")
+    _report('fraud rings', started)
+    
+    return index
+
+def train_intent_model():
+    """
+    Distill the zero-shot intent classifier into the fast hashed n-gram model
+    Logged search queries are labelled once offline by the zero-shot teacher;
+    queries the keyword rules already answer are labelled by the rules.
+    """
+    print("\nTraining Intent Model...")
+    started = time.perf_counter()
+    
+    queries = [query for query, _ in get_recent_search_queries(INTENT_TRAINING_QUERIES)]
+    print(f"✓ Loaded {len(queries)} distinct search queries")
+    
+    model = IntentModel()
+    labels = [model.match_rules(query) for query in queries]
+    unlabelled = [query for query, label in zip(queries, labels) if label is None]
+    
+    if unlabelled:
+        from transformers import pipeline
+        teacher = pipeline(
+            'zero-shot-classification',
+            model=os.getenv('NLP_ZERO_SHOT_MODEL', 'facebook/bart-large-mnli')
+        )
+        teacher_labels = iter([
+            prediction['labels'][0]
+            for prediction in teacher(unlabelled, INTENT_LABELS, batch_size=32)
+        ])
+        labels = [label if label is not None else next(teacher_labels) for label in labels]
+        print(f"✓ Labelled {len(unlabelled)} queries with the zero-shot teacher")
+    
+    accuracy = model.train(queries, labels)
+    print(f"✓ Training accuracy: {accuracy:.3f}")
+    
+    model.save_model('models/saved_models/intent_model.pkl')
+    print("✓ Intent model saved")
+    _report('intent', started)
+    
+    return model
+
+def build_suggestion_index():
+    """Build the autocomplete index from the catalog and logged searches"""
+    print("\nBuilding Suggestion Index...")
+    started = time.perf_counter()
+    
+    conn = get_db_connection()
+    products = pd.read_sql("""
+        SELECT 
+            p.name,
+            p.brand,
+            c.name as category,
+            COALESCE(p.sold_count, 0) as sold_count,
+            COALESCE(p.views, 0) as views
+        FROM products p
+        LEFT JOIN categories c ON p.category_id = c.id
+        WHERE p.is_active = true
+    """, conn)
+    conn.close()
+    
+    popularity = 1 + products['sold_count'] + products['views'] * SUGGEST_VIEW_WEIGHT
+    weighted_phrases = list(zip(products['name'], popularity))
+    # Brands and categories are as popular as all their products together
+    for column in ('brand', 'category'):
+        totals = popularity.groupby(products[column]).sum()
+        weighted_phrases.extend(zip(totals.index, totals.values))
+    
+    try:
+        queries = get_recent_search_queries(limit=50000, days=30)
+        weighted_phrases.extend((query, count * SUGGEST_QUERY_WEIGHT) for query, count in queries)
+        print(f"✓ Loaded {len(queries)} logged search queries")
+    except Exception as e:
+        print(f"✗ Could not load search queries, using catalog only: {e}")
+    
+    index = SuggestionIndex()
+    index.build(weighted_phrases)
+    # A new build id makes running servers load this instead of overwriting it
+    index.save_snapshot(rebuilt=True)
+    print(f"✓ Indexed {len(index.phrases)} phrases, {len(index.top)} precomputed prefixes")
+    _report('suggestions', started)
+    
+    return index
+
 def evaluate_models(cf_model, cb_model):
     """Evaluate model performance"""
     print("\nEvaluating Models...")
@@ -135,13 +510,29 @@ if __name__ == '__main__':
     print("AI Model Training Script")
     print("=" * 60)
     
+    # Optional stage names: python train.py [recommendations] [fraud] [rings] [intent] [suggestions]
+    stages = sys.argv[1:] or ['recommendations', 'fraud', 'rings', 'intent', 'suggestions']
+    
     try:
-        # Train models
-        cf_model = train_collaborative_filtering()
-        cb_model = train_content_based()
+        if 'recommendations' in stages:
+            # Train models
+            cf_model = train_collaborative_filtering()
+            cb_model = train_content_based()
+            
+            # Evaluate
+            evaluate_models(cf_model, cb_model)
+        
+        if 'fraud' in stages:
+            train_fraud_model()
+        
+        if 'rings' in stages:
+            build_fraud_ring_index()
+        
+        if 'intent' in stages:
+            train_intent_model()
         
-        # Evaluate
-        evaluate_models(cf_model, cb_model)
+        if 'suggestions' in stages:
+            build_suggestion_index()
         
         print("\n" + "=" * 60)
         print("Training completed successfully!")
@@ -0,0 +1,156 @@
+from datetime import datetime, timezone
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import uuid
+
+# Address fields that identify the recipient rather than the place
+RECIPIENT_FIELDS = {'name', 'phone', 'email'}
+
+# Method labels shared by every customer; they don't identify an instrument
+GENERIC_PAYMENT_METHODS = {'razorpay', 'cod', 'card', 'upi', 'netbanking', 'wallet', 'emi'}
+
+def _stable_hash(value):
+    """Short, stable hash for identifiers we don't want to keep in clear text"""
+    return hashlib.sha1(value.encode('utf-8')).hexdigest()[:20]
+
+def hash_address(address):
+    """
+    Hash a shipping address so equivalent addresses share a key
+    Accepts a string or a dict of address fields; case, whitespace and
+    recipient fields (name, phone, email) are ignored
+    """
+    if not address:
+        return None
+
+    if isinstance(address, dict):
+        parts = [
+            str(address[key]) for key in sorted(address)
+            if address[key] and key not in RECIPIENT_FIELDS
+        ]
+        address = ' '.join(parts)
+
+    normalized = ' '.join(str(address).lower().replace(',', ' ').split())
+    return _stable_hash(normalized) if normalized else None
+
+def payment_fingerprint(payment_method):
+    """
+    Hash a payment method into a fingerprint
+    Accepts a string or a dict of identifying fields (e.g. network, last4, vpa)
+    Bare method labels such as 'razorpay' or 'cod' return None
+    """
+    if not payment_method:
+        return None
+
+    if isinstance(payment_method, dict):
+        payment_method = json.dumps(payment_method, sort_keys=True, default=str)
+
+    normalized = str(payment_method).strip().lower()
+    if not normalized or normalized in GENERIC_PAYMENT_METHODS:
+        return None
+    return _stable_hash(normalized)
+
+def atomic_write(filepath, data):
+    """
+    Write bytes to filepath via a unique temp file in the same directory and
+    os.replace, so readers and concurrent writers never see a partial file
+    """
+    directory = os.path.dirname(filepath) or '.'
+    os.makedirs(directory, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(filepath) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def try_lock_file(path):
+    """
+    Take an exclusive lock on path without waiting, held while the returned
+    file stays open (normally until the process exits); None if another
+    process holds it
+    """
+    import fcntl
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    f = open(path, 'a')
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+def new_build_id():
+    """Id for a freshly rebuilt snapshot, e.g. by train.py"""
+    return f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+def write_snapshot(filepath, build_id, state, replace_other_builds=True):
+    """
+    Pickle state behind a small header carrying its build id, atomically
+    With replace_other_builds=False the file is only written if it is
+    missing or still holds the same build, so a periodic save can't clobber
+    an index rebuilt offline; returns whether it was written. Writers take
+    <filepath>.write.lock, so that check and the write don't interleave.
+    """
+    import fcntl
+
+    data = (
+        pickle.dumps({'snapshot_build': build_id}, protocol=pickle.HIGHEST_PROTOCOL)
+        + pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+    )
+
+    os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+    with open(f'{filepath}.write.lock', 'a') as lock:
+        fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        if not replace_other_builds:
+            try:
+                if read_snapshot_build(filepath) != build_id:
+                    return False
+            except FileNotFoundError:
+                pass
+        atomic_write(filepath, data)
+    return True
+
+def read_snapshot_build(filepath):
+    """Build id of a snapshot without loading the rest of it"""
+    with open(filepath, 'rb') as f:
+        header = pickle.load(f)
+    # Snapshots from before build ids are a single state dict, without one
+    return header.get('snapshot_build')
+
+def read_snapshot(filepath):
+    """(build id, state) of a snapshot written by write_snapshot"""
+    with open(filepath, 'rb') as f:
+        header = pickle.load(f)
+        if 'snapshot_build' not in header:
+            return None, header
+        return header['snapshot_build'], pickle.load(f)
+
+def utc_now():
+    """Current time as a naive UTC datetime, the convention for every fraud timestamp"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def to_utc(value):
+    """
+    Normalize a timestamp to a naive UTC datetime
+    Accepts a datetime or an ISO string (including Node's trailing 'Z');
+    aware values are converted to UTC, naive ones are taken as UTC already
+    """
+    if value is None or value == '':
+        return None
+
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
@@ -0,0 +1,99 @@
+from concurrent.futures import Future
+import queue
+import threading
+import time
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-item calls into batched calls
+
+    submit() queues an item and returns a Future. A background thread takes
+    the first waiting item, keeps collecting until `max_batch` items are
+    queued or `max_wait_ms` has passed since that first item, then runs
+    `process_batch(items)` once and resolves every caller's future with its
+    own result. process_batch must return one result per item, in order.
+    """
+
+    def __init__(self, process_batch, max_batch=32, max_wait_ms=5, name='batcher'):
+        self.process_batch = process_batch
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self.name = name
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.max_batch_seen = 0
+        self.total_queue_ms = 0.0
+        self.max_queue_ms = 0.0
+
+    def submit(self, item):
+        """Queue one item; the returned Future resolves to its result"""
+        self._ensure_thread()
+        future = Future()
+        self._queue.put((item, future, time.monotonic()))
+        return future
+
+    def stats(self):
+        """Batch sizes and time items spent queued before their batch ran"""
+        with self._stats_lock:
+            return {
+                'batches': self.batches,
+                'items': self.items,
+                'avg_batch_size': round(self.items / self.batches, 2) if self.batches else 0.0,
+                'max_batch_size': self.max_batch_seen,
+                'avg_queue_ms': round(self.total_queue_ms / self.items, 3) if self.items else 0.0,
+                'max_queue_ms': round(self.max_queue_ms, 3),
+                'queued': self._queue.qsize()
+            }
+
+    def _ensure_thread(self):
+        # Started on first use rather than in __init__, so a process that
+        # forks after creating the batcher still gets a live worker thread
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = batch[0][2] + self.max_wait_ms / 1000
+
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                try:
+                    if timeout > 0:
+                        batch.append(self._queue.get(timeout=timeout))
+                    else:
+                        batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            self._process(batch)
+
+    def _process(self, batch):
+        started = time.monotonic()
+        queue_ms = [(started - queued_at) * 1000 for _, _, queued_at in batch]
+
+        try:
+            results = self.process_batch([item for item, _, _ in batch])
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+        with self._stats_lock:
+            self.batches += 1
+            self.items += len(batch)
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+            self.total_queue_ms += sum(queue_ms)
+            self.max_queue_ms = max(self.max_queue_ms, max(queue_ms))
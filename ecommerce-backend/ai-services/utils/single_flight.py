@@ -0,0 +1,130 @@
+from concurrent.futures import Future
+import json
+import threading
+import time
+import uuid
+
+class SingleFlightError(RuntimeError):
+    """Raised in a waiting worker when another worker's call for the key failed"""
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls for the same key
+
+    do(key, fn) runs fn for the first caller of a key; callers arriving
+    while it runs wait for that call and get its result, or its exception.
+    Only in-flight calls are shared; the next call after it finishes runs
+    fn again, so results are not cached here.
+
+    With a Redis client the same holds across worker processes: the leader
+    takes a lock key, publishes its outcome under a short-lived result key,
+    and other workers poll for it. Results must be JSON-serializable, and
+    errors reach other workers as SingleFlightError with the message only.
+    If a leader dies holding the lock, waiters take over once it expires.
+    """
+
+    KEY_PREFIX = 'single_flight:'
+
+    def __init__(self, redis_client=None, lock_ttl_ms=60000, result_ttl_ms=10000, poll_ms=50):
+        self.redis = redis_client
+        self.lock_ttl_ms = lock_ttl_ms
+        self.result_ttl_ms = result_ttl_ms
+        self.poll_ms = poll_ms
+
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.stats = {'calls': 0, 'shared': 0, 'shared_remote': 0}
+
+    def do(self, key, fn, *args, **kwargs):
+        """Return fn(*args, **kwargs), sharing one call among concurrent callers of key"""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+                self.stats['calls'] += 1
+            else:
+                self.stats['shared'] += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            if self.redis is not None:
+                result = self._do_remote(key, fn, args, kwargs)
+            else:
+                result = fn(*args, **kwargs)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def _do_remote(self, key, fn, args, kwargs):
+        lock_key = f'{self.KEY_PREFIX}lock:{key}'
+        result_key = f'{self.KEY_PREFIX}result:{key}'
+        token = uuid.uuid4().hex
+
+        while True:
+            try:
+                acquired = self.redis.set(lock_key, token, nx=True, px=self.lock_ttl_ms)
+            except Exception as e:
+                # Redis trouble shouldn't block generation; dedupe in-process only
+                print(f"Error taking single-flight lock: {e}")
+                return fn(*args, **kwargs)
+
+            if acquired:
+                return self._lead(lock_key, result_key, token, fn, args, kwargs)
+
+            outcome = self._wait_remote(lock_key, result_key)
+            if outcome is not None:
+                with self._lock:
+                    self.stats['shared_remote'] += 1
+                if 'error' in outcome:
+                    raise SingleFlightError(outcome['error'])
+                return outcome['value']
+            # Lock expired without a result (leader died); try to lead
+
+    def _lead(self, lock_key, result_key, token, fn, args, kwargs):
+        try:
+            # Drop an outcome left by an earlier flight so waiters only see ours
+            self.redis.delete(result_key)
+        except Exception as e:
+            print(f"Error clearing single-flight result: {e}")
+
+        outcome = None
+        try:
+            value = fn(*args, **kwargs)
+            outcome = {'value': value}
+            return value
+        except Exception as e:
+            outcome = {'error': str(e)}
+            raise
+        finally:
+            try:
+                if outcome is not None:
+                    self.redis.set(result_key, json.dumps(outcome), px=self.result_ttl_ms)
+                # Only release the lock if it is still ours
+                if self.redis.get(lock_key) == token:
+                    self.redis.delete(lock_key)
+            except Exception as e:
+                print(f"Error publishing single-flight result: {e}")
+
+    def _wait_remote(self, lock_key, result_key):
+        """Poll until the leader publishes (returns its outcome) or the lock goes away (None)"""
+        while True:
+            time.sleep(self.poll_ms / 1000)
+            try:
+                raw = self.redis.get(result_key)
+                if raw is not None:
+                    return json.loads(raw)
+                if not self.redis.exists(lock_key):
+                    raw = self.redis.get(result_key)
+                    return json.loads(raw) if raw is not None else None
+            except Exception as e:
+                print(f"Error waiting on single-flight result: {e}")
+                return None